@@ -0,0 +1,327 @@
+'''Benchmarks for pathfinding, map queries, agent movement and model steps.'''
+import copy
+import dataclasses
+import itertools
+import random
+import typing
+
+import numpy as np
+
+from benchmark import benchmark, MAP_RADII, AGENT_COUNTS
+
+from mase.hexmap import HexMap, HexPos, NoPathFound, Connectivity, Passable, TerrainCost, MaxOccupancy
+from mase.hexmap.hexmapgenerator import random_pathfind_positions
+from mase.agent import Agent, AgentSet, AgentState
+from mase.agentstatepool import AgentStatePool
+from mase.agentregistry import AgentRegistry
+from mase.location import LocationState
+from mase.backends import make_map
+from mase.profiling import profiler
+
+
+@dataclasses.dataclass
+class WallState(LocationState):
+    blocked: bool = False
+
+
+@dataclasses.dataclass
+class FoodState(LocationState):
+    food: int = 1
+
+
+@dataclasses.dataclass
+class TerrainState(LocationState):
+    blocked: bool = False
+    cost: float = 1.0
+
+
+@dataclasses.dataclass
+class WalkerState(AgentState):
+    energy: float = 1.5
+
+
+def make_agents(hmap: HexMap, num_agents: int, seed: int = 0) -> typing.List[Agent]:
+    '''Add agents at random positions on the map.'''
+    rng = random.Random(seed)
+    positions = hmap.index.positions()
+    agents = list()
+    for i in range(num_agents):
+        agent = Agent(i, None)
+        agent.set_map(hmap)
+        hmap.add_agent(agent, rng.choice(positions))
+        agents.append(agent)
+    return agents
+
+
+############################# Pathfinding #############################
+
+@benchmark('a_star', radius=MAP_RADII, max_radius=100)
+def bench_a_star(radius: int):
+    start, end, avoidset = random_pathfind_positions(radius, seed=0)
+    allowed = HexMap(radius).positions() - avoidset
+    def run():
+        try:
+            start.a_star(end, allowed_pos=allowed)
+        except NoPathFound:
+            pass
+    return run
+
+@benchmark('a_star_unreachable', radius=MAP_RADII, use_connectivity=[False, True], max_radius=100)
+def bench_a_star_unreachable(radius: int, use_connectivity: bool):
+    hmap = HexMap(radius, WallState())
+    for pos in HexPos(0, 0, 0).ring(radius // 2):
+        hmap.loc(pos).state.blocked = True
+    allowed = {pos for pos in hmap.positions() if not hmap.loc(pos).state.blocked}
+    connectivity = Connectivity(hmap) if use_connectivity else None
+    start, end = HexPos(0, 0, 0), HexPos(radius, 0, -radius)
+    def run():
+        try:
+            start.a_star(end, allowed_pos=allowed, connectivity=connectivity)
+        except NoPathFound:
+            pass
+    return run
+
+@benchmark('pathfind_dfs', radius=MAP_RADII)
+def bench_pathfind_dfs(radius: int):
+    start, end, avoidset = random_pathfind_positions(radius, seed=0)
+    useset = HexMap(radius).positions() - avoidset
+    return lambda: start.pathfind_dfs(end, useset)
+
+@benchmark('pathfind_dfs_avoid', radius=MAP_RADII)
+def bench_pathfind_dfs_avoid(radius: int):
+    start, end, avoidset = random_pathfind_positions(radius, seed=0)
+    return lambda: start.pathfind_dfs_avoid(end, avoidset)
+
+@benchmark('shortest_path_length', radius=MAP_RADII)
+def bench_shortest_path_length(radius: int):
+    start, end, avoidset = random_pathfind_positions(radius, seed=0)
+    return lambda: start.shortest_path_length(end, avoidset)
+
+@benchmark('map_shortest_path_length', radius=MAP_RADII)
+def bench_map_shortest_path_length(radius: int):
+    '''A short query (target three steps away) on a map with a blocked
+        layer, which should not cost proportional to the map.
+    '''
+    hmap = HexMap(radius, WallState())
+    rng = random.Random(0)
+    for pos in hmap.index.positions():
+        hmap.set_state(pos, 'blocked', rng.random() < 0.2)
+    src, target = HexPos(0, 0, 0), HexPos(3, -1, -2)
+    hmap.set_state(src, 'blocked', False)
+    hmap.set_state(target, 'blocked', False)
+    # the first query builds the cached mask and the neighbor table
+    query = lambda: hmap.shortest_path_length(src, target, blocked='blocked')
+    query()
+    return query
+
+@benchmark('distance_field', radius=MAP_RADII)
+def bench_distance_field(radius: int):
+    hmap = HexMap(radius)
+    return lambda: hmap.distances([HexPos(0, 0, 0)])
+
+
+############################# Map Queries #############################
+
+@benchmark('region', radius=MAP_RADII, dist=[1, 5, 20])
+def bench_region(radius: int, dist: int):
+    hmap = HexMap(radius)
+    center = HexPos(0, 0, 0)
+    return lambda: hmap.region(center, dist)
+
+@benchmark('nearest_empty', radius=MAP_RADII, num_agents=[10**3], lazy=[False, True])
+def bench_nearest_empty(radius: int, num_agents: int, lazy: bool):
+    '''Find the nearest empty cell to an agent.'''
+    hmap = HexMap(radius)
+    agents = make_agents(hmap, num_agents)
+    is_empty = lambda loc: not len(loc.agents)
+    if lazy:
+        return lambda: agents[0].nearest_locations(is_empty, limit=1)
+    def run():
+        pos = agents[0].pos
+        return [loc for loc in sorted(hmap.locations(), key=lambda loc: pos.dist(loc.pos)) if is_empty(loc)][:1]
+    return run
+
+@benchmark('state_query', radius=MAP_RADII, indexed=[False, True])
+def bench_state_query(radius: int, indexed: bool):
+    '''Change the food in 100 random cells, then find all cells with food,
+        which is about 1% of the map.
+    '''
+    hmap = HexMap(radius, FoodState(food=0))
+    if indexed:
+        hmap.add_state_index('food', 'sorted')
+    positions = hmap.index.positions()
+    rng = random.Random(0)
+    for pos in rng.sample(positions, len(positions) // 100):
+        hmap.set_state(pos, 'food', 1)
+    def run():
+        for pos in rng.sample(positions, 100):
+            hmap.set_state(pos, 'food', rng.random() < 0.01)
+        return hmap.where_range('food', 0, lo_inclusive=False)
+    return run
+
+@benchmark('field_diffuse', radius=MAP_RADII)
+def bench_field_diffuse(radius: int):
+    field = HexMap(radius).add_field('scent', fill=1.0)
+    def run():
+        field.diffuse(0.3)
+        field.decay(0.01)
+    return run
+
+@benchmark('neighborhood_sum', radius=MAP_RADII, k=[1, 5, 20])
+def bench_neighborhood_sum(radius: int, k: int):
+    hmap = HexMap(radius)
+    hmap.add_field('scent', fill=1.0)
+    return lambda: hmap.neighborhood('scent', k)
+
+@benchmark('hexmap_construction', radius=MAP_RADII)
+def bench_hexmap_construction(radius: int):
+    return lambda: HexMap(radius)
+
+@benchmark('hexnetmap_construction', radius=MAP_RADII, max_radius=100)
+def bench_hexnetmap_construction(radius: int):
+    from mase.hexnetmap.hexnetmap import HexNetMap
+    return lambda: HexNetMap(radius)
+
+@benchmark('hexnetmap_weighted_path', radius=MAP_RADII, max_radius=100)
+def bench_hexnetmap_weighted_path(radius: int):
+    from mase.hexnetmap.hexnetmap import HexNetMap
+    netmap = HexNetMap(radius)
+    netmap.set_cell_costs(np.random.default_rng(0).uniform(1, 5, len(netmap)))
+    start, end = HexPos(-radius, 0, radius), HexPos(radius, 0, -radius)
+    def run():
+        # toggling a cell changes the weights without rebuilding the graph
+        netmap.set_blocked(HexPos(0, 0, 0), not netmap.blocked[netmap.index.index(HexPos(0, 0, 0))])
+        return netmap.shortest_path(start, end)
+    return run
+
+
+############################# Agents #############################
+
+@benchmark('move_agent', radius=MAP_RADII, num_agents=AGENT_COUNTS)
+def bench_move_agent(radius: int, num_agents: int):
+    hmap = HexMap(radius)
+    agents = make_agents(hmap, num_agents)
+    positions = hmap.index.positions()
+    rng = random.Random(0)
+    targets = [rng.choice(positions) for _ in agents]
+    def run():
+        for agent, pos in zip(agents, targets):
+            hmap.move_agent(agent, pos)
+    return run
+
+@benchmark('agent_churn', num_agents=AGENT_COUNTS, registry=['statepool', 'slots'])
+def bench_agent_churn(num_agents: int, registry: str):
+    '''One tick in which a tenth of the population, chosen at random, dies
+        and as many are born. The registry picks victims from its dense id
+        array and applies the batch with array operations; the dict-backed
+        pool has to list its keys to pick them and removes them one by one.
+    '''
+    rng = random.Random(0)
+    if registry == 'statepool':
+        pool = AgentStatePool()
+        next_id = itertools.count()
+        for _ in range(num_agents):
+            pool.add_agent(next(next_id), None)
+        def run():
+            for aid in rng.sample(list(pool.keys()), num_agents // 10):
+                pool.remove_agent(aid)
+            for _ in range(num_agents // 10):
+                pool.add_agent(next(next_id), None)
+    else:
+        reg = AgentRegistry()
+        reg.add_agents(None for _ in range(num_agents))
+        np_rng = np.random.default_rng(0)
+        def run():
+            reg.schedule_deaths(reg.sample(num_agents // 10, np_rng))
+            reg.schedule_births([None] * (num_agents // 10))
+            reg.end_tick()
+    return run
+
+@benchmark('nearest_agents', radius=MAP_RADII, num_agents=AGENT_COUNTS)
+def bench_nearest_agents(radius: int, num_agents: int):
+    hmap = HexMap(radius)
+    agents = make_agents(hmap, num_agents)
+    return lambda: agents[0].nearest_agents()
+
+@benchmark('model_step', radius=MAP_RADII, num_agents=AGENT_COUNTS, profile=[False, True])
+def bench_model_step(radius: int, num_agents: int, profile: bool):
+    '''One tick of a random-walk model: every agent, in random order, moves to
+        a random neighboring cell on the map. With profile, the profiler is
+        enabled with every tenth agent step sampled, and the tick ends with
+        a profiler record.
+    '''
+    hmap = HexMap(radius)
+    agents = AgentSet(make_agents(hmap, num_agents))
+    rng = random.Random(0)
+    def step(agent: Agent):
+        options = [pos for pos in agent.pos.neighbors() if pos in hmap.pos_loc]
+        hmap.move_agent(agent, rng.choice(options))
+    def run():
+        if profile:
+            profiler.enable(sample_every=10)
+        try:
+            profiler.run_agents(agents.random_activation(), step)
+            profiler.end_tick()
+        finally:
+            profiler.disable()
+            profiler.reset()
+    return run
+
+@benchmark('rollout', radius=MAP_RADII, method=['deepcopy', 'fork'], max_radius=100)
+def bench_rollout(radius: int, method: str):
+    '''One lookahead rollout from a model with 1000 agents: copy the map and
+        agent pool, move ten agents five steps while eating the food where
+        they land, then throw the copy away.
+    '''
+    hmap = HexMap(radius, FoodState())
+    agents = make_agents(hmap, 1000)
+    pool = AgentStatePool({agent.id: FoodState() for agent in agents})
+    rng = random.Random(0)
+    def run():
+        if method == 'deepcopy':
+            sim_map, sim_pool = copy.deepcopy((hmap, pool))
+            movers = [agent for agent in sim_map.agents() if agent.id < 10]
+        else:
+            sim_map, sim_pool = hmap.fork(), pool.fork()
+            movers = agents[:10]
+        for _ in range(5):
+            for agent in movers:
+                options = [pos for pos in sim_map.agent_pos(agent).neighbors() if pos in sim_map.index]
+                sim_map.move_agent(agent, rng.choice(options))
+                loc = sim_map.agent_loc(agent)
+                sim_pool.get_agent(agent.id).food += loc.state.food
+                loc.state.food = 0
+    return run
+
+@benchmark('legal_moves', num_agents=AGENT_COUNTS, backend=['dict', 'array'], method=['loop', 'vectorized'])
+def bench_legal_moves(num_agents: int, backend: str, method: str):
+    '''Find the legal moves (stay or one of six neighbors) of every agent on
+        a radius 200 map under passability, terrain cost and an occupancy
+        limit of 2.
+    '''
+    hmap = make_map(backend, 200, TerrainState())
+    rng = random.Random(0)
+    for pos in hmap.index.positions():
+        hmap.set_state(pos, 'blocked', rng.random() < 0.2)
+        hmap.set_state(pos, 'cost', rng.choice([0.5, 1.0, 2.0]))
+    agents = make_agents(hmap, num_agents)
+    for agent in agents:
+        agent.state = WalkerState()
+    rules = hmap.set_movement_rules([Passable(), TerrainCost('cost', 'energy'), MaxOccupancy(2)])
+    if method == 'vectorized':
+        return lambda: rules.legal_moves(agents)
+
+    def run():
+        legal = list()
+        for agent in agents:
+            pos = hmap.agent_pos(agent)
+            options = [pos]
+            for nb in pos.neighbors():
+                if nb not in hmap.index:
+                    continue
+                loc = hmap.loc(nb)
+                if not loc.state.blocked and loc.state.cost <= agent.state.energy and loc.num_agents < 2:
+                    options.append(nb)
+            legal.append(options)
+        return legal
+    return run
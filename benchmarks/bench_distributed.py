@@ -0,0 +1,75 @@
+'''Benchmarks for distributed simulation with several workers on localhost.
+
+Each case runs a foraging model (diffusing food that agents walk around and
+eat) and reports the median tick time at the barrier. The setup also runs
+the model twice and records whether both runs gave identical results, and
+whether they match a run with one worker.
+'''
+import typing
+
+import numpy as np
+
+from benchmark import benchmark, MAP_RADII
+
+from mase.distributed import RegionModel, Region, DistributedResult, run_local
+
+
+class ForagerRegion(RegionModel):
+    '''Food diffuses and regrows; agents eat half of the food on their cell,
+        shared between them, and step to a random neighbor (or stay). Agents
+        are all on owned cells when they eat, and random numbers are keyed
+        by agent id and cell, so results do not depend on the number of workers.
+    '''
+    agent_dtype = np.dtype([('id', np.int64), ('cell', np.int64), ('energy', np.float64)])
+    halo_layers = ('food',)
+
+    def __init__(self, region: Region, params: typing.Dict[str, typing.Any], seed: int):
+        super().__init__(region, params, seed)
+        self.add_layer('food', 1.0)
+        self.degree = (region.neighbors >= 0).sum(axis=1)
+
+        # agent ids are the cells they start on, so they are unique across regions
+        cells = region.cells[self.random(-1, region.cells) < params['density']]
+        self.agents = np.zeros(len(cells), dtype=self.agent_dtype)
+        self.agents['id'] = self.agents['cell'] = cells
+
+    def step(self, tick: int):
+        region = self.region
+        food, neighbors, owned = self.layers['food'], region.neighbors, region.owned
+
+        sent = np.append(food, 0.0) * (self.params['diffusion'] / 6)
+        sent[-1] = 0.0
+        food[owned] += sent[neighbors[owned]].sum(axis=1) - self.degree[owned] * sent[:-1][owned]
+        food[owned] += self.params['regrowth'] * (1.0 - food[owned])
+
+        agents = self.agents
+        local = region.local(agents['cell'])
+        counts = np.bincount(local, minlength=region.window_size)
+        agents['energy'] += food[local] / 2 / counts[local]
+        food[np.unique(local)] /= 2
+
+        options = np.concatenate([local[:, None], neighbors[local]], axis=1)
+        choice = (self.random(tick, agents['id']) * 7).astype(np.int64)
+        dest = options[np.arange(len(agents)), choice]
+        agents['cell'] = np.where(dest >= 0, dest, local) + region.win_lo
+
+    def get_info(self) -> typing.Dict[str, typing.Any]:
+        return {'agents': len(self.agents), 'energy': float(self.agents['energy'].sum()),
+            'food': float(self.layers['food'][self.region.owned].sum())}
+
+
+PARAMS = {'density': 0.05, 'diffusion': 0.1, 'regrowth': 0.01}
+
+def same_result(a: DistributedResult, b: DistributedResult) -> bool:
+    return (np.array_equal(a.agents, b.agents)
+        and all(np.array_equal(a.layers[name], b.layers[name]) for name in a.layers))
+
+
+@benchmark('distributed_foragers', radius=MAP_RADII, workers=[1, 2, 4], max_radius=100)
+def bench_distributed_foragers(radius: int, workers: int):
+    run = lambda: run_local(ForagerRegion, radius, workers, num_ticks=20, params=PARAMS, seed=0)
+    first, second = run(), run()
+    single = run_local(ForagerRegion, radius, 1, num_ticks=20, params=PARAMS, seed=0)
+    info = {'tick_ms': float(np.median(first.tick_seconds)) * 1e3, 'deterministic': float(same_result(first, second)),
+        'matches_single_worker': float(same_result(first, single))}
+    return run, info
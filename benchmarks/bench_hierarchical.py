@@ -0,0 +1,63 @@
+'''Benchmarks for hierarchical pathfinding, with suboptimality measured against HexPos.a_star.'''
+import dataclasses
+import random
+import statistics
+
+from benchmark import benchmark, MAP_RADII
+
+from mase.hexmap import ArrayHexMap, HierarchicalPathfinder, NoPathFound
+from mase.hexmap.hexmapgenerator import MapGenerator, PercolationLayer
+from mase.location import LocationState
+
+# a_star is only run on maps up to this radius to measure path quality
+A_STAR_MAX_RADIUS = 100
+NUM_PAIRS = 10
+
+
+@dataclasses.dataclass
+class BlockedState(LocationState):
+    blocked: bool = False
+
+
+def make_map(radius: int) -> ArrayHexMap:
+    hmap = ArrayHexMap(radius, BlockedState())
+    MapGenerator(radius, (PercolationLayer(p=0.3, smoothing=2),), seed=0).apply(hmap)
+    return hmap
+
+def random_pairs(hmap: ArrayHexMap, num_pairs: int, seed: int = 0):
+    rng = random.Random(seed)
+    open_inds = [i for i, b in enumerate(hmap.get_layer('blocked').tolist()) if not b]
+    return [(hmap.index.pos(a), hmap.index.pos(b)) for a, b in (rng.sample(open_inds, 2) for _ in range(num_pairs))]
+
+
+@benchmark('hpa_build', radius=MAP_RADII, cluster_size=[8, 16])
+def bench_hpa_build(radius: int, cluster_size: int):
+    hmap = make_map(radius)
+    return lambda: HierarchicalPathfinder(hmap, cluster_size=cluster_size)
+
+@benchmark('hpa_find_path', radius=MAP_RADII, cluster_size=[8, 16])
+def bench_hpa_find_path(radius: int, cluster_size: int):
+    hmap = make_map(radius)
+    pathfinder = HierarchicalPathfinder(hmap, cluster_size=cluster_size)
+    pairs = random_pairs(hmap, NUM_PAIRS)
+
+    def run():
+        for start, goal in pairs:
+            try:
+                pathfinder.find_path(start, goal)
+            except NoPathFound:
+                pass
+
+    info = dict()
+    if radius <= A_STAR_MAX_RADIUS:
+        allowed = {pos for pos in hmap.index if not hmap[pos].state.blocked}
+        ratios = list()
+        for start, goal in pairs:
+            try:
+                optimal = len(start.a_star(goal, allowed_pos=allowed))
+            except NoPathFound:
+                continue
+            ratios.append(len(pathfinder.find_path(start, goal)) / optimal)
+        if ratios:
+            info = {'mean_suboptimality': statistics.fmean(ratios), 'max_suboptimality': max(ratios)}
+    return run, info
@@ -0,0 +1,60 @@
+'''Micro-benchmarks comparing plain and interned HexPos in pathfinding-heavy code.
+
+Each case also reports, for a single call, the peak memory allocated
+(tracemalloc) and the number of generation-0 garbage collections.
+'''
+import gc
+import tracemalloc
+import typing
+
+from benchmark import benchmark, MAP_RADII
+
+from mase.hexmap import HexMap, HexPos, NoPathFound
+from mase.hexmap.hexmapgenerator import random_pathfind_positions
+
+
+def allocation_info(func: typing.Callable[[], typing.Any]) -> typing.Dict[str, float]:
+    '''Measure peak allocations and gen-0 collections for one call.'''
+    func()
+    gen0 = gc.get_stats()[0]['collections']
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'peak_kib': peak / 1024, 'gen0_collections': gc.get_stats()[0]['collections'] - gen0}
+
+def endpoints(hmap: HexMap, interned: bool) -> typing.Tuple[HexPos, HexPos, typing.Set[HexPos]]:
+    start, end, avoidset = random_pathfind_positions(hmap.radius, seed=0)
+    if interned:
+        start, end = hmap.index.intern(start), hmap.index.intern(end)
+        avoidset = {hmap.index.intern(pos) for pos in avoidset}
+    return start, end, avoidset
+
+
+@benchmark('interning_a_star', radius=MAP_RADII, interned=[False, True], max_radius=100)
+def bench_interning_a_star(radius: int, interned: bool):
+    hmap = HexMap(radius)
+    start, end, avoidset = endpoints(hmap, interned)
+    allowed = hmap.positions() - avoidset
+    def run():
+        try:
+            start.a_star(end, allowed_pos=allowed)
+        except NoPathFound:
+            pass
+    return run, allocation_info(run)
+
+@benchmark('interning_pathfind_dfs_avoid', radius=MAP_RADII, interned=[False, True])
+def bench_interning_pathfind_dfs_avoid(radius: int, interned: bool):
+    hmap = HexMap(radius)
+    start, end, avoidset = endpoints(hmap, interned)
+    run = lambda: start.pathfind_dfs_avoid(end, avoidset)
+    return run, allocation_info(run)
+
+@benchmark('interning_region', radius=MAP_RADII, interned=[False, True], dist=[5, 20])
+def bench_interning_region(radius: int, interned: bool, dist: int):
+    hmap = HexMap(radius)
+    center = hmap.index.intern(HexPos(0, 0, 0)) if interned else HexPos(0, 0, 0)
+    run = lambda: center.region(dist)
+    return run, allocation_info(run)
@@ -0,0 +1,55 @@
+'''Memory benchmarks for the per-cell and per-agent overhead of the maps.
+
+Each case times building a map and reports, from tracemalloc, the bytes
+allocated per cell by construction and per agent by adding agents at random
+cells (agent objects are created beforehand and are not counted). Memory
+allocated inside igraph itself is not traced, so HexNetMap numbers only
+cover the Python side.
+'''
+import dataclasses
+import random
+import tracemalloc
+import typing
+
+from benchmark import benchmark, MAP_RADII
+
+from mase.agent import Agent
+from mase.hexmap import HexMap
+from mase.hexnetmap.hexnetmap import HexNetMap
+from mase.location import LocationState
+
+
+@dataclasses.dataclass
+class ResourceState(LocationState):
+    food: float = 0.0
+    blocked: bool = False
+
+
+def traced_bytes(func: typing.Callable[[], typing.Any]) -> typing.Tuple[typing.Any, int]:
+    '''Call func and get its result and the bytes it left allocated.'''
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        result = func()
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, after - before
+
+def memory_info(make_map: typing.Callable[[], typing.Any], num_agents: int) -> typing.Dict[str, float]:
+    hmap, map_bytes = traced_bytes(make_map)
+    rng = random.Random(0)
+    positions = hmap.index.positions()
+    agents = [Agent(i, None) for i in range(num_agents)]
+    def add_agents():
+        for agent in agents:
+            hmap.add_agent(agent, rng.choice(positions))
+    _, agent_bytes = traced_bytes(add_agents)
+    return {'bytes_per_cell': map_bytes / len(hmap.index), 'bytes_per_agent': agent_bytes / num_agents}
+
+
+@benchmark('memory_map', radius=MAP_RADII, backend=['dict', 'igraph'], compact=[False, True], max_radius=100)
+def bench_memory_map(radius: int, backend: str, compact: bool):
+    map_type = HexMap if backend == 'dict' else HexNetMap
+    make_map = lambda: map_type(radius, ResourceState(), compact=compact)
+    return make_map, memory_info(make_map, num_agents=1000)
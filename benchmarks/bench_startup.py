@@ -0,0 +1,63 @@
+'''Benchmarks for startup costs: cold imports and worker process spawns.
+
+Each case runs in a fresh interpreter so that nothing is already imported.
+'''
+import multiprocessing
+import os
+import subprocess
+import sys
+
+from benchmark import benchmark
+
+SRC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+BACKENDS = [None, 'dict', 'array', 'igraph']
+
+
+def startup_env(lazy: bool) -> dict:
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([SRC_PATH, env.get('PYTHONPATH', '')])
+    env['MASE_LAZY_IMPORTS'] = '1' if lazy else '0'
+    return env
+
+def startup_code(backend: str) -> str:
+    code = 'import mase'
+    if backend is not None:
+        code += f'; mase.make_map({backend!r}, 1)'
+    return code
+
+
+@benchmark('cold_import', lazy=[False, True], backend=BACKENDS)
+def bench_cold_import(lazy: bool, backend: str):
+    cmd, env = [sys.executable, '-c', startup_code(backend)], startup_env(lazy)
+    return lambda: subprocess.run(cmd, env=env, check=True)
+
+@benchmark('interpreter_baseline')
+def bench_interpreter_baseline():
+    cmd = [sys.executable, '-c', 'pass']
+    return lambda: subprocess.run(cmd, check=True)
+
+
+def _spawn_worker(code: str):
+    exec(code)
+
+@benchmark('process_spawn', lazy=[False, True], backend=[None, 'dict'])
+def bench_process_spawn(lazy: bool, backend: str):
+    ctx = multiprocessing.get_context('spawn')
+    code = startup_code(backend)
+    def run():
+        # spawned children inherit the environment at start time
+        old = os.environ.get('MASE_LAZY_IMPORTS'), os.environ.get('PYTHONPATH')
+        os.environ.update({k: v for k, v in startup_env(lazy).items() if k in ('MASE_LAZY_IMPORTS', 'PYTHONPATH')})
+        try:
+            proc = ctx.Process(target=_spawn_worker, args=(code,))
+            proc.start()
+            proc.join()
+        finally:
+            for key, value in zip(('MASE_LAZY_IMPORTS', 'PYTHONPATH'), old):
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+        if proc.exitcode != 0:
+            raise RuntimeError(f'Spawned worker exited with code {proc.exitcode}.')
+    return run
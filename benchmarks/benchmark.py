@@ -0,0 +1,197 @@
+'''Benchmark harness for mase.
+
+Run all registered benchmarks and write results to JSON:
+
+    python benchmark.py run --out results.json
+
+Compare a new run against a stored baseline (exit code 1 on regressions):
+
+    python benchmark.py compare baseline.json results.json --threshold 0.25
+'''
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import argparse
+import dataclasses
+import datetime
+import fnmatch
+import importlib
+import itertools
+import json
+import platform
+import statistics
+import time
+import typing
+
+MAP_RADII = [10, 50, 100, 500]
+AGENT_COUNTS = [10**2, 10**3, 10**4, 10**5]
+QUICK_MAX_RADIUS = 50
+QUICK_MAX_AGENTS = 10**3
+
+# modules containing benchmark cases
+CASE_MODULES = ['bench_core', 'bench_hierarchical', 'bench_startup', 'bench_interning', 'bench_memory', 'bench_distributed']
+
+SetupFunc = typing.Callable[..., typing.Callable[[], typing.Any]]
+
+
+@dataclasses.dataclass
+class Benchmark:
+    '''A named benchmark. setup(**params) prepares the data and returns the
+        zero-argument callable that is timed, or a (callable, info) tuple where
+        info is a dict of extra measurements stored with the result.
+    '''
+    name: str
+    setup: SetupFunc
+    params: typing.Dict[str, typing.List[typing.Any]]
+    max_radius: typing.Optional[int] = None
+
+    def param_sets(self, quick: bool = False) -> typing.List[typing.Dict[str, typing.Any]]:
+        sets = [dict(zip(self.params.keys(), vals)) for vals in itertools.product(*self.params.values())]
+        max_radius = QUICK_MAX_RADIUS if quick else None
+        if self.max_radius is not None:
+            max_radius = min(self.max_radius, max_radius) if max_radius is not None else self.max_radius
+        if max_radius is not None:
+            sets = [p for p in sets if p.get('radius', 0) <= max_radius]
+        if quick:
+            sets = [p for p in sets if p.get('num_agents', 0) <= QUICK_MAX_AGENTS]
+        return sets
+
+
+BENCHMARKS: typing.Dict[str, Benchmark] = dict()
+
+def benchmark(name: str, max_radius: typing.Optional[int] = None, **params: typing.List[typing.Any]):
+    '''Register a benchmark setup function for every combination of params.'''
+    def decorator(setup: SetupFunc) -> SetupFunc:
+        BENCHMARKS[name] = Benchmark(name, setup, params, max_radius)
+        return setup
+    return decorator
+
+
+############################# Running #############################
+
+def time_func(func: typing.Callable[[], typing.Any], min_time: float, max_repeats: int) -> typing.List[float]:
+    '''Call func until min_time has passed or max_repeats is reached.'''
+    times = list()
+    start = time.perf_counter()
+    while len(times) < max_repeats and (not times or time.perf_counter() - start < min_time):
+        t = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t)
+    return times
+
+def run_benchmarks(pattern: str = '*', quick: bool = False, min_time: float = 0.2,
+        max_repeats: int = 50, verbose: bool = True) -> typing.Dict[str, typing.Any]:
+    '''Run matching benchmarks and return a JSON-serializable result dict.'''
+    for module in CASE_MODULES:
+        importlib.import_module(module)
+
+    results = list()
+    for bench in BENCHMARKS.values():
+        if not fnmatch.fnmatch(bench.name, pattern):
+            continue
+        for params in bench.param_sets(quick):
+            record = {'name': bench.name, 'params': params}
+            try:
+                func = bench.setup(**params)
+                if isinstance(func, tuple):
+                    func, record['info'] = func
+                times = time_func(func, min_time, max_repeats)
+                record.update(min=min(times), median=statistics.median(times),
+                    mean=statistics.fmean(times), repeats=len(times), error=None)
+            except Exception as e:
+                record.update(min=None, median=None, mean=None, repeats=0, error=f'{type(e).__name__}: {e}')
+            results.append(record)
+            if verbose:
+                print(format_record(record), flush=True)
+
+    return {
+        'meta': {
+            'timestamp': datetime.datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'quick': quick,
+        },
+        'results': results,
+    }
+
+def format_record(record: dict) -> str:
+    params = ', '.join(f'{k}={v}' for k, v in record['params'].items())
+    if record['error'] is not None:
+        return f'{record["name"]}({params}): ERROR {record["error"]}'
+    info = ''.join(f' {k}={v:.4g}' for k, v in record.get('info', {}).items())
+    return f'{record["name"]}({params}): median={record["median"]*1e3:.3f}ms min={record["min"]*1e3:.3f}ms n={record["repeats"]}{info}'
+
+
+############################# Comparing #############################
+
+def record_key(record: dict) -> str:
+    return record['name'] + json.dumps(record['params'], sort_keys=True)
+
+def compare(baseline: dict, current: dict, threshold: float = 0.25) -> typing.List[dict]:
+    '''Get rows comparing median times. A row is a regression if the current
+        median exceeds the baseline median by more than threshold (a fraction)
+        or if a benchmark that used to succeed now raises an error.
+    '''
+    base = {record_key(r): r for r in baseline['results']}
+    rows = list()
+    for record in current['results']:
+        old = base.get(record_key(record))
+        if old is None or old['median'] is None:
+            continue
+        ratio = record['median'] / old['median'] if record['median'] is not None else float('inf')
+        rows.append({
+            'name': record['name'],
+            'params': record['params'],
+            'baseline': old['median'],
+            'current': record['median'],
+            'ratio': ratio,
+            'regression': ratio > 1 + threshold,
+        })
+    return rows
+
+
+############################# Command Line #############################
+
+def main(argv: typing.Optional[typing.List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Run or compare mase benchmarks.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='run benchmarks and write results to JSON')
+    run_parser.add_argument('--out', default='benchmark_results.json')
+    run_parser.add_argument('--filter', default='*', help='glob pattern on benchmark names')
+    run_parser.add_argument('--quick', action='store_true', help=f'only radius <= {QUICK_MAX_RADIUS} and agents <= {QUICK_MAX_AGENTS}')
+    run_parser.add_argument('--min-time', type=float, default=0.2)
+    run_parser.add_argument('--max-repeats', type=int, default=50)
+
+    compare_parser = subparsers.add_parser('compare', help='flag regressions against a baseline')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.25)
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        results = run_benchmarks(args.filter, args.quick, args.min_time, args.max_repeats)
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    rows = compare(baseline, current, args.threshold)
+    for row in rows:
+        params = ', '.join(f'{k}={v}' for k, v in row['params'].items())
+        flag = 'REGRESSION' if row['regression'] else ''
+        current = f'{row["current"]*1e3:.3f}ms' if row['current'] is not None else 'ERROR'
+        print(f'{row["name"]}({params}): {row["baseline"]*1e3:.3f}ms -> {current} ({row["ratio"]:.2f}x) {flag}')
+    num_regressions = sum(row['regression'] for row in rows)
+    print(f'{num_regressions} regressions in {len(rows)} comparisons.')
+    return 1 if num_regressions else 0
+
+
+if __name__ == '__main__':
+    # case modules register with "benchmark", so make that name refer to this module
+    sys.modules.setdefault('benchmark', sys.modules[__name__])
+    sys.exit(main())
@@ -20,4 +20,37 @@
 #from .position import *
 
 
-from .hexmap import *
+from ._lazy import attach
+
+attach(__name__, globals(), {
+    'HexPos': '.hexmap',
+    'HexUnit': '.hexmap',
+    'NoPathFound': '.hexmap',
+    'TargetInAvoidSet': '.hexmap',
+    'HexIndex': '.hexmap',
+    'bfs_distances': '.hexmap',
+    'bfs_index': '.hexmap',
+    'Field': '.hexmap',
+    'disk_aggregate': '.hexmap',
+    'HashIndex': '.hexmap',
+    'SortedIndex': '.hexmap',
+    'MovementRule': '.hexmap',
+    'MovementRules': '.hexmap',
+    'Passable': '.hexmap',
+    'TerrainCost': '.hexmap',
+    'MaxOccupancy': '.hexmap',
+    'MaxStep': '.hexmap',
+    'FactionZones': '.hexmap',
+    'HexMap': '.hexmap',
+    'HexMapFork': '.hexmap',
+    'ArrayHexMap': '.hexmap',
+    'Visibility': '.hexmap',
+    'Connectivity': '.hexmap',
+    'HierarchicalPathfinder': '.hexmap',
+    'CooperativePathfinder': '.hexmap',
+    'ReservationTable': '.hexmap',
+    'register_backend': '.backends',
+    'available_backends': '.backends',
+    'get_backend': '.backends',
+    'make_map': '.backends',
+})
@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+import importlib
+import os
+import typing
+
+# set MASE_LAZY_IMPORTS=1 to defer importing submodules until their names are used
+LAZY_IMPORTS = os.environ.get('MASE_LAZY_IMPORTS', '0') not in ('', '0')
+
+
+def attach(package: str, namespace: typing.Dict[str, typing.Any], exports: typing.Dict[str, str]):
+    '''Expose names from submodules on a package.
+        Args:
+            package: the package __name__.
+            namespace: the package globals().
+            exports: maps each exported name to the relative submodule
+                defining it.
+    '''
+    namespace['__all__'] = list(exports)
+    if not LAZY_IMPORTS:
+        for name, module in exports.items():
+            namespace[name] = getattr(importlib.import_module(module, package), name)
+        return
+
+    def __getattr__(name: str):
+        try:
+            module = exports[name]
+        except KeyError:
+            raise AttributeError(f'module {package!r} has no attribute {name!r}')
+        value = namespace[name] = getattr(importlib.import_module(module, package), name)
+        return value
+
+    def __dir__() -> typing.List[str]:
+        return sorted(set(namespace) | set(exports))
+
+    namespace['__getattr__'] = __getattr__
+    namespace['__dir__'] = __dir__
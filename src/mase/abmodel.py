@@ -2,7 +2,8 @@ import dataclasses
 import typing
 
 from .hexmap import HexMap
-from .position import HexPos
+from .hexmap.hexpos import HexPos
+from .agent import Agent
 from .agentstatepool import AgentStatePool, AgentID
 
 @dataclasses.dataclass
@@ -25,12 +26,16 @@ class ABModel:
         sortkey = lambda pos: target.dist(pos)
         return [self.pool[aid] for aid in self.map.agents(sortkey) if agent_filter(self.pool[aid])]
         
-    def nearest_locs(self, agent_id: AgentID, loc_filter: typing.Callable = lambda agent: True):
-        '''Get locations nearest to the provided position after filtering criteria.'''
-        target = self.map.PositionType(*target)
-        sortkey = lambda pos: target.dist(pos)
-        return [self.pool[aid] for loc in self.map.locations(filter=loc_filter, sortkey=sortkey)]
-
+    def nearest_locs(self, agent: typing.Union[Agent, AgentID], loc_filter: typing.Callable = lambda loc: True, limit: int = None):
+        '''Get locations nearest to the provided agent after filtering criteria.'''
+        return list(self.map.iter_nearest(self.agent_pos(agent), loc_filter, limit))
+
+    def agent_pos(self, agent: typing.Union[Agent, AgentID]) -> HexPos:
+        '''Get the position of an agent on the map, given as an Agent or its id.'''
+        if not isinstance(agent, Agent):
+            # agents hash and compare by id, so a stand-in finds the agent
+            agent = Agent(agent, None)
+        return self.map.agent_pos(agent)
         
     #locations
     #def nearest_agents_base(self, target: HexPos, agent_criteria: typing.Callable = lambda agent: True):
@@ -52,12 +57,6 @@ class ABModel:
         source_pos, target_pos = self.map.get_agent_pos(agent_id), self.PositionType(*target)
         return source_pos.pathfind_dfs(target_pos, avoidset)
         
-    def nearest_locations(self, position: tuple, criteria: typing.Callable = lambda loc: True):
-        '''Get locations nearest to the provided position after filtering criteria.'''
-        target = self.PositionType(*position)
-        sortkey = lambda pos, loc: target.dist(pos)
-        return [pos for pos,loc in sorted(self.locs.items(), key=sortkey) if criteria(loc)]
-
-
-
-
+    def nearest_locations(self, position: tuple, criteria: typing.Callable = lambda loc: True, limit: int = None):
+        '''Get positions nearest to the provided position after filtering criteria.'''
+        return [loc.pos for loc in self.map.iter_nearest(HexPos(*position), criteria, limit)]
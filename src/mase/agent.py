@@ -11,9 +11,10 @@ if typing.TYPE_CHECKING:
 
 from .errors import *
 
-from .position import HexPos
+from .hexmap.hexpos import HexPos
 #
 from .agentid import AgentID
+from .profiling import profiler
 #from .hexnetmap import HexNetMap
 #from .agentpool import AgentPool
 #AgentPoolType = typing.TypeVar('AgentPoolType')
@@ -98,14 +99,27 @@ class Agent:
         sortkey = lambda a: self.pos.dist(a.pos)
         return AgentSet([a for a in sorted(self.map.agents(), key=sortkey) if a != self])
 
-    def nearest_locations(self) -> Locations:
-        '''Get locations nearest to this agent.'''
-        sortkey = lambda loc: self.pos.dist(loc.pos)
-        return list(sorted(self.map.locations(), key=sortkey))
+    def nearest_locations(self, predicate: typing.Callable = None, limit: int = None, max_dist: int = None) -> Locations:
+        '''Get locations nearest to this agent, optionally only those
+            matching predicate and at most limit of them.
+        '''
+        return self.map.nearest(self.pos, predicate, limit, max_dist)
     
     def neighbor_locs(self, dist: int = 1) -> Locations:
         '''Get locations within specified distance.'''
         return self.map.region_locs(self.pos, dist=dist)
+
+    def field_value(self, name: str) -> float:
+        '''Get the value of a map field at this agent's position.'''
+        return self.map.field(name).at(self.pos)
+
+    def field_gradient(self, name: str) -> typing.Tuple[float, float, float]:
+        '''Get the gradient of a map field at this agent's position.'''
+        return self.map.field(name).gradient(self.pos)
+
+    def field_uphill(self, name: str) -> HexPos:
+        '''Get the neighboring position (or current one) where a map field is largest.'''
+        return self.map.field(name).uphill(self.pos)
         
     ##################### Pathfinding Functions #####################
     def shortest_path(self, target: HexPos, allowed_pos: typing.Set[HexPos], **kwargs):
@@ -130,6 +144,7 @@ class Agent:
 class AgentSet(typing.Set[Agent]):
     def random_activation(self) -> typing.List[Agent]:
         '''Get agents in a random order.'''        
-        return list(random.sample(list(self), len(self)))
+        with profiler.phase('schedule'):
+            return list(random.sample(list(self), len(self)))
 
 
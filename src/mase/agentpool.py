@@ -1,15 +1,18 @@
+from __future__ import annotations
+
 import dataclasses
 import typing
 import random
 import copy
 
-from matplotlib.colors import hexColorPattern
 
-from .position import HexPos
+from .hexmap.hexpos import HexPos
 from .hexmap import HexMap
 from .agent import Agent, AgentState
 from .agentid import AgentID
 from .errors import *
+from .overlay import OverlayDict
+from .profiling import profiler
 
 @dataclasses.dataclass
 class AgentPool:
@@ -47,7 +50,7 @@ class AgentPool:
         if self._map is not None:
             return self._map
         else:
-            MapIsNotAttachedError(f'Couldn\'t access map because it not attached to this {self.__class__.__name__}.')
+            raise MapIsNotAttachedError(f'Couldn\'t access map because it not attached to this {self.__class__.__name__}.')
             
     @property
     def map_attached(self):
@@ -60,32 +63,80 @@ class AgentPool:
         if agent_id in self.agents:
             raise AgentExistsError(f'The agent {agent_id} already exists in this pool.')
 
-        agent = Agent(agent_id, copy.deepcopy(agent_state), self, self._map)
+        agent = Agent(agent_id, copy.deepcopy(agent_state), self._map)
         if self.map_attached:
-            self.map.add_agent(agent.id, pos)
+            self.map.add_agent(agent, pos)
         self.agents[agent.id] = agent
         
     def remove_agent(self, agent_id: AgentID):
         try:
-            del self.agents[agent_id]
+            agent = self.agents.pop(agent_id)
         except KeyError:
             raise AgentDoesNotExistError(f'The agent {agent_id} does not exist in this pool.')
         if self.map_attached:
-            self.map.remove_agent(agent_id)
+            self.map.remove_agent(agent)
     
     ##################### Activation/Scheduling Functions #####################
     def random_activation(self) -> typing.List[AgentID]:
         '''Get agent ids in a random order.'''
-        return list(random.sample(self.values(), len(self)))
+        with profiler.phase('schedule'):
+            return list(random.sample(list(self.agents.values()), len(self)))
         
     ##################### View-Related Functions #####################
     def deepcopy(self):
         return copy.deepcopy(self)
+
+    def fork(self) -> AgentPoolFork:
+        '''Get a copy-on-write overlay of this pool for lookahead, attached
+            to a fork of its map if it has one. This pool and its map must
+            not change while the fork is in use.
+        '''
+        return AgentPoolFork(self)
     
     def get_info(self):
         return [agent.get_info() for agent in self]
 
 
+class AgentPoolFork(AgentPool):
+    '''Copy-on-write overlay of an agent pool. An agent is copied into the
+        fork (with a shallow copy of its state) the first time it is
+        accessed through indexing, so changing it does not affect the
+        parent. The fork is attached to a fork of the parent's map, which
+        agents copied into the fork refer to. Iteration and get_info read
+        through without copying, so use indexing to change an agent.
+    '''
+    def __init__(self, parent: AgentPool):
+        self.parent = parent
+        super().__init__(OverlayDict(parent.agents), parent._map.fork() if parent.map_attached else None)
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}(changed={self.num_changed})'
+
+    def __getitem__(self, agent_id: AgentID) -> Agent:
+        try:
+            return self.agents.delta[agent_id]
+        except KeyError:
+            pass
+        try:
+            agent = self.agents.peek(agent_id)
+        except KeyError:
+            raise AgentDoesNotExistError(f'Could not retrieve agent: {agent_id} does not exist in this {self.__class__.__name__}.')
+        agent = self.agents[agent_id] = dataclasses.replace(agent, state=copy.copy(agent.state), _map=self._map)
+        return agent
+
+    ##################### View-Related Functions #####################
+    @property
+    def num_changed(self) -> int:
+        '''Number of agents added, removed or copied into this fork.'''
+        return self.agents.num_changed
+
+    def discard(self):
+        '''Drop all changes made in this fork and its map.'''
+        self.agents.discard()
+        if self.map_attached:
+            self.map.discard()
+
+
 
 
 
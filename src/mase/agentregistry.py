@@ -0,0 +1,371 @@
+from __future__ import annotations
+
+import copy
+import random
+import typing
+import numpy as np
+
+from .errors import *
+from .agent import AgentID, AgentState
+from .overlay import OverlayDict
+from .profiling import profiler
+
+SLOT_BITS = 32
+SLOT_MASK = (1 << SLOT_BITS) - 1
+
+
+def slot_of(agent_id: AgentID) -> int:
+    '''Get the slot encoded in the low bits of an agent id.'''
+    return agent_id & SLOT_MASK
+
+def generation_of(agent_id: AgentID) -> int:
+    '''Get the generation encoded in the high bits of an agent id.'''
+    return agent_id >> SLOT_BITS
+
+
+class AgentRegistry:
+    '''Keeps agent states in dense slots that are recycled through a free-list.
+        An agent id packs the slot together with the slot's generation, which
+        is bumped whenever the slot is freed, so ids of removed agents are
+        detected instead of silently referring to whichever agent reuses the
+        slot. The lowest free slot is always reused first and live ids are
+        kept in a dense array, so memory stays proportional to the peak
+        population and iteration only touches live agents. Slot bookkeeping
+        lives in numpy arrays, so batches of births and deaths (scheduled
+        during a tick and applied together by end_tick, or passed to
+        add_agents and remove_agents) are applied with array operations.
+    '''
+    def __init__(self):
+        self.states: typing.List[typing.Optional[AgentState]] = list()
+        # per-slot arrays with spare capacity past len(self.states)
+        self.generations = np.zeros(0, dtype=np.int64)
+        self.live_pos = np.zeros(0, dtype=np.int64)
+        # ids of live agents in live[:num_live], and sorted free slots
+        self.live = np.zeros(0, dtype=np.int64)
+        self.num_live = 0
+        self.free = np.zeros(0, dtype=np.int64)
+        self.pending_births: typing.List[AgentState] = list()
+        self.pending_deaths: typing.List[AgentID] = list()
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}(num_agents={len(self)}, num_slots={len(self.states)})'
+
+    def __len__(self) -> int:
+        return self.num_live
+
+    def __contains__(self, agent_id: AgentID) -> bool:
+        slot = slot_of(agent_id)
+        return slot < len(self.states) and self.live_pos[slot] >= 0 and self.generations[slot] == generation_of(agent_id)
+
+    def __iter__(self) -> typing.Iterator[AgentID]:
+        return iter(self.ids())
+
+    def __getitem__(self, agent_id: AgentID) -> AgentState:
+        return self.get_agent(agent_id)
+
+    ##################### Access #####################
+    def agent_id(self, slot: int) -> AgentID:
+        return (int(self.generations[slot]) << SLOT_BITS) | slot
+
+    def ids(self) -> typing.List[AgentID]:
+        '''Get ids of live agents in dense order.'''
+        return self.live[:self.num_live].tolist()
+
+    def sample(self, k: int, rng: np.random.Generator) -> typing.List[AgentID]:
+        '''Get k distinct live ids chosen at random, without copying the
+            ids of the whole population.
+        '''
+        return self.live[rng.choice(self.num_live, size=k, replace=False)].tolist()
+
+    def agents(self, filter_criteria: typing.Callable = lambda astate: True) -> typing.List[AgentState]:
+        '''Get live agent states after applying filter criteria.'''
+        states = self.states
+        return [states[aid & SLOT_MASK] for aid in self.ids() if filter_criteria(states[aid & SLOT_MASK])]
+
+    def items(self) -> typing.List[typing.Tuple[AgentID, AgentState]]:
+        return [(aid, self.states[aid & SLOT_MASK]) for aid in self.ids()]
+
+    def get_agent(self, agent_id: AgentID) -> AgentState:
+        return self.states[self._check(agent_id)]
+
+    def _check(self, agent_id: AgentID) -> int:
+        '''Get the slot of a live agent or raise.'''
+        slot, generation = slot_of(agent_id), generation_of(agent_id)
+        if slot >= len(self.states) or generation > self.generations[slot]:
+            raise AgentDoesNotExistError(f'The agent {agent_id} does not exist in this registry.')
+        if generation < self.generations[slot]:
+            # removing an agent bumps the generation of its slot
+            raise StaleAgentIDError(f'The agent {agent_id} was removed from this registry.')
+        if self.live_pos[slot] < 0:
+            # the slot is free and this id has not been issued yet
+            raise AgentDoesNotExistError(f'The agent {agent_id} does not exist in this registry.')
+        return slot
+
+    def _live_slots(self, ids: np.ndarray) -> typing.Tuple[np.ndarray, np.ndarray]:
+        '''Get the slots of an array of ids and a mask of the live ones.'''
+        slots = ids & SLOT_MASK
+        live = slots < len(self.states)
+        inside = slots[live]
+        live[live] = (self.generations[inside] == ids[live] >> SLOT_BITS) & (self.live_pos[inside] >= 0)
+        return slots, live
+
+    def _check_many(self, agent_ids: typing.Iterable[AgentID], distinct: bool = True) -> np.ndarray:
+        '''Get the slots of live agents, raising for the first id that is
+            not live (or, with distinct, appears twice).
+        '''
+        ids = np.fromiter(agent_ids, dtype=np.int64)
+        slots, live = self._live_slots(ids)
+        if not live.all():
+            self._check(int(ids[np.argmin(live)]))
+        if not distinct:
+            return slots
+        unique, first = np.unique(slots, return_index=True)
+        if len(unique) < len(slots):
+            repeated = np.setdiff1d(np.arange(len(slots)), first)[0]
+            raise StaleAgentIDError(f'The agent {int(ids[repeated])} is removed more than once.')
+        return slots
+
+    def _reserve(self, num_slots: int):
+        '''Make room in the per-slot arrays for num_slots slots.'''
+        capacity = len(self.generations)
+        if num_slots <= capacity:
+            return
+        capacity = max(num_slots, 2*capacity, 16)
+        for name, fill in (('generations', 0), ('live_pos', -1), ('live', 0)):
+            old = getattr(self, name)
+            new = np.full(capacity, fill, dtype=np.int64)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    ##################### Add/Remove Functions #####################
+    def add_agent(self, agent_state: AgentState) -> AgentID:
+        '''Add an agent now and get its id.'''
+        return self._add_states([agent_state])[0]
+
+    def remove_agent(self, agent_id: AgentID) -> AgentState:
+        '''Remove an agent now and get its state.'''
+        return self._remove_slots(np.array([self._check(agent_id)]))[0]
+
+    def add_agents(self, agent_states: typing.Iterable[AgentState]) -> typing.List[AgentID]:
+        '''Add agents now and get their ids.'''
+        return self._add_states(list(agent_states))
+
+    def remove_agents(self, agent_ids: typing.Iterable[AgentID]) -> typing.List[AgentState]:
+        '''Remove agents now and get their states. Nothing is removed if
+            any of the ids is not live.
+        '''
+        return self._remove_slots(self._check_many(agent_ids))
+
+    def _add_states(self, agent_states: typing.List[AgentState]) -> typing.List[AgentID]:
+        n = len(agent_states)
+        slots, self.free = self.free[:n], self.free[n:]
+        if len(slots) < n:
+            first = len(self.states)
+            self._reserve(first + n - len(slots))
+            self.states.extend([None] * (n - len(slots)))
+            slots = np.concatenate([slots, np.arange(first, first + n - len(slots))])
+        states = self.states
+        for slot, state in zip(slots.tolist(), agent_states):
+            states[slot] = state
+
+        ids = (self.generations[slots] << SLOT_BITS) | slots
+        start = self.num_live
+        self.live[start:start+n] = ids
+        self.live_pos[slots] = np.arange(start, start + n)
+        self.num_live += n
+        return ids.tolist()
+
+    def _remove_slots(self, slots: np.ndarray) -> typing.List[AgentState]:
+        '''Remove the agents in distinct live slots.'''
+        states = self.states
+        removed = list()
+        for slot in slots.tolist():
+            removed.append(states[slot])
+            states[slot] = None
+        self.generations[slots] += 1
+
+        # fill the holes left before the new end with the surviving ids
+        # past it, like a swap-remove of every slot at once
+        live, live_pos = self.live, self.live_pos
+        end = self.num_live - len(slots)
+        pos = live_pos[slots]
+        dying_tail = np.zeros(len(slots), dtype=bool)
+        dying_tail[pos[pos >= end] - end] = True
+        movers = live[end:self.num_live][~dying_tail]
+        holes = pos[pos < end]
+        live[holes] = movers
+        live_pos[movers & SLOT_MASK] = holes
+        live_pos[slots] = -1
+        self.num_live = end
+        self.free = np.sort(np.concatenate([self.free, slots]))
+        return removed
+
+    ##################### Batched Births and Deaths #####################
+    def schedule_birth(self, agent_state: AgentState):
+        '''Add an agent when end_tick is called.'''
+        self.pending_births.append(agent_state)
+
+    def schedule_births(self, agent_states: typing.Iterable[AgentState]):
+        '''Add agents when end_tick is called.'''
+        self.pending_births.extend(agent_states)
+
+    def schedule_death(self, agent_id: AgentID):
+        '''Remove an agent when end_tick is called. Scheduling the same agent twice is allowed.'''
+        self._check(agent_id)
+        self.pending_deaths.append(agent_id)
+
+    def schedule_deaths(self, agent_ids: typing.Iterable[AgentID]):
+        '''Remove agents when end_tick is called.'''
+        agent_ids = list(agent_ids)
+        self._check_many(agent_ids, distinct=False)
+        self.pending_deaths.extend(agent_ids)
+
+    def end_tick(self) -> typing.Tuple[typing.List[AgentID], typing.List[AgentState]]:
+        '''Apply scheduled deaths and then births, so freed slots are reused
+            in the same tick. Deaths of agents that were removed after being
+            scheduled are skipped.
+            Returns:
+                ids of the new agents and states of the removed ones.
+        '''
+        # drop repeated deaths but keep the order they were scheduled in
+        ids = np.fromiter(dict.fromkeys(self.pending_deaths), dtype=np.int64)
+        slots, live = self._live_slots(ids)
+        removed = self._remove_slots(slots[live])
+        added = self._add_states(self.pending_births)
+
+        if profiler.enabled:
+            profiler.count('births', len(added))
+            profiler.count('deaths', len(removed))
+        self.pending_births, self.pending_deaths = list(), list()
+        return added, removed
+
+    ##################### Activation Functions #####################
+    def random_activation(self) -> typing.List[AgentID]:
+        '''Get agent ids in a random order.'''
+        with profiler.phase('schedule'):
+            ids = self.ids()
+            random.shuffle(ids)
+            return ids
+
+    ##################### View-Related Functions #####################
+    def fork(self) -> AgentRegistryFork:
+        '''Get a copy-on-write overlay of this registry for lookahead. This
+            registry must not change while the fork is in use.
+        '''
+        return AgentRegistryFork(self)
+
+    def get_info(self):
+        with profiler.phase('record'):
+            return {aid: state.get_info() for aid, state in self.items()}
+
+
+class AgentRegistryFork(OverlayDict[AgentID, AgentState]):
+    '''Copy-on-write overlay of an agent registry. An agent state is copied
+        (shallowly) into the fork the first time it is accessed through
+        get_agent() or indexing. Agents added in the fork get fresh slots
+        past those of the parent instead of reusing freed ones, so their
+        ids are only meaningful in the fork and its own forks. Ids of agents
+        removed in the fork raise StaleAgentIDError.
+    '''
+    def __init__(self, parent: typing.Union[AgentRegistry, AgentRegistryFork]):
+        super().__init__(parent)
+        self.next_slot = parent.next_slot if isinstance(parent, AgentRegistryFork) else len(parent.states)
+        self.pending_births: typing.List[AgentState] = list()
+        self.pending_deaths: typing.Dict[AgentID, None] = dict()
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}(num_agents={len(self)}, changed={self.num_changed})'
+
+    ##################### Access #####################
+    def peek(self, agent_id: AgentID) -> AgentState:
+        try:
+            return self.delta[agent_id]
+        except KeyError:
+            pass
+        if agent_id in self.deleted:
+            raise StaleAgentIDError(f'The agent {agent_id} was removed from this registry.')
+        return self._parent_get(agent_id)
+
+    def get_agent(self, agent_id: AgentID) -> AgentState:
+        try:
+            return self.delta[agent_id]
+        except KeyError:
+            pass
+        state = self.delta[agent_id] = copy.copy(self.peek(agent_id))
+        return state
+
+    def __getitem__(self, agent_id: AgentID) -> AgentState:
+        return self.get_agent(agent_id)
+
+    def ids(self) -> typing.List[AgentID]:
+        return list(self)
+
+    def agents(self, filter_criteria: typing.Callable = lambda astate: True) -> typing.List[AgentState]:
+        '''Get live agent states after applying filter criteria, without copying them.'''
+        return [state for _, state in self.peek_items() if filter_criteria(state)]
+
+    def items(self) -> typing.List[typing.Tuple[AgentID, AgentState]]:
+        return list(self.peek_items())
+
+    ##################### Add/Remove Functions #####################
+    def add_agent(self, agent_state: AgentState) -> AgentID:
+        '''Add an agent now and get its id.'''
+        agent_id = self.next_slot
+        self.next_slot += 1
+        self.delta[agent_id] = agent_state
+        return agent_id
+
+    def remove_agent(self, agent_id: AgentID) -> AgentState:
+        '''Remove an agent now and get its state.'''
+        state = self.peek(agent_id)
+        del self[agent_id]
+        return state
+
+    def add_agents(self, agent_states: typing.Iterable[AgentState]) -> typing.List[AgentID]:
+        return [self.add_agent(state) for state in agent_states]
+
+    def remove_agents(self, agent_ids: typing.Iterable[AgentID]) -> typing.List[AgentState]:
+        return [self.remove_agent(agent_id) for agent_id in agent_ids]
+
+    ##################### Batched Births and Deaths #####################
+    def schedule_birth(self, agent_state: AgentState):
+        self.pending_births.append(agent_state)
+
+    def schedule_births(self, agent_states: typing.Iterable[AgentState]):
+        self.pending_births.extend(agent_states)
+
+    def schedule_death(self, agent_id: AgentID):
+        self.peek(agent_id)
+        self.pending_deaths[agent_id] = None
+
+    def schedule_deaths(self, agent_ids: typing.Iterable[AgentID]):
+        for agent_id in agent_ids:
+            self.schedule_death(agent_id)
+
+    def end_tick(self) -> typing.Tuple[typing.List[AgentID], typing.List[AgentState]]:
+        '''Apply scheduled deaths of agents still in the fork and then births.'''
+        removed = self.remove_agents(aid for aid in self.pending_deaths if aid in self)
+        added = self.add_agents(self.pending_births)
+        self.pending_births, self.pending_deaths = list(), dict()
+        return added, removed
+
+    ##################### Activation Functions #####################
+    def random_activation(self) -> typing.List[AgentID]:
+        '''Get agent ids in a random order.'''
+        with profiler.phase('schedule'):
+            ids = self.ids()
+            random.shuffle(ids)
+            return ids
+
+    ##################### View-Related Functions #####################
+    def fork(self) -> AgentRegistryFork:
+        return AgentRegistryFork(self)
+
+    def discard(self):
+        '''Drop all changes made in this fork.'''
+        super().discard()
+        self.pending_births, self.pending_deaths = list(), dict()
+
+    def get_info(self):
+        with profiler.phase('record'):
+            return {aid: state.get_info() for aid, state in self.peek_items()}
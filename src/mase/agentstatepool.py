@@ -1,3 +1,5 @@
+from __future__ import annotations
+
 import random
 import typing
 import copy
@@ -6,6 +8,8 @@ import dataclasses
 from .errors import *
 #from .agentstate import AgentID, AgentState
 from .agent import AgentID, AgentState
+from .overlay import OverlayDict
+from .profiling import profiler
 
 
 class AgentStatePool(typing.Dict[AgentID, AgentState]):
@@ -37,7 +41,8 @@ class AgentStatePool(typing.Dict[AgentID, AgentState]):
     ##################### Activation Functions #####################
     def random_activation(self) -> typing.List[AgentID]:
         '''Get agent ids in a random order.'''
-        return list(random.sample(self.keys(), len(self)))
+        with profiler.phase('schedule'):
+            return list(random.sample(list(self.keys()), len(self)))
     
     def ordered_activation(self, sort_key: typing.Callable):
         '''Activate agents according to some sorting criteria.'''
@@ -45,6 +50,68 @@ class AgentStatePool(typing.Dict[AgentID, AgentState]):
     ##################### View-Related Functions #####################
     def deepcopy(self):
         return copy.deepcopy(self)
+
+    def fork(self) -> AgentStatePoolFork:
+        '''Get a copy-on-write overlay of this pool for lookahead. This pool
+            must not change while the fork is in use.
+        '''
+        return AgentStatePoolFork(self)
     
     def get_info(self):
-        return {aid: state.get_info() for aid, state in self.items()}
+        with profiler.phase('record'):
+            return {aid: state.get_info() for aid, state in self.items()}
+
+
+class AgentStatePoolFork(OverlayDict[AgentID, AgentState]):
+    '''Copy-on-write overlay of an agent pool. An agent state is copied
+        (shallowly) into the fork the first time it is accessed through
+        get_agent() or indexing, so changing it does not affect the parent.
+        agents() and get_info() read through without copying.
+    '''
+    ##################### View-Related Functions #####################
+    def agents(self, filter_criteria: typing.Callable = lambda astate: True):
+        '''Get the agents after applying filter criteria.'''
+        return [astate for _, astate in self.peek_items() if filter_criteria(astate)]
+
+    ##################### Add/Remove Functions #####################
+    def add_agent(self, agent_id: AgentID, agent_state: AgentState):
+        if agent_id in self:
+            raise AgentExistsError(f'The agent {agent_id} already exists in this pool.')
+        self[agent_id] = agent_state
+
+    def remove_agent(self, agent_id: AgentID):
+        try:
+            del self[agent_id]
+        except KeyError:
+            raise AgentDoesNotExistError(f'The agent {agent_id} does not exist in this pool.')
+
+    def get_agent(self, agent_id: AgentID) -> AgentState:
+        try:
+            return self.delta[agent_id]
+        except KeyError:
+            pass
+        try:
+            state = copy.copy(self.peek(agent_id))
+        except KeyError:
+            raise AgentDoesNotExistError(f'The agent {agent_id} does not exist in this pool.')
+        self.delta[agent_id] = state
+        return state
+
+    def __getitem__(self, agent_id: AgentID) -> AgentState:
+        return self.get_agent(agent_id)
+
+    ##################### Activation Functions #####################
+    def random_activation(self) -> typing.List[AgentID]:
+        '''Get agent ids in a random order.'''
+        with profiler.phase('schedule'):
+            ids = list(self)
+            random.shuffle(ids)
+            return ids
+
+    ##################### View-Related Functions #####################
+    def fork(self) -> AgentStatePoolFork:
+        return AgentStatePoolFork(self)
+
+    def get_info(self):
+        with profiler.phase('record'):
+            return {aid: state.get_info() for aid, state in self.peek_items()}
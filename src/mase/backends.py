@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import importlib
+import typing
+
+if typing.TYPE_CHECKING:
+    from .location import LocationState
+
+
+class BackendNotFoundError(ValueError):
+    pass
+
+
+# backends are given as 'module:ClassName' so that their modules (and any
+# heavy dependencies they need) are only imported when they are selected
+_BACKENDS: typing.Dict[str, typing.Union[str, type]] = {
+    'dict': 'mase.hexmap.hexmap:HexMap',
+    'array': 'mase.hexmap.arrayhexmap:ArrayHexMap',
+    'igraph': 'mase.hexnetmap.hexnetmap:HexNetMap',
+}
+
+
+def register_backend(name: str, target: typing.Union[str, type]):
+    '''Register a map implementation under a name.
+        Args:
+            target: the map class, or a 'module:ClassName' string that is
+                imported the first time the backend is used.
+    '''
+    _BACKENDS[name] = target
+
+
+def available_backends() -> typing.List[str]:
+    '''Get the names of all registered backends.'''
+    return sorted(_BACKENDS)
+
+
+def get_backend(name: str) -> type:
+    '''Get the map class registered under a name, importing it if needed.'''
+    try:
+        target = _BACKENDS[name]
+    except KeyError:
+        raise BackendNotFoundError(f'Unknown map backend "{name}". Available backends: {available_backends()}.')
+
+    if isinstance(target, str):
+        module_name, class_name = target.split(':')
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError as e:
+            raise ImportError(f'Map backend "{name}" requires a package that could not be imported: {e}') from e
+        target = _BACKENDS[name] = getattr(module, class_name)
+    return target
+
+
+def make_map(backend: str, radius: int, default_loc_state: LocationState = None, **kwargs):
+    '''Construct a map of the given radius with the named backend.'''
+    return get_backend(backend)(radius, default_loc_state, **kwargs)
@@ -0,0 +1,667 @@
+'''Distributed simulation of one map across worker processes on one or more hosts.
+
+The coordinator splits the map into strips of whole q columns, which are
+contiguous ranges of the cell index, and assigns one strip (a Region) to
+each worker. Every worker runs a RegionModel over its strip plus a halo of
+neighboring columns. After each tick, neighboring workers exchange the halo
+values of selected layers and the agents that moved into each other's strip
+over direct sockets, as batched binary messages of numpy arrays. The
+coordinator then releases the next tick once every worker has finished the
+current one (a barrier). Agents are kept in id order, and RegionModel.random
+draws numbers keyed by agent id or cell, so the same agent or cell gets the
+same number whichever worker holds it. A model that draws only from it and
+computes every owned cell from values that are current on its worker gives
+the same results for a given seed with any number of workers.
+RegionModel.rng draws per region, so results that use it are only
+reproducible for the same seed and number of workers.
+
+Every connection starts with a mutual HMAC challenge on a shared authkey,
+as in multiprocessing.connection, and nothing is unpickled before it
+succeeds. After that the peers trust each other: the setup message,
+including the model factory, is pickled. Run workers on other hosts with
+
+    MASE_AUTHKEY=KEY python -m mase.distributed worker COORDINATOR_HOST COORDINATOR_PORT
+
+where the coordinator was made with the same key (passed as authkey or set
+in MASE_AUTHKEY), or use run_local to start them as local processes.
+'''
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import hmac
+import json
+import multiprocessing
+import os
+import pickle
+import socket
+import struct
+import threading
+import time
+import traceback
+import typing
+import numpy as np
+
+from .hexmap.hexindex import HexIndex
+from .hexmap.hexpos import HEX_DIRECTIONS
+
+RegionModelFactory = typing.Callable[['Region', typing.Dict[str, typing.Any], int], 'RegionModel']
+
+
+class DistributedError(RuntimeError):
+    pass
+
+
+class AuthenticationError(DistributedError):
+    pass
+
+
+############################# Messages #############################
+
+HELLO, SETUP, EXCHANGE, DONE, GO, COLLECT, RESULT, ERROR, CHALLENGE, RESPONSE = range(10)
+
+# message kind, tick and payload size
+_HEADER = struct.Struct('!BqQ')
+
+_NONCE_SIZE = 32
+_DIGEST = 'sha256'
+
+
+def send_message(sock: socket.socket, kind: int, tick: int = 0, payload: bytes = b''):
+    sock.sendall(_HEADER.pack(kind, tick, len(payload)) + payload)
+
+def recv_message(sock: socket.socket, max_size: int = None) -> typing.Tuple[int, int, bytes]:
+    '''Receive one message as (kind, tick, payload), refusing payloads
+        larger than max_size.
+    '''
+    kind, tick, size = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+    if max_size is not None and size > max_size:
+        raise DistributedError(f'Message of {size} bytes is larger than the limit of {max_size}.')
+    return kind, tick, _recv_exactly(sock, size)
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:])
+        if n == 0:
+            raise ConnectionError('Connection closed by peer.')
+        received += n
+    return bytes(buf)
+
+def pack_arrays(arrays: typing.Dict[str, np.ndarray]) -> bytes:
+    '''Encode named arrays (including structured ones) as one binary
+        payload, each with a JSON header of its name, dtype and shape.
+    '''
+    parts = [struct.pack('!I', len(arrays))]
+    for name, arr in arrays.items():
+        arr = np.ascontiguousarray(arr)
+        meta = json.dumps([name, arr.dtype.descr if arr.dtype.names else arr.dtype.str, arr.shape]).encode()
+        parts += [struct.pack('!IQ', len(meta), arr.nbytes), meta, arr.tobytes()]
+    return b''.join(parts)
+
+def unpack_arrays(data: bytes) -> typing.Dict[str, np.ndarray]:
+    (count,), offset = struct.unpack_from('!I', data), 4
+    arrays = dict()
+    for _ in range(count):
+        meta_size, nbytes = struct.unpack_from('!IQ', data, offset)
+        offset += 12
+        name, descr, shape = json.loads(data[offset:offset+meta_size])
+        offset += meta_size
+        dtype, shape = np.dtype(_descr_from_json(descr)), tuple(shape)
+        if dtype.itemsize * int(np.prod(shape)) != nbytes:
+            raise DistributedError(f'Array {name!r} of {nbytes} bytes does not match its dtype and shape.')
+        arrays[name] = np.frombuffer(data, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape).copy()
+        offset += nbytes
+    return arrays
+
+def _descr_from_json(descr: typing.Any) -> typing.Any:
+    '''Turn a dtype descr that went through JSON back into tuples.'''
+    if isinstance(descr, str):
+        return descr
+    fields = list()
+    for field in descr:
+        name = tuple(field[0]) if isinstance(field[0], list) else field[0]
+        fields.append((name, _descr_from_json(field[1])) + tuple(tuple(extra) for extra in field[2:]))
+    return fields
+
+
+############################# Authentication #############################
+
+def default_authkey() -> typing.Optional[bytes]:
+    '''Get the authkey from the MASE_AUTHKEY environment variable, if set.'''
+    key = os.environ.get('MASE_AUTHKEY')
+    return key.encode() if key else None
+
+def _deliver_challenge(sock: socket.socket, authkey: bytes):
+    '''Check that the peer knows authkey, then prove it to the peer.'''
+    nonce = os.urandom(_NONCE_SIZE)
+    send_message(sock, CHALLENGE, payload=nonce)
+    kind, _, payload = recv_message(sock, max_size=2 * _NONCE_SIZE + 64)
+    expected = hmac.new(authkey, nonce, _DIGEST).digest()
+    if kind != RESPONSE or not hmac.compare_digest(payload[:len(expected)], expected):
+        send_message(sock, ERROR, payload=b'Authentication failed.')
+        raise AuthenticationError('A peer failed to authenticate.')
+    send_message(sock, RESPONSE, payload=hmac.new(authkey, payload[len(expected):], _DIGEST).digest())
+
+def _answer_challenge(sock: socket.socket, authkey: bytes):
+    '''Prove to the peer that we know authkey and check that it does too.'''
+    kind, _, challenge = recv_message(sock, max_size=_NONCE_SIZE)
+    if kind != CHALLENGE:
+        raise AuthenticationError(f'Expected an authentication challenge, got message {kind}.')
+    nonce = os.urandom(_NONCE_SIZE)
+    send_message(sock, RESPONSE, payload=hmac.new(authkey, challenge, _DIGEST).digest() + nonce)
+    kind, _, payload = recv_message(sock, max_size=64)
+    if kind != RESPONSE or not hmac.compare_digest(payload, hmac.new(authkey, nonce, _DIGEST).digest()):
+        raise AuthenticationError('Authentication failed; check that both sides use the same authkey.')
+
+
+############################# Keyed Randomness #############################
+
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+def _mix64(x: np.ndarray) -> np.ndarray:
+    '''SplitMix64 finalizer on uint64 arrays (wrapping arithmetic).'''
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+def keyed_random(seed: int, tick: int, keys: np.ndarray, stream: int = 0) -> np.ndarray:
+    '''Uniform floats in [0, 1), one per key, that depend only on the seed,
+        tick, stream and key. Use distinct streams for independent draws
+        with the same keys in one tick.
+    '''
+    base = np.array([seed, tick, stream], dtype=np.int64).view(np.uint64)
+    h = np.zeros(1, dtype=np.uint64)
+    for part in base:
+        h = _mix64(h + part + _GOLDEN)
+    keys = np.asarray(keys, dtype=np.int64).view(np.uint64)
+    bits = _mix64(h + (keys + np.uint64(1)) * _GOLDEN)
+    return (bits >> np.uint64(11)) * (1.0 / (1 << 53))
+
+
+############################# Partitioning #############################
+
+@dataclasses.dataclass(frozen=True)
+class Partition:
+    '''Split of a map into strips of whole q columns. Strip k holds the
+        columns q_bounds[k] <= q < q_bounds[k+1], and every strip is at
+        least halo columns wide so halos only come from adjacent strips.
+    '''
+    radius: int
+    halo: int
+    q_bounds: typing.Tuple[int, ...]
+
+    @classmethod
+    def balanced(cls, radius: int, num_regions: int, halo: int = 1) -> Partition:
+        '''Split into strips with about the same number of cells.'''
+        index = HexIndex(radius)
+        starts = np.append(index._row_start, len(index))
+        targets = np.arange(1, num_regions) * len(index) / num_regions
+        inner = (np.searchsorted(starts, targets) - radius).tolist()
+        q_bounds = tuple([-radius] + inner + [radius + 1])
+        if min(np.diff(q_bounds)) < max(halo, 1):
+            raise ValueError(f'A map of radius {radius} cannot be split into {num_regions} strips '
+                f'that are each at least {max(halo, 1)} columns wide.')
+        return cls(radius, halo, q_bounds)
+
+    @property
+    def num_regions(self) -> int:
+        return len(self.q_bounds) - 1
+
+    def cell_bounds(self, index: HexIndex) -> np.ndarray:
+        '''First cell index of every strip, followed by the number of cells.'''
+        return np.array([column_start(index, q) for q in self.q_bounds])
+
+    def owner(self, index: HexIndex, cells: np.ndarray) -> np.ndarray:
+        '''Get the strip holding each cell.'''
+        return np.searchsorted(self.cell_bounds(index), cells, side='right') - 1
+
+
+def column_start(index: HexIndex, q: int) -> int:
+    '''Index of the first cell in column q (clipped to the map).'''
+    if q > index.radius:
+        return len(index)
+    return index._starts[max(q, -index.radius) + index.radius]
+
+
+class Region:
+    '''The strip of a partition run by one worker. Cells are addressed by
+        their global index; local arrays cover the window of owned cells
+        plus halo columns on either side, which starts at cell win_lo.
+    '''
+    def __init__(self, id: int, partition: Partition):
+        self.id = id
+        self.partition = partition
+        self.index = HexIndex(partition.radius)
+        q_lo, q_hi, h = partition.q_bounds[id], partition.q_bounds[id+1], partition.halo
+        self.lo, self.hi = column_start(self.index, q_lo), column_start(self.index, q_hi)
+        self.win_lo, self.win_hi = column_start(self.index, q_lo - h), column_start(self.index, q_hi + h)
+        self.owned = slice(self.lo - self.win_lo, self.hi - self.win_lo)
+        self._bounds = partition.cell_bounds(self.index)
+
+        # cells sent to each adjacent strip, as local slices
+        self.send: typing.Dict[int, slice] = dict()
+        if id > 0:
+            self.send[id-1] = slice(self.lo - self.win_lo, column_start(self.index, q_lo + h) - self.win_lo)
+        if id < partition.num_regions - 1:
+            self.send[id+1] = slice(column_start(self.index, q_hi - h) - self.win_lo, self.hi - self.win_lo)
+        # halo cells received from each adjacent strip
+        self.recv: typing.Dict[int, slice] = dict()
+        if id > 0:
+            self.recv[id-1] = slice(0, self.lo - self.win_lo)
+        if id < partition.num_regions - 1:
+            self.recv[id+1] = slice(self.hi - self.win_lo, self.win_hi - self.win_lo)
+        self._neighbors = None
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}(id={self.id}, cells=[{self.lo}, {self.hi}), window=[{self.win_lo}, {self.win_hi}))'
+
+    def __len__(self) -> int:
+        return self.hi - self.lo
+
+    @property
+    def window_size(self) -> int:
+        return self.win_hi - self.win_lo
+
+    @property
+    def cells(self) -> np.ndarray:
+        '''Global indices of the owned cells.'''
+        return np.arange(self.lo, self.hi)
+
+    @property
+    def neighbors(self) -> np.ndarray:
+        '''(window_size, 6) local indices of the neighbors of window cells,
+            -1 where off the map or outside the window.
+        '''
+        if self._neighbors is None:
+            q, r = self.index.q[self.win_lo:self.win_hi], self.index.r[self.win_lo:self.win_hi]
+            nbs = np.stack([self.index.indices(q + dq, r + dr) for dq, dr, _ in HEX_DIRECTIONS], axis=1)
+            inside = (nbs >= self.win_lo) & (nbs < self.win_hi)
+            self._neighbors = np.where(inside, nbs - self.win_lo, -1)
+        return self._neighbors
+
+    def local(self, cells: np.ndarray) -> np.ndarray:
+        return np.asarray(cells) - self.win_lo
+
+    def is_owned(self, cells: np.ndarray) -> np.ndarray:
+        cells = np.asarray(cells)
+        return (cells >= self.lo) & (cells < self.hi)
+
+    def owner(self, cells: np.ndarray) -> np.ndarray:
+        return np.searchsorted(self._bounds, cells, side='right') - 1
+
+
+############################# Models #############################
+
+class RegionModel:
+    '''Base class for the part of a model that runs on one worker.
+        Subclasses create local layers with add_layer, keep their agents in
+        self.agents as a structured array of agent_dtype (which must have
+        integer 'id' and 'cell' fields, cells being global indices), and
+        implement step(tick). A step may read the halo cells of the layers
+        in halo_layers but should only write owned cells, and should draw
+        random numbers with random(tick, keys) so that the results do not
+        depend on the number of workers. Agents whose cell
+        is outside the region after a step are moved to the worker that owns
+        it, so an agent may move at most halo cells per tick.
+    '''
+    agent_dtype: np.dtype = np.dtype([('id', np.int64), ('cell', np.int64)])
+    halo_layers: typing.Tuple[str, ...] = ()
+
+    def __init__(self, region: Region, params: typing.Dict[str, typing.Any], seed: int):
+        self.region = region
+        self.params = params
+        self.seed = seed
+        self.layers: typing.Dict[str, np.ndarray] = dict()
+        self.agents = np.zeros(0, dtype=self.agent_dtype)
+
+    def add_layer(self, name: str, fill: typing.Any = 0.0, dtype: typing.Any = float) -> np.ndarray:
+        '''Add a layer over the window of the region.'''
+        layer = self.layers[name] = np.full(self.region.window_size, fill, dtype=dtype)
+        return layer
+
+    def random(self, tick: int, keys: np.ndarray, stream: int = 0) -> np.ndarray:
+        '''Uniform floats in [0, 1) for agent ids or global cell indices that
+            do not depend on the partition (see keyed_random). Use tick -1
+            during setup.
+        '''
+        return keyed_random(self.seed, tick, keys, stream)
+
+    def rng(self, tick: int) -> np.random.Generator:
+        '''Random generator for a tick that depends on the seed, tick and
+            region, so its draws change with the number of workers. Prefer
+            random for results that should not.
+        '''
+        return np.random.default_rng(np.random.SeedSequence([self.seed, tick + 1, self.region.id]))
+
+    def step(self, tick: int):
+        raise NotImplementedError('Region models must implement step().')
+
+    def get_info(self) -> typing.Dict[str, typing.Any]:
+        '''Get summary information about the region after the last tick.'''
+        return dict()
+
+
+@dataclasses.dataclass
+class DistributedResult:
+    '''Final state gathered from all workers.
+        Attributes:
+            layers: every layer over the whole map in cell index order.
+            agents: all agents in id order.
+            info: get_info() of every region in region order.
+            tick_seconds: wall time of every tick, up to the barrier.
+    '''
+    partition: Partition
+    layers: typing.Dict[str, np.ndarray]
+    agents: np.ndarray
+    info: typing.List[typing.Dict[str, typing.Any]]
+    tick_seconds: typing.List[float]
+
+
+############################# Coordinator #############################
+
+class Coordinator:
+    '''Accepts worker connections, assigns regions, runs the tick barrier
+        and gathers results. Workers connect to address, in any order, and
+        must know authkey; connections that fail to authenticate are
+        dropped. Without an authkey, MASE_AUTHKEY or a random key is used.
+    '''
+    def __init__(self, num_workers: int, host: str = '127.0.0.1', port: int = 0, authkey: bytes = None):
+        self.num_workers = num_workers
+        self.authkey = authkey or default_authkey() or os.urandom(32)
+        self.listener = socket.create_server((host, port), backlog=num_workers)
+        self.address: typing.Tuple[str, int] = self.listener.getsockname()[:2]
+        self.workers: typing.List[socket.socket] = list()
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}(num_workers={self.num_workers}, address={self.address})'
+
+    def __enter__(self) -> Coordinator:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        for sock in self.workers:
+            sock.close()
+        self.workers.clear()
+        self.listener.close()
+
+    def run(self, factory: RegionModelFactory, radius: int, num_ticks: int,
+            params: typing.Dict[str, typing.Any] = None, seed: int = 0, halo: int = 1,
+            timeout: typing.Optional[float] = None) -> DistributedResult:
+        '''Run a model for num_ticks ticks on the connected workers.
+            Args:
+                factory: called in each worker as factory(region, params,
+                    seed) to make its RegionModel; it must be importable
+                    there (e.g. a RegionModel subclass in a module).
+                halo: width in columns of the halos and the largest
+                    distance an agent may move per tick.
+                timeout: seconds to wait for a worker to connect and for
+                each message from a worker, including the end of every tick.
+        '''
+        partition = Partition.balanced(radius, self.num_workers, halo)
+        self.listener.settimeout(timeout)
+        peers = list()
+        while len(self.workers) < self.num_workers:
+            try:
+                sock, _ = self.listener.accept()
+            except socket.timeout as e:
+                raise DistributedError(f'Only {len(self.workers)} of {self.num_workers} workers '
+                    f'connected within {timeout} seconds.') from e
+            sock.settimeout(timeout)
+            try:
+                _deliver_challenge(sock, self.authkey)
+            except (DistributedError, OSError):
+                sock.close()
+                continue
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.workers.append(sock)
+            host, port = json.loads(self._expect(sock, HELLO)[1])
+            peers.append((host, port))
+
+        for region_id, sock in enumerate(self.workers):
+            setup = dict(region_id=region_id, partition=partition, factory=factory,
+                params=params if params is not None else dict(), seed=seed, num_ticks=num_ticks, peers=peers)
+            send_message(sock, SETUP, payload=pickle.dumps(setup))
+
+        tick_seconds = list()
+        start = time.perf_counter()
+        for tick in range(num_ticks):
+            for sock in self.workers:
+                self._expect(sock, DONE, tick)
+            for sock in self.workers:
+                send_message(sock, GO, tick)
+            now = time.perf_counter()
+            tick_seconds.append(now - start)
+            start = now
+
+        parts, info = list(), list()
+        for sock in self.workers:
+            send_message(sock, COLLECT)
+        for sock in self.workers:
+            arrays = unpack_arrays(self._expect(sock, RESULT)[1])
+            info.append(pickle.loads(bytes(arrays.pop('info'))))
+            parts.append(arrays)
+
+        agents = np.concatenate([part.pop('agents') for part in parts])
+        agents = agents[np.argsort(agents['id'], kind='stable')]
+        layers = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+        return DistributedResult(partition, layers, agents, info, tick_seconds)
+
+    def _root_error(self, failed: socket.socket, error: str) -> str:
+        '''A failing worker drops its peer connections, so its neighbors
+            fail too; look for an error that is not a lost connection.
+        '''
+        errors = [error]
+        for sock in self.workers:
+            if sock is failed:
+                continue
+            sock.settimeout(5)
+            try:
+                kind, _, payload = recv_message(sock)
+                while kind != ERROR:
+                    kind, _, payload = recv_message(sock)
+                errors.append(payload.decode())
+            except OSError:
+                pass
+        for error in errors:
+            if 'Connection' not in error.strip().splitlines()[-1]:
+                return error
+        return errors[0]
+
+    def _expect(self, sock: socket.socket, kind: int, tick: int = None) -> typing.Tuple[int, bytes]:
+        try:
+            got, got_tick, payload = recv_message(sock)
+        except socket.timeout as e:
+            raise DistributedError(f'No message from a worker within {sock.gettimeout()} seconds '
+                f'while waiting for message {kind} for tick {tick}.') from e
+        except ConnectionError as e:
+            raise DistributedError(f'Lost connection to a worker: {e}') from e
+        if got == ERROR:
+            raise DistributedError(f'A worker failed:\n{self._root_error(sock, payload.decode())}')
+        if got != kind or (tick is not None and got_tick != tick):
+            raise DistributedError(f'Expected message {kind} for tick {tick}, got {got} for tick {got_tick}.')
+        return got_tick, payload
+
+
+def run_local(factory: RegionModelFactory, radius: int, num_workers: int, num_ticks: int,
+        params: typing.Dict[str, typing.Any] = None, seed: int = 0, halo: int = 1,
+        timeout: float = 60) -> DistributedResult:
+    '''Run a distributed model with worker processes on this machine.'''
+    with Coordinator(num_workers, authkey=os.urandom(32)) as coordinator:
+        ctx = multiprocessing.get_context()
+        procs = [ctx.Process(target=run_worker, args=coordinator.address + (coordinator.authkey,), daemon=True)
+            for _ in range(num_workers)]
+        for proc in procs:
+            proc.start()
+        try:
+            return coordinator.run(factory, radius, num_ticks, params, seed, halo, timeout=timeout)
+        except BaseException:
+            # the other workers may be blocked on a failed or hung one
+            for proc in procs:
+                proc.terminate()
+            raise
+        finally:
+            coordinator.close()
+            for proc in procs:
+                proc.join(timeout=10)
+                if proc.is_alive():
+                    proc.terminate()
+
+
+############################# Worker #############################
+
+def run_worker(host: str, port: int, authkey: bytes = None):
+    '''Connect to a coordinator, run one region and return when it is done.
+        Without an authkey, MASE_AUTHKEY is used.
+    '''
+    authkey = authkey or default_authkey()
+    if authkey is None:
+        raise AuthenticationError('Workers need an authkey; pass one or set MASE_AUTHKEY.')
+    coordinator = socket.create_connection((host, port))
+    coordinator.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    peers: typing.Dict[int, socket.socket] = dict()
+    try:
+        _answer_challenge(coordinator, authkey)
+        # peers connect to the address this host uses to reach the coordinator
+        listener = socket.create_server((coordinator.getsockname()[0], 0))
+        send_message(coordinator, HELLO, payload=json.dumps(listener.getsockname()[:2]).encode())
+        kind, _, payload = recv_message(coordinator)
+        if kind != SETUP:
+            raise DistributedError(f'Expected the setup from the coordinator, got message {kind}.')
+        setup = pickle.loads(payload)
+
+        region = Region(setup['region_id'], setup['partition'])
+        peers = _connect_peers(region, setup['peers'], listener, authkey)
+        listener.close()
+        model = setup['factory'](region, setup['params'], setup['seed'])
+        worker = _Worker(model, peers)
+
+        worker.exchange(-1)
+        for tick in range(setup['num_ticks']):
+            model.step(tick)
+            worker.exchange(tick)
+            send_message(coordinator, DONE, tick)
+            kind, _, _ = recv_message(coordinator)
+            if kind != GO:
+                raise DistributedError(f'Expected the go-ahead for tick {tick}, got message {kind}.')
+
+        recv_message(coordinator)
+        arrays = {name: layer[region.owned] for name, layer in model.layers.items()}
+        arrays['agents'] = model.agents
+        arrays['info'] = np.frombuffer(pickle.dumps(model.get_info()), dtype=np.uint8)
+        send_message(coordinator, RESULT, payload=pack_arrays(arrays))
+    except BaseException:
+        try:
+            send_message(coordinator, ERROR, payload=traceback.format_exc().encode())
+        except OSError:
+            pass
+        raise
+    finally:
+        for sock in peers.values():
+            sock.close()
+        coordinator.close()
+
+
+def _connect_peers(region: Region, addresses: typing.List[typing.Tuple[str, int]],
+        listener: socket.socket, authkey: bytes) -> typing.Dict[int, socket.socket]:
+    '''Connect to the next region and accept the previous one, dropping
+        connections that fail to authenticate.
+    '''
+    peers = dict()
+    if region.id + 1 < region.partition.num_regions:
+        sock = socket.create_connection(tuple(addresses[region.id + 1]))
+        _answer_challenge(sock, authkey)
+        send_message(sock, HELLO, region.id)
+        peers[region.id + 1] = sock
+    if region.id > 0:
+        while True:
+            sock, _ = listener.accept()
+            try:
+                _deliver_challenge(sock, authkey)
+                break
+            except (DistributedError, OSError):
+                sock.close()
+        kind, peer_id, _ = recv_message(sock, max_size=0)
+        if kind != HELLO or peer_id != region.id - 1:
+            raise DistributedError(f'Region {region.id} expected region {region.id - 1} to connect, got {peer_id}.')
+        peers[region.id - 1] = sock
+    for sock in peers.values():
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return peers
+
+
+class _Worker:
+    def __init__(self, model: RegionModel, peers: typing.Dict[int, socket.socket]):
+        self.model = model
+        self.region = model.region
+        self.peers = peers
+
+    def exchange(self, tick: int):
+        '''Send halo values and emigrating agents to adjacent regions and
+            receive theirs, as one message per neighbor.
+        '''
+        model, region = self.model, self.region
+        agents = model.agents
+        owners = region.owner(agents['cell'])
+        leaving = owners != region.id
+        if leaving.any() and not np.isin(owners[leaving], list(self.peers)).all():
+            raise DistributedError(f'Agents in region {region.id} moved farther than the halo '
+                f'width of {region.partition.halo} in tick {tick}.')
+
+        outgoing = dict()
+        for peer_id in self.peers:
+            arrays = {name: model.layers[name][region.send[peer_id]] for name in model.halo_layers}
+            arrays['agents'] = agents[owners == peer_id]
+            outgoing[peer_id] = pack_arrays(arrays)
+        model.agents = agents[~leaving]
+
+        # send from a thread so that two workers sending large messages to
+        # each other cannot block on full socket buffers
+        sender = threading.Thread(target=self._send_all, args=(tick, outgoing))
+        sender.start()
+        arrived = [model.agents]
+        try:
+            for peer_id in sorted(self.peers):
+                kind, got_tick, payload = recv_message(self.peers[peer_id])
+                if kind != EXCHANGE or got_tick != tick:
+                    raise DistributedError(f'Region {region.id} expected the exchange for tick {tick}, '
+                        f'got message {kind} for tick {got_tick}.')
+                arrays = unpack_arrays(payload)
+                arrived.append(arrays.pop('agents'))
+                for name, values in arrays.items():
+                    model.layers[name][region.recv[peer_id]] = values
+        finally:
+            sender.join()
+        if len(arrived) > 1:
+            agents = np.concatenate(arrived)
+            model.agents = agents[np.argsort(agents['id'], kind='stable')]
+
+    def _send_all(self, tick: int, outgoing: typing.Dict[int, bytes]):
+        for peer_id, payload in outgoing.items():
+            try:
+                send_message(self.peers[peer_id], EXCHANGE, tick, payload)
+            except OSError:
+                # the receiving side reports the lost connection
+                pass
+
+
+############################# Command Line #############################
+
+def main(argv: typing.List[str] = None):
+    parser = argparse.ArgumentParser(description='Run a distributed simulation worker.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    worker = subparsers.add_parser('worker', help='connect to a coordinator and run one region; '
+        'set MASE_AUTHKEY to the coordinator\'s authkey')
+    worker.add_argument('host')
+    worker.add_argument('port', type=int)
+    args = parser.parse_args(argv)
+    run_worker(args.host, args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -22,3 +22,6 @@ class AgentNotAllowedError(Exception):
 
 class AgentIsNotHashableError(Exception):
     pass
+
+class StaleAgentIDError(AgentDoesNotExistError):
+    pass
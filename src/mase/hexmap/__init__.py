@@ -1,2 +1,30 @@
+from .._lazy import attach
 
-from .hexpos import HexPos, HexUnit, NoPathFound
+attach(__name__, globals(), {
+    'HexPos': '.hexpos',
+    'HexUnit': '.hexpos',
+    'NoPathFound': '.hexpos',
+    'TargetInAvoidSet': '.hexpos',
+    'HexIndex': '.hexindex',
+    'bfs_distances': '.distance',
+    'bfs_index': '.distance',
+    'Field': '.fields',
+    'disk_aggregate': '.neighborhood',
+    'HashIndex': '.stateindex',
+    'SortedIndex': '.stateindex',
+    'MovementRule': '.movement',
+    'MovementRules': '.movement',
+    'Passable': '.movement',
+    'TerrainCost': '.movement',
+    'MaxOccupancy': '.movement',
+    'MaxStep': '.movement',
+    'FactionZones': '.movement',
+    'HexMap': '.hexmap',
+    'HexMapFork': '.fork',
+    'ArrayHexMap': '.arrayhexmap',
+    'Visibility': '.visibility',
+    'Connectivity': '.connectivity',
+    'HierarchicalPathfinder': '.hierarchical',
+    'CooperativePathfinder': '.cooperative',
+    'ReservationTable': '.cooperative',
+})
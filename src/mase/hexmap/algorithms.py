@@ -1,6 +1,9 @@
+from __future__ import annotations
 
 import typing
 
+from ..profiling import profiler
+
 if typing.TYPE_CHECKING:
     from mase.hexmap.hexpos import HexPos
 
@@ -20,12 +23,15 @@ def a_star(
     came_from = {}
     g_score = {start: 0}
     f_score = {start: start.dist(goal)}
+    expanded = 0
 
     while open_set:
         current = min(open_set, key=lambda pos: f_score.get(pos, float('inf')))
         open_set.remove(current)
+        expanded += 1
 
         if current == goal:
+            if profiler.enabled: profiler.count('a_star_expanded', expanded)
             path = []
             while current in came_from:
                 path.append(current)
@@ -50,4 +56,5 @@ def a_star(
                 if neighbor not in open_set:
                     open_set.append(neighbor)
 
+    if profiler.enabled: profiler.count('a_star_expanded', expanded)
     return []
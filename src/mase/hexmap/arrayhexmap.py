@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+import dataclasses
+import functools
+import os
+import typing
+import numpy as np
+
+from ..location import Location, LocationState, Locations
+from .hexpos import HexPos
+from .hexindex import HexIndex
+from .hexmap import HexMap
+from ..errors import *
+from ..profiling import profiler
+
+
+class ArrayHexMap(HexMap):
+    '''HexMap for very large radii where location state lives in typed arrays.
+        Each field of the default LocationState becomes one array over the
+        cell index. If path is given the arrays are memory-mapped .npy files
+        in that directory, and existing files are reopened instead of being
+        re-initialized. Location objects are only created when accessed.
+    '''
+    layers: typing.Dict[str, np.ndarray]
+
+    def __init__(self, radius: int, default_loc_state: LocationState = None, path: str = None):
+        self.radius = radius
+        self.index = HexIndex(radius)
+        self.path = path
+
+        self.pos_loc = dict()
+        self.agent_positions = dict()
+        self.fields = dict()
+        self.state_indexes = dict()
+        self.layer_masks = dict()
+        self.layer_arrays = dict()
+        self.movement_rules = None
+        self.strict_movement = False
+
+        self.default_loc_state = default_loc_state
+        self.layers = dict()
+        if default_loc_state is not None:
+            if path is not None:
+                os.makedirs(path, exist_ok=True)
+            for field in dataclasses.fields(default_loc_state):
+                value = getattr(default_loc_state, field.name)
+                self.layers[field.name] = self._open_layer(field.name, value)
+            self._state_type = array_state_type(type(default_loc_state))
+
+    @classmethod
+    def from_layers(cls, radius: int, default_loc_state: LocationState, layers: typing.Dict[str, np.ndarray]) -> ArrayHexMap:
+        '''Create a map that uses the provided arrays as layers without copying them.
+            Fields missing from layers are filled with their default values.
+        '''
+        hexmap = cls(radius)
+        hexmap.default_loc_state = default_loc_state
+        for field in dataclasses.fields(default_loc_state):
+            if field.name in layers:
+                if layers[field.name].shape != (len(hexmap.index),):
+                    raise ValueError(f'Layer "{field.name}" has shape {layers[field.name].shape}, '
+                        f'expected ({len(hexmap.index)},).')
+                hexmap.layers[field.name] = layers[field.name]
+            else:
+                hexmap.layers[field.name] = hexmap._open_layer(field.name, getattr(default_loc_state, field.name))
+        hexmap._state_type = array_state_type(type(default_loc_state))
+        return hexmap
+
+    def _open_layer(self, name: str, value: typing.Any) -> np.ndarray:
+        '''Open an existing layer file or create and fill a new one.'''
+        dtype = np.asarray(value).dtype
+        if dtype == object:
+            raise TypeError(f'Location state field "{name}" with value {value!r} '
+                'cannot be stored in a typed array.')
+
+        if self.path is None:
+            return np.full(len(self.index), value, dtype=dtype)
+
+        fpath = os.path.join(self.path, f'{name}.npy')
+        if os.path.exists(fpath):
+            layer = np.load(fpath, mmap_mode='r+')
+            if layer.shape != (len(self.index),) or layer.dtype != dtype:
+                raise ValueError(f'Layer file {fpath} has shape {layer.shape} and dtype '
+                    f'{layer.dtype}, expected ({len(self.index)},) and {dtype}.')
+            return layer
+
+        layer = np.lib.format.open_memmap(fpath, mode='w+', dtype=dtype, shape=(len(self.index),))
+        layer[:] = value
+        return layer
+
+    ############################# Dunders #############################
+    def __iter__(self) -> iter:
+        '''Iterate over all locations. Note that this materializes every location.'''
+        return (self.loc(pos) for pos in self.index)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    ############################# Useful for User #############################
+    def region(self, center: HexPos, dist: int) -> set:
+        '''Get set of positions within the given distance.'''
+        if profiler.enabled: profiler.count('region_calls')
+        return {pos for pos in center.region(dist) if pos in self.index}
+
+    def flush(self):
+        '''Write memory-mapped layers to disk.'''
+        for layer in self.layers.values():
+            if isinstance(layer, np.memmap):
+                layer.flush()
+
+    @property
+    def num_materialized(self) -> int:
+        '''Number of Location objects that have been created so far.'''
+        return len(self.pos_loc)
+
+    ############################# Layers #############################
+    def get_layer(self, name: str) -> np.ndarray:
+        '''Get the array holding a location state field for every cell.'''
+        try:
+            return self.layers[name]
+        except KeyError:
+            raise ValueError(f'"{name}" is not a field of the location state of {self}.')
+
+    def layer_values(self, name: str, inds: np.ndarray) -> np.ndarray:
+        '''Get a location state field at cell indices.'''
+        return self.get_layer(name)[inds]
+
+    def set_layer(self, name: str, values: np.ndarray):
+        '''Write a location state field for every cell in index order.'''
+        self.get_layer(name)[:] = values
+        self._layer_changed(name)
+
+    def layer_mask(self, name: str) -> np.ndarray:
+        '''Get the array of a location state field; it is always current
+            and is truthy where the field is set.
+        '''
+        return self.get_layer(name)
+
+    def layer_array(self, name: str) -> np.ndarray:
+        '''Get the array of a location state field, which is always current.'''
+        return self.get_layer(name)
+
+    ############################# Access/Lookup Locations/Positions/Agents #############################
+    def loc(self, pos: HexPos) -> Location:
+        '''Get the location at a given position, creating it on first access.'''
+        try:
+            return self.pos_loc[pos]
+        except KeyError:
+            pass
+
+        ind = self.index.index(pos)
+        loc = Location(self.index.pos(ind))
+        if self.default_loc_state is not None:
+            loc.state = self._state_type.view(self.layers, ind)
+        self.pos_loc[loc.pos] = loc
+        return loc
+
+    def positions(self) -> typing.Set[HexPos]:
+        '''Get a set of positions in this map.'''
+        return set(self.index)
+
+    def locations(self) -> Locations:
+        '''Get locations associated with this map. Note that this materializes every location.'''
+        return Locations(self)
+
+    ############################# Other Helpers #############################
+    def get_info(self) -> typing.List[dict]:
+        '''Get dictionary information about each location.'''
+        with profiler.phase('record'):
+            return [loc.get_info() for loc in self]
+
+
+@functools.lru_cache(maxsize=None)
+def array_state_type(state_type: type) -> type:
+    '''Create a subclass of the state dataclass whose fields read and write array layers.'''
+    def make_property(name: str) -> property:
+        def fget(self):
+            return self._layers[name].item(self._index)
+        def fset(self, value):
+            self._layers[name][self._index] = value
+        return property(fget, fset)
+
+    namespace = {f.name: make_property(f.name) for f in dataclasses.fields(state_type)}
+    namespace['__slots__'] = ('_layers', '_index')
+
+    @classmethod
+    def view(cls, layers: typing.Dict[str, np.ndarray], index: int):
+        obj = cls.__new__(cls)
+        object.__setattr__(obj, '_layers', layers)
+        object.__setattr__(obj, '_index', index)
+        return obj
+    namespace['view'] = view
+
+    def materialize(self) -> LocationState:
+        '''Create a regular state object with the current values.'''
+        return state_type(**{f.name: getattr(self, f.name) for f in dataclasses.fields(state_type) if f.init})
+    namespace['deepcopy'] = materialize
+    namespace['__copy__'] = materialize
+    namespace['__deepcopy__'] = lambda self, memo: materialize(self)
+
+    return type(f'Array{state_type.__name__}', (state_type,), namespace)
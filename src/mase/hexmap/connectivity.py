@@ -0,0 +1,155 @@
+from __future__ import annotations
+
+import typing
+import numpy as np
+
+from .hexpos import HexPos
+from .hexmap import HexMap
+from ..profiling import profiler
+
+
+class Connectivity:
+    '''Connected components of the passable cells of a map.
+        Components are kept in a union-find forest over cell indices, so
+        connected answers in near-constant time. Opening a cell joins it to
+        the components of its open neighbors. Blocking a cell can only split
+        the component it was in, and only if its open neighbors are not
+        already joined around it, in which case that one component is
+        relabeled by a breadth-first search. A blocked cell stays in the
+        forest for the cells below it, so a reopened cell gets a fresh node
+        and the forest is rebuilt once it has grown to twice the number of
+        cells. Passability is read from a boolean location state attribute;
+        change it through set_blocked (or call refresh) to keep the index
+        current.
+    '''
+    def __init__(self, hexmap: HexMap, blocked: str = 'blocked'):
+        self.hexmap = hexmap
+        self.index = hexmap.index
+        self.blocked_attr = blocked
+        self.blocked = np.asarray(hexmap.get_layer(blocked), dtype=bool).copy()
+        self._neighbors = self.index.neighbors.tolist()
+        self._open = (~self.blocked).tolist()
+        self._rebuild()
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self.hexmap}, blocked="{self.blocked_attr}")'
+
+    def _rebuild(self):
+        self.parent = _label_components(self.index.neighbors, self.blocked).tolist()
+        self.node = list(range(len(self.index)))
+
+    ############################# Queries #############################
+    def find(self, i: int) -> int:
+        '''Get the root node of the component holding cell i.'''
+        parent = self.parent
+        x = self.node[i]
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def component(self, pos: HexPos) -> typing.Optional[int]:
+        '''Get an id for the component holding pos, or None if pos is blocked.'''
+        i = self.index.index(pos)
+        return self.find(i) if self._open[i] else None
+
+    def connected(self, a: HexPos, b: HexPos) -> bool:
+        '''Check whether a path of open cells joins a and b.'''
+        if a not in self.index or b not in self.index:
+            return False
+        i, j = self.index.index(a), self.index.index(b)
+        return self._open[i] and self._open[j] and self.find(i) == self.find(j)
+
+    def num_components(self) -> int:
+        return len({self.find(i) for i, is_open in enumerate(self._open) if is_open})
+
+    ############################# Updating Passability #############################
+    def set_blocked(self, pos: HexPos, blocked: bool):
+        '''Set passability of a cell in the map and update the components.'''
+        self.hexmap.set_state(pos, self.blocked_attr, blocked)
+        self._update(self.index.index(pos), blocked)
+
+    def refresh(self):
+        '''Re-read the blocked layer from the map after it was changed directly.'''
+        blocked = np.asarray(self.hexmap.get_layer(self.blocked_attr), dtype=bool)
+        for i in np.flatnonzero(blocked != self.blocked).tolist():
+            self._update(i, bool(blocked[i]))
+
+    def _update(self, i: int, blocked: bool):
+        if self.blocked[i] == blocked:
+            return
+        self.blocked[i] = blocked
+        self._open[i] = not blocked
+        if blocked:
+            self._split(i)
+        elif len(self.parent) >= 2*len(self.index):
+            self._rebuild()
+        else:
+            self.node[i] = len(self.parent)
+            self.parent.append(self.node[i])
+            for j in self._neighbors[i]:
+                if j >= 0 and self._open[j]:
+                    self._union(i, j)
+
+    def _union(self, i: int, j: int):
+        ri, rj = self.find(i), self.find(j)
+        if ri != rj:
+            self.parent[max(ri, rj)] = min(ri, rj)
+
+    def _split(self, i: int):
+        '''Relabel the component that held a newly blocked cell if it may have split.'''
+        ring = [j >= 0 and self._open[j] for j in self._neighbors[i]]
+        # neighbors are in order around the cell, so one contiguous run of
+        # open neighbors stays connected without passing through it
+        if sum(1 for k in range(6) if ring[k] and not ring[k-1]) <= 1:
+            return
+
+        reached = set()
+        relabeled = 0
+        for start in self._neighbors[i]:
+            if start < 0 or not self._open[start] or start in reached:
+                continue
+            frontier = [start]
+            reached.add(start)
+            root = self.node[start]
+            self.parent[root] = root
+            while frontier:
+                u = frontier.pop()
+                self.parent[self.node[u]] = root
+                relabeled += 1
+                for v in self._neighbors[u]:
+                    if v >= 0 and self._open[v] and v not in reached:
+                        reached.add(v)
+                        frontier.append(v)
+        if profiler.enabled: profiler.count('connectivity_relabeled', relabeled)
+
+
+def _label_components(neighbors: np.ndarray, blocked: np.ndarray) -> np.ndarray:
+    '''Vectorized component labeling by hooking roots onto the smaller root
+        across every open edge and then pointer jumping, until stable.
+        Every cell ends up pointing directly at its root, which is the
+        smallest index in its component.
+    '''
+    n = len(blocked)
+    u = np.repeat(np.arange(n), 3)
+    v = neighbors[:, :3].ravel()
+    keep = (v >= 0)
+    u, v = u[keep], v[keep]
+    keep = ~blocked[u] & ~blocked[v]
+    u, v = u[keep], v[keep]
+
+    labels = np.arange(n)
+    while True:
+        lu, lv = labels[u], labels[v]
+        low = np.minimum(lu, lv)
+        hooked = labels.copy()
+        np.minimum.at(hooked, lu, low)
+        np.minimum.at(hooked, lv, low)
+        while True:
+            jumped = hooked[hooked]
+            if np.array_equal(jumped, hooked):
+                break
+            hooked = jumped
+        if np.array_equal(hooked, labels):
+            return labels
+        labels = hooked
@@ -0,0 +1,203 @@
+from __future__ import annotations
+
+import collections
+import heapq
+import itertools
+import typing
+import numpy as np
+
+from .hexpos import HexPos, HEX_DIRECTIONS, NoPathFound
+from .hexmap import HexMap
+from ..profiling import profiler
+
+AgentKey = typing.Hashable
+
+
+class ReservationTable:
+    '''Space-time reservations keyed by (cell, tick).
+        Cell reservations are counted so that cells may hold more than one
+        agent, and moves between cells are reserved too so that two agents
+        cannot swap places through each other in one tick.
+    '''
+    def __init__(self):
+        self.cells: typing.Dict[typing.Tuple[HexPos, int], int] = collections.defaultdict(int)
+        self.moves: typing.Set[typing.Tuple[HexPos, HexPos, int]] = set()
+        self.by_agent: typing.Dict[AgentKey, typing.List[typing.Tuple[HexPos, int]]] = dict()
+        self.moves_by_agent: typing.Dict[AgentKey, typing.List[typing.Tuple[HexPos, HexPos, int]]] = dict()
+
+    def __len__(self) -> int:
+        return len(self.cells)
+
+    def count(self, pos: HexPos, tick: int) -> int:
+        '''Number of agents holding the cell at a tick.'''
+        return self.cells.get((pos, tick), 0)
+
+    def is_move_reserved(self, src: HexPos, dst: HexPos, tick: int) -> bool:
+        '''Check whether another agent moves from dst to src arriving at tick.'''
+        return (dst, src, tick) in self.moves
+
+    def reserve_path(self, agent: AgentKey, path: typing.Sequence[HexPos], start_tick: int):
+        '''Reserve path[k] at start_tick + k, replacing earlier reservations of the agent.'''
+        self.release(agent)
+        cells = [(pos, start_tick + k) for k, pos in enumerate(path)]
+        moves = [(a, b, start_tick + k + 1) for k, (a, b) in enumerate(zip(path[:-1], path[1:])) if a != b]
+        for key in cells:
+            self.cells[key] += 1
+        self.moves.update(moves)
+        self.by_agent[agent] = cells
+        self.moves_by_agent[agent] = moves
+
+    def release(self, agent: AgentKey):
+        '''Remove all reservations held by the agent.'''
+        for key in self.by_agent.pop(agent, []):
+            self.cells[key] -= 1
+            if not self.cells[key]:
+                del self.cells[key]
+        for move in self.moves_by_agent.pop(agent, []):
+            self.moves.discard(move)
+
+    def prune(self, tick: int):
+        '''Drop reservations for ticks before tick.'''
+        for agent, cells in self.by_agent.items():
+            for key in cells:
+                if key[1] < tick:
+                    self.cells[key] -= 1
+                    if not self.cells[key]:
+                        del self.cells[key]
+            self.by_agent[agent] = [key for key in cells if key[1] >= tick]
+        for agent, moves in self.moves_by_agent.items():
+            for move in moves:
+                if move[2] < tick:
+                    self.moves.discard(move)
+            self.moves_by_agent[agent] = [move for move in moves if move[2] >= tick]
+
+
+class CooperativePathfinder:
+    '''Windowed cooperative A* (WHCA*) over a map.
+        Each agent plans in (position, tick) space around the reservations
+        made by agents that planned before it, so the plans don't collide.
+        Plans only look window ticks ahead, which keeps replanning cheap,
+        and next_pos replans once half of the window is used. Cell capacity
+        is either a fixed number or the name of an integer location state
+        attribute, and cells with capacity zero are impassable. By default
+        it is the limit of the map's MaxOccupancy movement rules, or one
+        agent per cell if the map has none.
+    '''
+    def __init__(self, hexmap: HexMap, window: int = 8, capacity: typing.Union[int, str, None] = None):
+        self.hexmap = hexmap
+        self.index = hexmap.index
+        self.window = window
+        self.capacity_source = capacity
+        self.refresh()
+        self.table = ReservationTable()
+        self.plans: typing.Dict[AgentKey, typing.Tuple[int, HexPos, typing.List[HexPos]]] = dict()
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self.hexmap}, window={self.window})'
+
+    def refresh(self):
+        '''Re-read per-cell capacity from the map.'''
+        capacity = self.capacity_source
+        if capacity is None:
+            rules = self.hexmap.movement_rules
+            capacity = rules.capacity() if rules is not None else None
+            capacity = 1 if capacity is None else capacity
+        if isinstance(capacity, str):
+            capacity = self.hexmap.get_layer(capacity)
+        if np.ndim(capacity) == 0:
+            self.capacity = np.full(len(self.index), capacity, dtype=int)
+        else:
+            self.capacity = np.array(capacity, dtype=int)
+
+    def cell_capacity(self, pos: HexPos) -> int:
+        if pos not in self.index:
+            return 0
+        return int(self.capacity[self.index.index(pos)])
+
+    ############################# Planning #############################
+    def plan(self, agent: AgentKey, start: HexPos, goal: HexPos, tick: int) -> typing.List[HexPos]:
+        '''Plan and reserve window ticks of movement toward goal. The result
+            holds the agent's position for ticks tick..tick+window.
+        '''
+        self.table.release(agent)
+        path = self._search(start, goal, tick)
+        self.table.reserve_path(agent, path, tick)
+        self.plans[agent] = (tick, goal, path)
+        return path
+
+    def plan_all(self, requests: typing.Iterable[typing.Tuple[AgentKey, HexPos, HexPos]], tick: int) -> typing.Dict[AgentKey, typing.List[HexPos]]:
+        '''Plan for (agent, start, goal) requests in priority order.'''
+        requests = list(requests)
+        for agent, _, _ in requests:
+            self.table.release(agent)
+        return {agent: self.plan(agent, start, goal, tick) for agent, start, goal in requests}
+
+    def next_pos(self, agent: AgentKey, start: HexPos, goal: HexPos, tick: int) -> HexPos:
+        '''Get the agent's position for tick+1. Replans when half of the
+            window has been used, the goal changed, or the agent is off-plan.
+        '''
+        if agent in self.plans:
+            plan_tick, plan_goal, path = self.plans[agent]
+            k = tick - plan_tick
+            if plan_goal == goal and 0 <= k < max(self.window // 2, 1) and path[k] == start:
+                return path[k+1]
+        return self.plan(agent, start, goal, tick)[1]
+
+    def remove_agent(self, agent: AgentKey):
+        '''Forget the agent's plan and reservations.'''
+        self.table.release(agent)
+        self.plans.pop(agent, None)
+
+    def prune(self, tick: int):
+        '''Drop reservations that are in the past.'''
+        self.table.prune(tick)
+
+    ############################# Search #############################
+    def _search(self, start: HexPos, goal: HexPos, tick: int) -> typing.List[HexPos]:
+        '''A* in (position, tick) space up to the window horizon.'''
+        horizon = tick + self.window
+        counter = itertools.count()
+        g_score = {(start, tick): 0}
+        came_from: typing.Dict[typing.Tuple[HexPos, int], typing.Tuple[HexPos, int]] = dict()
+        heap = [(start.distance(goal), next(counter), start, tick)]
+        best = None
+        expanded = 0
+        while heap:
+            _, _, pos, t = heapq.heappop(heap)
+            expanded += 1
+            node = (pos, t)
+            if t == horizon:
+                # the heuristic is consistent, so the first node at the horizon is the best one
+                best = node
+                break
+            for nxt in self._moves(pos, t):
+                key = (nxt, t + 1)
+                # waiting at the goal is free
+                cost = g_score[node] + (0 if pos == goal and nxt == goal else 1)
+                if cost < g_score.get(key, float('inf')):
+                    g_score[key] = cost
+                    came_from[key] = node
+                    heapq.heappush(heap, (cost + nxt.distance(goal), next(counter), nxt, t + 1))
+
+        if profiler.enabled: profiler.count('coop_expanded', expanded)
+        if best is None:
+            raise NoPathFound.from_src_and_dest(start, goal)
+
+        path = [best[0]]
+        node = best
+        while node in came_from:
+            node = came_from[node]
+            path.append(node[0])
+        path.reverse()
+        return path
+
+    def _moves(self, pos: HexPos, t: int) -> typing.List[HexPos]:
+        '''Moves available from pos at tick t: the six neighbors and waiting.'''
+        moves = list()
+        for nxt in [pos] + [pos.offset(*d) for d in HEX_DIRECTIONS]:
+            if self.table.count(nxt, t + 1) >= self.cell_capacity(nxt):
+                continue
+            if nxt != pos and self.table.is_move_reserved(pos, nxt, t + 1):
+                continue
+            moves.append(nxt)
+        return moves
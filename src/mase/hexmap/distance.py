@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import typing
+import numpy as np
+
+from .hexpos import HexPos, HEX_DIRECTIONS
+from .hexindex import HexIndex
+from ..profiling import profiler
+
+
+def bfs_distances(
+    sources: typing.Iterable[HexPos],
+    targets: typing.Optional[typing.Iterable[HexPos]] = None,
+    avoid: typing.Optional[typing.Set[HexPos]] = None,
+    max_dist: typing.Optional[int] = None,
+    radius: typing.Optional[int] = None,
+    stop_at: typing.Optional[str] = 'any',
+) -> typing.Dict[HexPos, int]:
+    '''Breadth-first step distances from the nearest source, expanding only the frontier.
+        Args:
+            targets: positions of interest; with stop_at='any' the search stops
+                after the ring where the first target is found, with 'all' once
+                every reachable target is found, and with None it never stops early.
+            avoid: positions that cannot be entered.
+            max_dist: do not search further than this many steps.
+            radius: only search positions within this distance of the origin.
+                Without radius or max_dist the search only ends if avoid
+                encloses the sources.
+        Returns:
+            distances of every position reached, including the sources at 0.
+    '''
+    avoid = avoid if avoid is not None else set()
+    remaining = set(targets) - avoid if targets is not None else set()
+    dist = {pos: 0 for pos in sources}
+    remaining -= dist.keys()
+    if targets is not None and stop_at is not None and len(remaining) < len(set(targets) - avoid):
+        if stop_at == 'any' or not remaining:
+            return dist
+
+    frontier = list(dist)
+    d = 0
+    while frontier and (max_dist is None or d < max_dist):
+        d += 1
+        next_frontier = list()
+        for pos in frontier:
+            for dq, dr, ds in HEX_DIRECTIONS:
+                nxt = HexPos(pos.q + dq, pos.r + dr, pos.s + ds)
+                if nxt in dist or nxt in avoid:
+                    continue
+                if radius is not None and max(abs(nxt.q), abs(nxt.r), abs(nxt.s)) > radius:
+                    continue
+                dist[nxt] = d
+                next_frontier.append(nxt)
+        frontier = next_frontier
+
+        if remaining and stop_at is not None:
+            found = remaining.intersection(frontier)
+            if found:
+                remaining -= found
+                if stop_at == 'any' or not remaining:
+                    break
+
+    if profiler.enabled: profiler.count('bfs_expanded', len(dist))
+    return dist
+
+
+def bfs_index(
+    index: HexIndex,
+    sources: typing.Sequence[int],
+    blocked: typing.Optional[np.ndarray] = None,
+    targets: typing.Optional[typing.Sequence[int]] = None,
+    max_dist: typing.Optional[int] = None,
+    stop_at: typing.Optional[str] = None,
+) -> np.ndarray:
+    '''Vectorized breadth-first search over the cells of a bounded map.
+        Each ring is expanded with one gather over the neighbor index, so
+        the work per ring is proportional to the frontier. Arguments mean
+        the same as in bfs_distances but are given as cell indices and a
+        boolean blocked array.
+    Returns:
+        distance of every cell, or -1 for cells that were not reached.
+    '''
+    neighbors = index.neighbors
+    dist = np.full(len(index), -1, dtype=np.int64)
+    # the extra entry absorbs -1 (off the map) neighbor indices
+    closed = np.zeros(len(index) + 1, dtype=bool)
+    closed[-1] = True
+    if blocked is not None:
+        closed[:-1] |= blocked
+
+    frontier = np.unique(np.asarray(sources, dtype=np.int64))
+    dist[frontier] = 0
+    closed[frontier] = True
+    targets = np.asarray(targets, dtype=np.int64) if targets is not None else None
+
+    d = 0
+    while len(frontier) and (max_dist is None or d < max_dist):
+        if targets is not None and stop_at is not None:
+            found = dist[targets] >= 0
+            if (stop_at == 'any' and found.any()) or (stop_at == 'all' and found.all()):
+                break
+        d += 1
+        candidates = neighbors[frontier].ravel()
+        frontier = np.unique(candidates[~closed[candidates]])
+        dist[frontier] = d
+        closed[frontier] = True
+
+    if profiler.enabled: profiler.count('bfs_expanded', int((dist >= 0).sum()))
+    return dist
+
+
+def bfs_index_sparse(
+    index: HexIndex,
+    sources: typing.Sequence[int],
+    blocked: typing.Optional[np.ndarray] = None,
+    targets: typing.Optional[typing.Sequence[int]] = None,
+    max_dist: typing.Optional[int] = None,
+    stop_at: typing.Optional[str] = None,
+) -> typing.Dict[int, int]:
+    '''Breadth-first search like bfs_index that keeps visited cells in a
+        dict instead of full-map arrays, so a query that stops early costs
+        only the cells it reaches. Cells where blocked is truthy cannot be
+        entered.
+    Returns:
+        distances of every cell reached, including the sources at 0.
+    '''
+    neighbors = index.neighbors
+    dist = {int(i): 0 for i in sources}
+    targets = set(int(i) for i in targets) if targets is not None else None
+    num_found = len(targets & dist.keys()) if targets is not None else 0
+
+    frontier = list(dist)
+    d = 0
+    while frontier and (max_dist is None or d < max_dist):
+        if targets is not None and stop_at is not None:
+            if (stop_at == 'any' and num_found) or (stop_at == 'all' and num_found == len(targets)):
+                break
+        d += 1
+        next_frontier = list()
+        for row in neighbors[frontier].tolist():
+            for i in row:
+                if i < 0 or i in dist or (blocked is not None and blocked[i]):
+                    continue
+                dist[i] = d
+                next_frontier.append(i)
+                if targets is not None and i in targets:
+                    num_found += 1
+        frontier = next_frontier
+
+    if profiler.enabled: profiler.count('bfs_expanded', len(dist))
+    return dist
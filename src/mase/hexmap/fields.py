@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import typing
+import numpy as np
+
+from .hexpos import HexPos, HEX_DIRECTIONS
+from .hexindex import HexIndex
+from ..profiling import profiler
+
+_DIRECTIONS = np.array(HEX_DIRECTIONS, dtype=float)
+
+
+class Field:
+    '''Scalar field over the cells of a map, stored as a float array in
+        index order. All kernels act on the whole map at once using the
+        neighbor index; neighbors that are off the map are ignored, so
+        diffusion conserves the total amount in the field.
+    '''
+    __slots__ = ['index', 'values', '_neighbors', '_degree']
+
+    def __init__(self, index: HexIndex, values: typing.Optional[np.ndarray] = None, fill: float = 0.0):
+        self.index = index
+        if values is None:
+            values = np.full(len(index), fill, dtype=float)
+        elif np.shape(values) != (len(index),):
+            raise ValueError(f'Field values have shape {np.shape(values)}, expected ({len(index)},).')
+        self.values = np.asarray(values, dtype=float)
+        # the appended cell stands in for off-map neighbors and always holds 0
+        self._neighbors = np.where(index.neighbors >= 0, index.neighbors, len(index))
+        self._degree = (index.neighbors >= 0).sum(axis=1)
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}(n={len(self.values)}, total={self.total():.4g})'
+
+    def total(self) -> float:
+        return float(self.values.sum())
+
+    def copy(self) -> Field:
+        '''Get a field with a copy of the values that shares the neighbor index.'''
+        field = Field.__new__(Field)
+        field.index, field._neighbors, field._degree = self.index, self._neighbors, self._degree
+        field.values = self.values.copy()
+        return field
+
+    ############################# Reading #############################
+    def at(self, pos: HexPos) -> float:
+        '''Get the value at a position.'''
+        return float(self.values[self.index.index(pos)])
+
+    def gradient(self, pos: HexPos) -> typing.Tuple[float, float, float]:
+        '''Get the gradient at a position as a (q, r, s) cube vector.'''
+        return tuple(self.gradients(np.array([self.index.index(pos)]))[0].tolist())
+
+    def gradients(self, inds: np.ndarray) -> np.ndarray:
+        '''Vectorized gradients at cell indices as an (n, 3) array. Each
+            neighbor contributes its direction weighted by how much larger
+            its value is; off-map neighbors contribute nothing.
+        '''
+        inds = np.asarray(inds)
+        padded = np.append(self.values, 0.0)
+        diffs = padded[self._neighbors[inds]] - self.values[inds][:, None]
+        diffs[self._neighbors[inds] == len(self.values)] = 0.0
+        return diffs @ _DIRECTIONS / 3
+
+    def uphill(self, pos: HexPos) -> HexPos:
+        '''Get the neighbor of pos (or pos itself) with the largest value.'''
+        i = self.index.index(pos)
+        candidates = [i] + [j for j in self.index.neighbors[i].tolist() if j >= 0]
+        return self.index.pos(max(candidates, key=lambda j: self.values[j]))
+
+    ############################# Kernels #############################
+    def diffuse(self, rate: float, steps: int = 1, blocked: typing.Optional[np.ndarray] = None):
+        '''Each step, every cell sends rate/6 of its value to each neighbor.
+            Args:
+                rate: fraction of the value that leaves a cell with all six
+                    neighbors; must be in [0, 1].
+                blocked: boolean array of cells that neither send nor receive.
+        '''
+        if not 0 <= rate <= 1:
+            raise ValueError(f'Diffusion rate must be in [0, 1], got {rate}.')
+        n = len(self.values)
+        neighbors, degree = self._neighbors, self._degree
+        if blocked is not None:
+            is_open = np.append(~np.asarray(blocked, dtype=bool), False)
+            neighbors = np.where(is_open[neighbors] & is_open[:-1, None], neighbors, n)
+            degree = (neighbors < n).sum(axis=1)
+        with profiler.phase('fields'):
+            sent = np.zeros(n + 1)
+            for _ in range(steps):
+                sent[:-1] = self.values * (rate / 6)
+                self.values += sent[neighbors].sum(axis=1) - degree * sent[:-1]
+
+    def decay(self, rate: float):
+        '''Remove a fraction of the value everywhere.'''
+        self.values *= (1 - rate)
+
+    def grow(self, rate: float, capacity: typing.Union[float, np.ndarray]):
+        '''Move each value a fraction of the way toward capacity.'''
+        self.values += rate * (capacity - self.values)
+
+    def deposit(self, inds: np.ndarray, amount: typing.Union[float, np.ndarray]):
+        '''Add amount at cell indices (a source). Repeated indices add up.'''
+        np.add.at(self.values, np.asarray(inds), amount)
+
+    def consume(self, inds: np.ndarray, amount: typing.Union[float, np.ndarray]) -> np.ndarray:
+        '''Remove up to amount at cell indices (a sink) without going below
+            zero, and get the amounts actually removed. Repeated indices are
+            served in order.
+        '''
+        inds = np.asarray(inds)
+        amount = np.broadcast_to(np.asarray(amount, dtype=float), inds.shape)
+        if len(np.unique(inds)) == len(inds):
+            taken = np.minimum(amount, np.maximum(self.values[inds], 0.0))
+            self.values[inds] -= taken
+        else:
+            taken = np.zeros(len(inds))
+            for k, i in enumerate(inds.tolist()):
+                taken[k] = min(amount[k], max(self.values[i], 0.0))
+                self.values[i] -= taken[k]
+        return taken
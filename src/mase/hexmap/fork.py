@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import typing
+import numpy as np
+
+from ..location import Location, Locations
+from ..overlay import OverlayDict
+from .hexpos import HexPos
+from .hexmap import HexMap
+from .fields import Field
+from ..profiling import profiler
+
+
+class HexMapFork(HexMap):
+    '''Copy-on-write overlay of a map, created by HexMap.fork(). A location
+        is copied into the fork the first time it is accessed through loc()
+        (its state is copied shallowly and its agent set is copied), so moves
+        and state changes only touch the copies. Agent positions are an
+        OverlayDict over the parent's, and a field is copied on its first
+        access through field(). Bulk reads such as locations(), get_layer()
+        and get_info() read through without copying and must not be used to
+        change anything. Agents keep referring to the map they were added
+        to, so query positions in the fork through agent_pos(agent) rather
+        than agent.pos. Forks can be forked again for tree search.
+    '''
+    def __init__(self, parent: HexMap):
+        self.parent = parent
+        self.radius = parent.radius
+        self.index = parent.index
+
+        self.pos_loc = dict()
+        self.agent_positions = OverlayDict(parent.agent_positions)
+        self.fields = OverlayDict(parent.fields)
+        # state indexes are not carried over, so where() scans in a fork
+        self.state_indexes = dict()
+        self.layer_masks = dict()
+        self.layer_arrays = dict()
+        self.movement_rules = None
+        self.strict_movement = False
+        if parent.movement_rules is not None:
+            self.set_movement_rules(parent.movement_rules.rules, parent.strict_movement)
+        if profiler.enabled: profiler.count('map_forks')
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self.parent}, changed={self.num_changed})'
+
+    def __iter__(self) -> iter:
+        return iter(self.locations())
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    ############################# Locations #############################
+    def loc(self, pos: HexPos) -> Location:
+        '''Get the location at a given position, copying it into the fork on
+            first access so that it can be changed.
+        '''
+        try:
+            return self.pos_loc[pos]
+        except KeyError:
+            pass
+        parent_loc = self.parent.peek(pos)
+        loc = self.pos_loc[parent_loc.pos] = Location(parent_loc.pos, parent_loc.peek_state(), parent_loc.agents)
+        return loc
+
+    def peek(self, pos: HexPos) -> Location:
+        try:
+            return self.pos_loc[pos]
+        except KeyError:
+            return self.parent.peek(pos)
+
+    def region(self, center: HexPos, dist: int) -> set:
+        '''Get set of positions within the given distance.'''
+        if profiler.enabled: profiler.count('region_calls')
+        return {pos for pos in self.index.intern(center).region(dist) if pos in self.index}
+
+    def positions(self) -> typing.Set[HexPos]:
+        return set(self.index)
+
+    def locations(self) -> Locations:
+        '''Get all locations for reading only.'''
+        return Locations(self.peek(pos) for pos in self.index)
+
+    ############################# Layers and Fields #############################
+    def get_layer(self, name: str) -> np.ndarray:
+        '''Get a location state attribute for every cell in index order.'''
+        values = np.array(self.parent.get_layer(name))
+        for pos, loc in self.pos_loc.items():
+            values[self.index.index(pos)] = getattr(loc.state, name)
+        return values
+
+    def set_layer(self, name: str, values: np.ndarray):
+        '''Set a location state attribute for every cell in index order.
+            Note that this copies every location into the fork.
+        '''
+        for pos, value in zip(self.index, np.asarray(values).tolist()):
+            setattr(self.loc(pos).state, name, value)
+        self._layer_changed(name)
+
+    def field(self, name: str) -> Field:
+        '''Get a named scalar field, copying it into the fork on first access.'''
+        try:
+            return self.fields.delta[name]
+        except KeyError:
+            pass
+        field = super().field(name).copy()
+        self.fields[name] = field
+        return field
+
+    ############################# Forks #############################
+    @property
+    def num_changed(self) -> int:
+        '''Number of locations, agent positions and fields changed in this fork.'''
+        return len(self.pos_loc) + self.agent_positions.num_changed + self.fields.num_changed
+
+    def discard(self):
+        '''Drop all changes made in this fork.'''
+        self.pos_loc.clear()
+        self.agent_positions.discard()
+        self.fields.discard()
+
+    ############################# Other Helpers #############################
+    def get_info(self) -> typing.List[dict]:
+        '''Get dictionary information about each location.'''
+        with profiler.phase('record'):
+            return [loc.get_info() for loc in self.locations()]
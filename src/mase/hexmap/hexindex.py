@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import typing
+import numpy as np
+
+from .hexpos import HexPos, InternedHexPos, HEX_DIRECTIONS
+from ..errors import *
+
+
+class HexIndex:
+    '''Dense integer index over the cells of a hexagonal map.
+        Cells are ordered by q and then by r, so the index of any position
+        can be computed in closed form without a lookup table. The index
+        also interns positions: pos, iteration and intern return one
+        canonical InternedHexPos per cell, created on first use.
+    '''
+    __slots__ = ['radius', 'q', 'r', 's', '_row_start', '_row_rmin', '_neighbors',
+        '_starts', '_rmins', '_interned', '_neighbor_positions']
+
+    def __init__(self, radius: int):
+        self.radius = radius
+
+        qs = np.arange(-radius, radius+1)
+        self._row_rmin = np.maximum(-radius, -qs-radius)
+        row_rmax = np.minimum(radius, -qs+radius)
+        counts = row_rmax - self._row_rmin + 1
+        self._row_start = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+        self.q = np.repeat(qs, counts)
+        self.r = np.arange(len(self.q)) - np.repeat(self._row_start, counts) + np.repeat(self._row_rmin, counts)
+        self.s = -self.q - self.r
+        self._neighbors = None
+
+        # plain lists make scalar lookups much faster than numpy indexing
+        self._starts = self._row_start.tolist()
+        self._rmins = self._row_rmin.tolist()
+        self._interned: typing.List[typing.Optional[InternedHexPos]] = [None] * len(self.q)
+        self._neighbor_positions: typing.List[typing.Optional[typing.Tuple[HexPos, ...]]] = [None] * len(self.q)
+
+    ############################# Dunders #############################
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}(radius={self.radius})'
+
+    def __len__(self) -> int:
+        return 3*self.radius*self.radius + 3*self.radius + 1
+
+    def __contains__(self, pos: HexPos) -> bool:
+        return max(abs(pos.q), abs(pos.r), abs(pos.s)) <= self.radius
+
+    def __iter__(self) -> typing.Iterator[HexPos]:
+        return (self.pos(i) for i in range(len(self.q)))
+
+    ############################# Lookup #############################
+    def index(self, pos: HexPos) -> int:
+        '''Get the index of a position or raise OutOfBoundsError.'''
+        if pos.__class__ is InternedHexPos and pos._owner is self:
+            return pos.index
+        if pos not in self:
+            raise OutOfBoundsError(f'{pos} is out of bounds for {self}.')
+        row = pos.q + self.radius
+        return self._starts[row] + pos.r - self._rmins[row]
+
+    def indices(self, q: np.ndarray, r: np.ndarray) -> np.ndarray:
+        '''Vectorized index lookup. Out-of-bounds coordinates map to -1.'''
+        q, r = np.asarray(q), np.asarray(r)
+        inside = np.maximum(np.maximum(np.abs(q), np.abs(r)), np.abs(q+r)) <= self.radius
+        row = np.where(inside, q + self.radius, 0)
+        return np.where(inside, self._row_start[row] + r - self._row_rmin[row], -1)
+
+    def pos(self, index: int) -> HexPos:
+        '''Get the interned position at a given index.'''
+        pos = self._interned[index]
+        if pos is None:
+            q, r = int(self.q[index]), int(self.r[index])
+            pos = self._interned[index] = InternedHexPos(q, r, -q-r, int(index), self)
+        return pos
+
+    def at(self, q: int, r: int, s: int) -> HexPos:
+        '''Get the interned position with the given coordinates, or a plain
+            HexPos if they are off the map.
+        '''
+        radius = self.radius
+        if q > radius or q < -radius or r > radius or r < -radius or s > radius or s < -radius:
+            return HexPos(q, r, s)
+        row = q + radius
+        return self.pos(self._starts[row] + r - self._rmins[row])
+
+    def intern(self, pos: HexPos) -> HexPos:
+        '''Get the canonical instance of a position (pos itself if off the map).'''
+        if pos.__class__ is InternedHexPos and pos._owner is self:
+            return pos
+        return self.at(pos.q, pos.r, pos.s)
+
+    def neighbor_positions(self, index: int) -> typing.Tuple[HexPos, ...]:
+        '''The six neighbors of a cell, interned where they are on the map (cached).'''
+        nbs = self._neighbor_positions[index]
+        if nbs is None:
+            pos = self.pos(index)
+            nbs = self._neighbor_positions[index] = tuple(self.at(pos.q+dq, pos.r+dr, pos.s+ds) for dq, dr, ds in HEX_DIRECTIONS)
+        return nbs
+
+    def positions(self) -> typing.List[HexPos]:
+        '''Get all positions in index order.'''
+        return list(self)
+
+    @property
+    def neighbors(self) -> np.ndarray:
+        '''(n, 6) array of neighbor indices in HEX_DIRECTIONS order, -1 where off the map.'''
+        if self._neighbors is None:
+            self._neighbors = np.stack([
+                self.indices(self.q + dq, self.r + dr) for dq, dr, _ in HEX_DIRECTIONS
+            ], axis=1)
+        return self._neighbors
+
+
+def round_axial(q: np.ndarray, r: np.ndarray) -> typing.Tuple[np.ndarray, np.ndarray]:
+    '''Vectorized rounding of fractional axial coordinates to the containing hex.'''
+    s = -q - r
+    rq, rr, rs = np.round(q), np.round(r), np.round(s)
+    dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+    fix_q = (dq > dr) & (dq > ds)
+    fix_r = ~fix_q & (dr > ds)
+    rq = np.where(fix_q, -rr - rs, rq)
+    rr = np.where(fix_r, -rq - rs, rr)
+    return rq.astype(int), rr.astype(int)
@@ -10,32 +10,55 @@ import numpy as np
 #from .agentid import AgentID
 
 #if typing.TYPE_CHECKING:
-from .agent import Agent, AgentSet
+from ..agent import Agent, AgentSet
 
-from .location import Location, LocationState, Locations
-from .position import HexPos
-from .errors import *
+from ..location import Location, LocationState, Locations, CompactLocation, SharedState
+from .hexpos import HexPos
+from .hexindex import HexIndex
+from .distance import bfs_index, bfs_index_sparse
+from .fields import Field
+from .neighborhood import disk_aggregate
+from .stateindex import HashIndex, SortedIndex, STATE_INDEX_KINDS
+from .movement import MovementRule, MovementRules
+from ..errors import *
+from ..profiling import profiler
+
+if typing.TYPE_CHECKING:
+    from .connectivity import Connectivity
+    from .fork import HexMapFork
 
 class HexMap:
     pos_loc: typing.Dict[HexPos, Location]
     agent_positions: typing.Dict[Agent, HexPos]
     
-    def __init__(self, radius: int, default_loc_state: LocationState = None):
+    def __init__(self, radius: int, default_loc_state: LocationState = None, compact: bool = False):
         '''
         Args:
             movement_rule: function accepting three arguments: agent, current location, future location.
+            compact: use CompactLocation, which shares the default state
+                and an empty agent set between cells until they change.
         '''
         self.radius = radius
+        self.index = HexIndex(radius)
 
         self.pos_loc = dict()
         self.agent_positions = dict()
+        self.fields: typing.Dict[str, Field] = dict()
+        self.state_indexes: typing.Dict[str, typing.Union[HashIndex, SortedIndex]] = dict()
+        self.layer_masks: typing.Dict[str, np.ndarray] = dict()
+        self.layer_arrays: typing.Dict[str, np.ndarray] = dict()
+        self.movement_rules: typing.Optional[MovementRules] = None
+        self.strict_movement = False
 
         center = HexPos(0, 0, 0)
-        valid_pos = center.neighbors(radius)
-        valid_pos.add(center)
-        self.border_pos = center.neighbors(radius+1) - valid_pos
-        for pos in valid_pos:
-            self.pos_loc[pos] = Location(pos, state=copy.deepcopy(default_loc_state))
+        self.border_pos = center.region(radius+1) - center.region(radius)
+        if compact:
+            shared = SharedState(copy.deepcopy(default_loc_state)) if default_loc_state is not None else None
+            for pos in self.index:
+                self.pos_loc[pos] = CompactLocation(pos, shared)
+        else:
+            for pos in self.index:
+                self.pos_loc[pos] = Location(pos, state=copy.deepcopy(default_loc_state))
     
     ############################# Dunders #############################    
 
@@ -59,21 +82,247 @@ class HexMap:
     
     def region(self, center: HexPos, dist: int) -> set:
         '''Get set of positions within the given distance.'''
-        return center.neighbors(dist) & set(self.pos_loc.keys())
+        if profiler.enabled: profiler.count('region_calls')
+        return {pos for pos in self.index.intern(center).region(dist) if pos in self.pos_loc}
+
+    def iter_nearest(self, pos: HexPos, predicate: typing.Callable[[Location], bool] = None,
+            limit: int = None, max_dist: int = None) -> typing.Iterator[Location]:
+        '''Yield locations in increasing distance from pos, ring by ring,
+            stopping after limit matches or max_dist rings. Only the rings
+            that are needed are visited.
+            Args:
+                predicate: only yield locations for which this returns True.
+        '''
+        center = self.index.intern(pos)
+        farthest = self.radius + center.dist(HexPos(0, 0, 0))
+        max_dist = farthest if max_dist is None else min(max_dist, farthest)
+        found, scanned = 0, 0
+        try:
+            for k in range(max_dist + 1):
+                for p in center.ring(k):
+                    if p not in self.index:
+                        continue
+                    scanned += 1
+                    loc = self.loc(p)
+                    if predicate is None or predicate(loc):
+                        yield loc
+                        found += 1
+                        if limit is not None and found >= limit:
+                            return
+        finally:
+            if profiler.enabled: profiler.count('nearest_cells_scanned', scanned)
+
+    def nearest(self, pos: HexPos, predicate: typing.Callable[[Location], bool] = None,
+            limit: int = 1, max_dist: int = None) -> Locations:
+        '''Get up to limit matching locations nearest to pos.'''
+        return Locations(self.iter_nearest(pos, predicate, limit, max_dist))
 
     def region_locs(self, center: HexPos, dist: int) -> list:
         '''Get sequence of locations in the given region.'''
         return [self.loc(pos) for pos in self.region(center, dist)]
     
-    def pathfind_dfs(self, src: HexPos, target: HexPos, use_loc: typing.Callable = None, max_dist: int = None):
+    def pathfind_dfs(self, src: HexPos, target: HexPos, use_loc: typing.Callable = None, max_dist: int = None, connectivity: Connectivity = None):
         '''Apply pathfinding algorithm where use_loc is used to determine '
             whether a location is traversable.
         '''
+        if connectivity is not None and not connectivity.connected(src, target):
+            if profiler.enabled: profiler.count('unreachable_skipped')
+            return None
         if use_loc is None:
             use_loc = lambda x: True
         useset = set(loc.pos for loc in self.locations() if use_loc(loc))
-        return src.pathfind_dfs(target=target, useset=useset, max_dist=max_dist)
+        return src.pathfind_dfs(target=target, useset=useset, max_dist=max_dist, connectivity=connectivity)
     
+    def distances(self, sources: typing.Iterable[HexPos], targets: typing.Iterable[HexPos] = None, blocked: str = None, max_dist: int = None, stop_at: str = 'any') -> typing.Dict[HexPos, int]:
+        '''Get step distances from the nearest source to positions on the map.
+            Blocked cells are read from a boolean location state attribute
+            through layer_mask. With targets, the search stops once the
+            first target is reached (stop_at='any') or all of them are
+            (stop_at='all'), and only distances to reached targets are
+            returned; without targets the distance to every reachable
+            position is returned. Searches expected to reach a small part
+            of the map only visit the cells they reach.
+        '''
+        index = self.index
+        blocked = self.layer_mask(blocked) if blocked is not None else None
+        source_inds = [index.index(pos) for pos in sources]
+        target_inds = [index.index(pos) for pos in targets] if targets is not None else None
+
+        reach = max_dist
+        if target_inds and source_inds and stop_at is not None:
+            # no target can be nearer than its hex distance to the sources
+            src, dst = np.array(source_inds), np.array(target_inds)
+            dq = index.q[dst][:, None] - index.q[src]
+            dr = index.r[dst][:, None] - index.r[src]
+            nearest = ((np.abs(dq) + np.abs(dr) + np.abs(dq + dr)) // 2).min(axis=1)
+            bound = int(nearest.min() if stop_at == 'any' else nearest.max())
+            reach = bound if reach is None else min(reach, bound)
+        if reach is not None and 4*(3*reach*(reach + 1) + 1)*len(source_inds) < len(index):
+            dist = bfs_index_sparse(index, source_inds, blocked=blocked, targets=target_inds,
+                max_dist=max_dist, stop_at=stop_at)
+            inds = target_inds if target_inds is not None else dist
+            return {index.pos(i): dist[i] for i in inds if i in dist}
+
+        if blocked is not None:
+            blocked = blocked.astype(bool, copy=False)
+        dist = bfs_index(index, source_inds, blocked=blocked, targets=target_inds, max_dist=max_dist, stop_at=stop_at)
+        if target_inds is not None:
+            return {index.pos(i): int(dist[i]) for i in target_inds if dist[i] >= 0}
+        return {index.pos(i): int(dist[i]) for i in np.flatnonzero(dist >= 0).tolist()}
+
+    def shortest_path_length(self, src: HexPos, target: HexPos, blocked: str = None, max_dist: int = None) -> int:
+        '''Number of steps from src to target, or None if it cannot be reached.'''
+        return self.distances([src], [target], blocked=blocked, max_dist=max_dist).get(target)
+    
+    ############################# Layers #############################
+    def get_layer(self, name: str) -> np.ndarray:
+        '''Get a location state attribute for every cell in index order.'''
+        return np.array([getattr(loc.peek_state(), name) for loc in self.pos_loc.values()])
+
+    def layer_values(self, name: str, inds: np.ndarray) -> np.ndarray:
+        '''Get a location state attribute at cell indices from its cached
+            layer array (see layer_array).
+        '''
+        return self.layer_array(name)[inds]
+
+    def set_layer(self, name: str, values: np.ndarray):
+        '''Set a location state attribute for every cell in index order.
+            On a compact map, cells set to the value of the shared default
+            keep sharing it.
+        '''
+        for loc, value in zip(self.pos_loc.values(), np.asarray(values).tolist()):
+            setattr(loc.state, name, value)
+        self._layer_changed(name)
+
+    def set_state(self, pos: HexPos, name: str, value: typing.Any):
+        '''Set a location state attribute at pos, keeping any index, mask or layer array on it current.'''
+        setattr(self.loc(pos).state, name, value)
+        if name in self.state_indexes:
+            self.state_indexes[name].update(self.index.index(pos), value)
+        if name in self.layer_masks:
+            self.layer_masks[name][self.index.index(pos)] = bool(value)
+        if name in self.layer_arrays:
+            self.layer_arrays[name][self.index.index(pos)] = value
+
+    def layer_mask(self, name: str) -> np.ndarray:
+        '''Get a boolean array of a location state attribute over the cell
+            index, cached so that repeated searches (such as distances with
+            a blocked layer) do not scan the map. The cache is kept current
+            by set_state and set_layer; call set_layer after changing the
+            attribute directly.
+        '''
+        try:
+            return self.layer_masks[name]
+        except KeyError:
+            pass
+        mask = self.layer_masks[name] = np.asarray(self.get_layer(name)).astype(bool)
+        return mask
+
+    def layer_array(self, name: str) -> np.ndarray:
+        '''Get an array of a location state attribute over the cell index,
+            cached like layer_mask so that movement rules read layers without
+            visiting locations. Do not write to it; use set_state or set_layer.
+        '''
+        try:
+            return self.layer_arrays[name]
+        except KeyError:
+            pass
+        values = self.layer_arrays[name] = np.asarray(self.get_layer(name))
+        return values
+
+    def _layer_changed(self, name: str):
+        '''Refresh indexes and masks after a whole layer was written.'''
+        if name in self.state_indexes:
+            self.state_indexes[name].refresh()
+        self.layer_masks.pop(name, None)
+        self.layer_arrays.pop(name, None)
+
+    ############################# State Indexes #############################
+    def add_state_index(self, name: str, kind: str = 'hash') -> typing.Union[HashIndex, SortedIndex]:
+        '''Index a location state attribute so that where() and where_range()
+            cost proportional to the result instead of the map.
+            Args:
+                kind: 'hash' for categorical attributes or 'sorted' for
+                    numeric attributes that are queried by range.
+        '''
+        try:
+            index_type = STATE_INDEX_KINDS[kind]
+        except KeyError:
+            raise ValueError(f'Unknown state index kind "{kind}". Use one of {list(STATE_INDEX_KINDS)}.')
+        index = self.state_indexes[name] = index_type(self, name)
+        return index
+
+    def where(self, name: str, value: typing.Any) -> Locations:
+        '''Get locations whose state attribute equals value, in index order.
+            Uses an index on the attribute if there is one and scans otherwise.
+        '''
+        index = self.state_indexes.get(name)
+        if isinstance(index, HashIndex):
+            inds = index.cell_indices(value)
+        else:
+            inds = np.flatnonzero(np.asarray(self.get_layer(name)) == value).tolist()
+        return Locations(self.loc(self.index.pos(i)) for i in inds)
+
+    def where_range(self, name: str, lo: typing.Any = None, hi: typing.Any = None,
+            lo_inclusive: bool = True, hi_inclusive: bool = True) -> Locations:
+        '''Get locations whose state attribute lies between lo and hi (either
+            may be None), in order of value. Uses a sorted index on the
+            attribute if there is one and scans otherwise.
+        '''
+        index = self.state_indexes.get(name)
+        if isinstance(index, SortedIndex):
+            inds = index.cell_indices(lo, hi, lo_inclusive, hi_inclusive)
+        else:
+            layer = np.asarray(self.get_layer(name))
+            keep = np.ones(len(layer), dtype=bool)
+            if lo is not None:
+                keep &= (layer >= lo) if lo_inclusive else (layer > lo)
+            if hi is not None:
+                keep &= (layer <= hi) if hi_inclusive else (layer < hi)
+            inds = np.flatnonzero(keep)
+            inds = inds[np.argsort(layer[inds], kind='stable')].tolist()
+        return Locations(self.loc(self.index.pos(i)) for i in inds)
+
+    ############################# Fields #############################
+    def add_field(self, name: str, fill: float = 0.0, values: np.ndarray = None) -> Field:
+        '''Add a named scalar field (e.g. a pheromone or resource) over all cells.'''
+        field = self.fields[name] = Field(self.index, values=values, fill=fill)
+        return field
+
+    def field(self, name: str) -> Field:
+        '''Get a named scalar field.'''
+        try:
+            return self.fields[name]
+        except KeyError:
+            raise KeyError(f'{self} has no field "{name}". Available fields: {list(self.fields)}.')
+
+    ############################# Neighborhood Aggregation #############################
+    def agent_cell_indices(self) -> np.ndarray:
+        '''Cell index of every agent, in the order of agent_positions.'''
+        return np.fromiter((self.index.index(pos) for pos in self.agent_positions.values()),
+            dtype=np.int64, count=len(self.agent_positions))
+
+    def agent_counts(self) -> np.ndarray:
+        '''Number of agents on each cell.'''
+        return np.bincount(self.agent_cell_indices(), minlength=len(self.index))
+
+    def neighborhood(self, values: typing.Union[str, np.ndarray, None], k: int, how: str = 'sum') -> np.ndarray:
+        '''Aggregate values over the disk of radius k around every cell.
+            Args:
+                values: array over the cell index, the name of a field or
+                    location state attribute, or None for agent counts.
+                how: 'sum', 'count', 'mean' or 'max'.
+        '''
+        if values is None:
+            values = self.agent_counts()
+        elif isinstance(values, str):
+            values = self.fields[values].values if values in self.fields else self.get_layer(values)
+        return disk_aggregate(self.index, values, k, how)
+
+    def agent_neighborhood(self, values: typing.Union[str, np.ndarray, None], k: int, how: str = 'sum') -> np.ndarray:
+        '''Like neighborhood, but for the cell of every agent in the order of agent_positions.'''
+        return self.neighborhood(values, k, how)[self.agent_cell_indices()]
+
     ############################# Access/Lookup Locations/Positions/Agents #############################
     def loc(self, pos: HexPos) -> Location:
         '''Get the location at a given position.'''
@@ -82,6 +331,12 @@ class HexMap:
         except KeyError:
             raise OutOfBoundsError(f'{pos} is out of bounds for map {self}.')
     
+    def peek(self, pos: HexPos) -> Location:
+        '''Get the location at a given position for reading only. Forks do
+            not copy locations that are only peeked at.
+        '''
+        return self.loc(pos)
+
     def agent_loc(self, agent: Agent) -> Location:
         '''Get the location of the provided agent.'''
         return self.loc(self.agent_pos(agent))
@@ -111,23 +366,54 @@ class HexMap:
         '''Add the agent to the map.'''
         if agent in self.agent_positions:
             raise AgentExistsError(f'The agent "{agent.id}" already exists on this map.')
-        self.loc(pos).agents.add(agent)
-        self.agent_positions[agent] = pos
+        loc = self.loc(pos)
+        loc.add_agent(agent)
+        self.agent_positions[agent] = loc.pos
         
     def remove_agent(self, agent: Agent):
         '''Remove the agent form the map.'''
-        self.agent_loc(agent).agents.remove(agent)
+        self.agent_loc(agent).remove_agent(agent)
         del self.agent_positions[agent]
         
     def move_agent(self, agent: Agent, new_pos: HexPos):
         '''Move the agent to a new location after checking rule.
         '''        
-        self.remove_agent(agent)
-        self.add_agent(agent, new_pos)
+        with profiler.phase('movement'):
+            try:
+                self.loc(new_pos)
+                if self.strict_movement:
+                    self.movement_rules.check(agent, new_pos)
+            except (OutOfBoundsError, MovementRuleViolationError):
+                if profiler.enabled: profiler.count('moves_rejected')
+                raise
+            self.remove_agent(agent)
+            self.add_agent(agent, new_pos)
+            if profiler.enabled: profiler.count('moves')
             
+    ############################# Forks #############################
+    def fork(self) -> HexMapFork:
+        '''Get a copy-on-write overlay of this map for lookahead. Changes to
+            the fork do not affect this map, which must not change while the
+            fork is in use. Drop the fork (or call discard) to undo them.
+        '''
+        from .fork import HexMapFork
+        return HexMapFork(self)
+
+    ############################# Movement Rules #############################
+    def set_movement_rules(self, rules: typing.Iterable[MovementRule], strict: bool = False) -> MovementRules:
+        '''Set the rules that decide which moves are legal.
+            Args:
+                strict: make move_agent raise MovementRuleViolationError
+                    for moves that break a rule.
+        '''
+        self.movement_rules = MovementRules(self, rules)
+        self.strict_movement = strict
+        return self.movement_rules
+
     ############################# Other Helpers #############################
     def get_info(self) -> typing.List[dict]:
         '''Get dictionary information about each location.'''
-        return [loc.get_info() for loc in self.pos_loc.values()]
+        with profiler.phase('record'):
+            return [loc.get_info() for loc in self.pos_loc.values()]
     
     
\ No newline at end of file
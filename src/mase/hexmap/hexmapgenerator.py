@@ -1,61 +1,210 @@
+from __future__ import annotations
 
-import random
+import dataclasses
+import hashlib
+import os
+import typing
+import numpy as np
 
+from ..location import LocationState
 from .hexmap import HexMap
-from .position import HexPos
+from .hexpos import HexPos
+from .hexindex import HexIndex
+
+
+############################# Layer Generators #############################
+
+@dataclasses.dataclass(frozen=True)
+class NoiseLayer:
+    '''Smooth terrain values in [0, 1) from multi-octave value noise.'''
+    name: str = 'terrain'
+    scale: float = 16.0
+    octaves: int = 4
+    persistence: float = 0.5
+
+    def generate(self, index: HexIndex, rng: np.random.Generator, layers: typing.Dict[str, np.ndarray]) -> np.ndarray:
+        x, y = cell_xy(index)
+        values = np.zeros(len(index))
+        amplitude, total, scale = 1.0, 0.0, self.scale
+        for _ in range(self.octaves):
+            values += amplitude * value_noise(x/scale, y/scale, rng)
+            total += amplitude
+            amplitude *= self.persistence
+            scale /= 2
+        return values / total
+
+
+@dataclasses.dataclass(frozen=True)
+class PercolationLayer:
+    '''Boolean obstacles from site percolation, optionally smoothed into blobs
+        by a few rounds of a neighbor-majority cellular automaton.
+    '''
+    name: str = 'blocked'
+    p: float = 0.25
+    smoothing: int = 0
+    border: bool = False
+
+    def generate(self, index: HexIndex, rng: np.random.Generator, layers: typing.Dict[str, np.ndarray]) -> np.ndarray:
+        blocked = rng.random(len(index)) < self.p
+        neighbors = index.neighbors
+        for _ in range(self.smoothing):
+            # index -1 (off the map) reads the sentinel appended at the end
+            num_blocked = np.append(blocked, False)[neighbors].sum(axis=1)
+            blocked = np.where(num_blocked >= 4, True, np.where(num_blocked <= 2, False, blocked))
+        if self.border:
+            blocked |= (neighbors < 0).any(axis=1)
+        return blocked
+
+
+@dataclasses.dataclass(frozen=True)
+class ClusterLayer:
+    '''Resources concentrated in Gaussian clusters around random cells.
+        Cells where the layer named by exclude is truthy get no resources.
+    '''
+    name: str = 'resource'
+    num_clusters: int = 8
+    sigma: float = 3.0
+    amount: float = 1.0
+    exclude: typing.Optional[str] = None
+
+    def generate(self, index: HexIndex, rng: np.random.Generator, layers: typing.Dict[str, np.ndarray]) -> np.ndarray:
+        values = np.zeros(len(index))
+        for center in rng.choice(len(index), size=self.num_clusters):
+            dist = (np.abs(index.q - index.q[center]) + np.abs(index.r - index.r[center]) + np.abs(index.s - index.s[center])) // 2
+            values += self.amount * np.exp(-dist**2 / (2*self.sigma**2))
+        if self.exclude is not None:
+            values[layers[self.exclude].astype(bool)] = 0
+        return values
+
+
+LayerGenerator = typing.Union[NoiseLayer, PercolationLayer, ClusterLayer]
+
+
+############################# Pipeline #############################
+
+@dataclasses.dataclass(frozen=True)
+class MapGenerator:
+    '''Seeded pipeline producing layer arrays over the cell index of a map.
+        Layers are generated in order, so later layers may refer to earlier ones.
+    '''
+    radius: int
+    layers: typing.Tuple[LayerGenerator, ...]
+    seed: int = 0
+
+    def key(self) -> str:
+        '''Cache key derived from the generator parameters.'''
+        return hashlib.sha1(repr(self).encode()).hexdigest()
+
+    def generate(self) -> typing.Dict[str, np.ndarray]:
+        '''Generate all layers without touching the cache.'''
+        index = HexIndex(self.radius)
+        rngs = [np.random.default_rng(s) for s in np.random.SeedSequence(self.seed).spawn(len(self.layers))]
+        layers = dict()
+        for layer, rng in zip(self.layers, rngs):
+            layers[layer.name] = layer.generate(index, rng, layers)
+        return layers
+
+    def load_or_generate(self, cache_dir: typing.Optional[str] = None) -> typing.Dict[str, np.ndarray]:
+        '''Load layers from the cache directory or generate and store them.'''
+        if cache_dir is None:
+            return self.generate()
+
+        fpath = os.path.join(cache_dir, f'{self.key()}.npz')
+        if os.path.exists(fpath):
+            with np.load(fpath) as data:
+                return {layer.name: data[layer.name] for layer in self.layers}
+
+        layers = self.generate()
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = fpath + '.tmp.npz'
+        np.savez(tmp_path, **layers)
+        os.replace(tmp_path, fpath)
+        return layers
+
+    def apply(self, hexmap: HexMap, cache_dir: typing.Optional[str] = None) -> typing.Dict[str, np.ndarray]:
+        '''Write generated layers into the location states of the map.'''
+        if hexmap.radius != self.radius:
+            raise ValueError(f'Generator radius {self.radius} does not match {hexmap}.')
+        layers = self.load_or_generate(cache_dir)
+        for name, values in layers.items():
+            hexmap.set_layer(name, values)
+        return layers
+
+
+############################# Helpers #############################
+
+def cell_xy(index: HexIndex) -> typing.Tuple[np.ndarray, np.ndarray]:
+    '''Cartesian centers of every cell for unit-size pointy hexagons.'''
+    return np.sqrt(3) * (index.q + index.r/2), 1.5 * index.r
+
+
+def value_noise(x: np.ndarray, y: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    '''Bilinear value noise with smoothstep easing on a random unit lattice.'''
+    x0, y0 = np.floor(x).astype(int), np.floor(y).astype(int)
+    xmin, ymin = x0.min(), y0.min()
+    lattice = rng.random((x0.max()-xmin+2, y0.max()-ymin+2))
+    i, j = x0 - xmin, y0 - ymin
+    tx, ty = x - x0, y - y0
+    tx, ty = tx*tx*(3 - 2*tx), ty*ty*(3 - 2*ty)
+    top = lattice[i, j]*(1-tx) + lattice[i+1, j]*tx
+    bottom = lattice[i, j+1]*(1-tx) + lattice[i+1, j+1]*tx
+    return top*(1-ty) + bottom*ty
+
+
+############################# Test Data #############################
 
 def random_pathfind_positions(map_size: int, PositionType: type = HexPos, seed: int = 0, percent_avoid: float = 0.25):
-    center = PositionType(0,0,0)
-    all_positions = center.neighbors(map_size)
-
-    # random sampling for start, end, and blocks
-    random.seed(seed)
-    avoidset = set(random.sample(all_positions, int(len(all_positions) * percent_avoid)))
-    avoidset |= center.fringe(all_positions)
-    
-    start = random.choice(list(all_positions - avoidset))
-    end = random.choice(list(all_positions - avoidset - set([start])))
-
-    return start, end, avoidset
-
-def random_walk(map_size: int, seed: int = 0, include_path: bool = True):
-    hmap = HexMap(map_size)
-    
-    all_positions = hmap.positions()
-    
-    # random sampling for start, end, and blocks
-    random.seed(seed)
-    avoidset = set(random.sample(all_positions, len(all_positions) // 4))
-    
-    start = random.choice(list(all_positions - avoidset))
-    end = random.choice(list(all_positions - avoidset - set([start])))
-    
-    if include_path:
-        path = start.shortest_path_dfs(end, avoidset, 2*map_size)
-        pathset = set(path)
-        for loc in hmap:
-            loc.state['start'] = loc.pos == start
-            loc.state['end'] = loc.pos == end
-            loc.state['passed'] = loc.pos in pathset
-            loc.state['blocked'] = loc.pos in avoidset
+    index = HexIndex(map_size)
+    rng = np.random.default_rng(seed)
+    blocked = PercolationLayer(p=percent_avoid).generate(index, rng, {})
+
+    start, end = rng.choice(np.flatnonzero(~blocked), size=2, replace=False)
+    positions = index.positions()
+    avoidset = {positions[i] for i in np.flatnonzero(blocked)}
+    avoidset |= HexPos(0, 0, 0).region(map_size+1) - HexPos(0, 0, 0).region(map_size)
+
+    return PositionType(*positions[start].coords()), PositionType(*positions[end].coords()), avoidset
+
+@dataclasses.dataclass
+class WalkState(LocationState):
+    '''Location state written by random_walk.'''
+    blocked: bool = False
+    start: bool = False
+    end: bool = False
+    passed: bool = False
+
+    def get_info(self) -> typing.Dict:
+        return dataclasses.asdict(self)
+
+def random_walk(map_size: int, seed: int = 0, include_path: bool = True, percent_avoid: float = 0.25) -> typing.List[dict]:
+    '''Get location info for a map with percolation obstacles, random start
+        and end cells and, if include_path, the shortest path between them
+        (no cells are passed if the end cannot be reached).
+    '''
+    hmap = HexMap(map_size, WalkState())
+    layers = MapGenerator(map_size, (PercolationLayer(p=percent_avoid),), seed=seed).apply(hmap)
+    blocked = layers['blocked']
+    cells = np.arange(len(hmap.index))
+
+    rng = np.random.default_rng(seed)
+    start, end = rng.choice(np.flatnonzero(~blocked), size=2, replace=False)
+    hmap.set_layer('start', cells == start)
+    hmap.set_layer('end', cells == end)
 
-    loc_info = hmap.get_loc_info()
+    if include_path:
+        start_pos, end_pos = hmap.index.pos(start), hmap.index.pos(end)
+        passed = np.zeros(len(cells), dtype=bool)
+        if hmap.shortest_path_length(start_pos, end_pos, blocked='blocked') is not None:
+            allowed = {hmap.index.pos(i) for i in np.flatnonzero(~blocked).tolist()}
+            passed[[pos.index for pos in start_pos.a_star(end_pos, allowed)]] = True
+        hmap.set_layer('passed', passed)
 
-    return loc_info
+    return hmap.get_info()
 
 def run_test(map_size: int, num_runs: int):
-    hmap = HexMap(map_size)
     path_lengths = list()
     for i in range(num_runs):
-        start, end, avoidset = test_data(hmap, i)
-        path = start.shortest_path_dfs(end, avoidset, 2*map_size)
-        path_lengths.append(len(path))
+        start, end, avoidset = random_pathfind_positions(map_size, seed=i)
+        path = start.pathfind_dfs_avoid(end, avoidset, 2*map_size)
+        path_lengths.append(len(path) if path is not None else None)
     return start, end, sum(pl for pl in path_lengths if pl is not None)
-
-
-
-
-
-
-
-
@@ -1,13 +1,18 @@
 # distutils: language = c++
 from __future__ import annotations
 
-import numpy as np
 import typing
 import math
-#import itertools
+import itertools
 import math
 import dataclasses
 
+from ..profiling import profiler
+
+if typing.TYPE_CHECKING:
+    from .connectivity import Connectivity
+    from .hexindex import HexIndex
+
 #from .position import Position
 #from .algorithms import a_star
 
@@ -20,19 +25,33 @@ HEX_DIRECTIONS = [
 ]
 
 #HEX_POS_DIRECTIONS = [HexPos(*coords) for coords in HEX_DIRECTIONS]
+class TargetInAvoidSet(ValueError):
+    pass
+
+
 class NoPathFound(Exception):
     @classmethod
     def from_src_and_dest(cls, src: HexPos, dest: HexPos) -> typing.Self:
         return cls(f'No path found from {src} to {dest}.')
 
 
-@dataclasses.dataclass(frozen=True, slots=True)
+@dataclasses.dataclass(frozen=True, slots=True, eq=False)
 class HexPos:
     '''Hexagonal position object.'''
     q: HexUnit
     r: HexUnit
     s: HexUnit
 
+    def __eq__(self, other: HexPos) -> bool:
+        if self is other:
+            return True
+        if not isinstance(other, HexPos):
+            return NotImplemented
+        return self.q == other.q and self.r == other.r and self.s == other.s
+
+    def __hash__(self) -> int:
+        return hash((self.q, self.r, self.s))
+
     @classmethod
     def from_origin(cls) -> HexPos:
         return cls(0, 0, 0)
@@ -56,10 +75,16 @@ class HexPos:
     ################################ Neighbors and regions ################################
     def distance(self, other: typing.Self) -> int:
         return int((math.fabs(self.q-other.q) + math.fabs(self.r-other.r) + math.fabs(self.s-other.s))//2)
-    
+
+    dist = distance
+
     def region_sorted(self, target: HexPos, dist: int = 1) -> typing.List[HexPos]:
+        '''Return positions within dist sorted by distance from target.'''
+        return list(sorted(self.region(dist), key=lambda n: target.dist(n)))
+
+    def sorted_neighbors(self, target: HexPos) -> typing.List[HexPos]:
         '''Return direct neighbors sorted by distance from target.'''
-        return list(sorted(self.neighbors(dist), key=lambda n: target.dist(n)))
+        return list(sorted(self.neighbors(), key=lambda n: target.dist(n)))
 
     def region(self, dist: int = 1) -> typing.Set[HexPos]:
         '''Get points within a given distance.'''
@@ -79,25 +104,57 @@ class HexPos:
         '''Get a new object with the specified offset coordinates.'''
         return self.__class__(self.q+offset_q, self.r+offset_r, self.s+offset_s)
 
+    def ring(self, dist: int) -> list[HexPos]:
+        '''Get positions at exactly dist, in rotational order.'''
+        if dist == 0:
+            return [self]
+        pos = self.offset(*(c*dist for c in HEX_DIRECTIONS[4]))
+        ring = []
+        for direction in HEX_DIRECTIONS:
+            for _ in range(dist):
+                ring.append(pos)
+                pos = pos.offset(*direction)
+        return ring
+
+    def line(self, other: HexPos) -> list[HexPos]:
+        '''Get the positions on a straight line to other, including both ends.'''
+        n = self.distance(other)
+        if n == 0:
+            return [self]
+        # nudge off cell edges so ties round consistently
+        q0, r0, s0 = self.q + 1e-6, self.r + 1e-6, self.s - 2e-6
+        dq, dr, ds = other.q - self.q, other.r - self.r, other.s - self.s
+        return [cube_round(q0 + dq*i/n, r0 + dr*i/n, s0 + ds*i/n, self.__class__) for i in range(n+1)]
+
 
     def a_star(
         self, 
         goal: HexPos, 
         allowed_pos: typing.Optional[set[HexPos]] = None, 
-        max_dist: typing.Optional[int] = None
+        max_dist: typing.Optional[int] = None,
+        connectivity: typing.Optional[Connectivity] = None,
     ) -> list[HexPos]:
-        '''Compute the A-star algorithm on a hex grid.'''
+        '''Compute the A-star algorithm on a hex grid. If a connectivity
+            index over the same passable cells is given, unreachable goals
+            fail before searching.
+        '''
+        if connectivity is not None and not connectivity.connected(self, goal):
+            if profiler.enabled: profiler.count('unreachable_skipped')
+            raise NoPathFound.from_src_and_dest(self, goal)
 
         open_set: list[HexPos] = [self]
         came_from: dict[HexPos, HexPos] = {}
         g_score: dict[HexPos,int] = {self: 0}
         f_score: dict[HexPos, float] = {self: self.distance(goal)}
+        expanded = 0
 
         while open_set:
             current = min(open_set, key=lambda pos: f_score.get(pos, float('inf')))
             open_set.remove(current)
+            expanded += 1
 
             if current == goal:
+                if profiler.enabled: profiler.count('a_star_expanded', expanded)
                 path = []
                 while current in came_from:
                     path.append(current)
@@ -122,6 +179,7 @@ class HexPos:
                     if neighbor not in open_set:
                         open_set.append(neighbor)
 
+        if profiler.enabled: profiler.count('a_star_expanded', expanded)
         raise NoPathFound.from_src_and_dest(self, goal)
 
 
@@ -129,8 +187,11 @@ class HexPos:
     ################################ Pathfinding ################################
 
     def pathfind_dfs(self, target: HexPos, useset: typing.Set[HexPos] = None, 
-            max_dist: int = None, verbose: bool = False) -> typing.List[HexPos]:
+            max_dist: int = None, verbose: bool = False, connectivity: Connectivity = None) -> typing.List[HexPos]:
         '''Heuristic-based pathfinder. May not be shortest path.'''
+        if connectivity is not None and not connectivity.connected(self, target):
+            if profiler.enabled: profiler.count('unreachable_skipped')
+            return None
         
         if max_dist is None:
             max_dist = 1e9 # real big
@@ -167,43 +228,43 @@ class HexPos:
                 current_path.pop()
 
             if not len(current_path):
+                if profiler.enabled: profiler.count('dfs_expanded', len(visited))
                 return None
 
             if verbose: print('--------------------------------\n')
             
+        if profiler.enabled: profiler.count('dfs_expanded', len(visited))
         return current_path
 
 
-    def shortest_path_length(self, target: HexPos, avoidset: set) -> int:
-        '''Calculate number of steps required to reach target.'''
+    def shortest_path_length(self, target: HexPos, avoidset: set, max_dist: int = None) -> int:
+        '''Calculate number of steps required to reach target, or None if it cannot be reached.
+            The search is confined to the ring just outside every avoided
+            position, which is always open, so it ends even when target is
+            walled off and shortest paths never need to go further out.
+        '''
         if target in avoidset:
             raise TargetInAvoidSet(f'Target {target} was found in avoidset.')
-        
-        ct = 0
-        visited = set([self])
-        while True:
-            fringe = self.fringe(visited, 1) - avoidset
-            ct += 1
-            if target in fringe:
-                #ct += 1
-                return ct
-            elif not len(fringe):
-                return None
-            else:
-                visited |= fringe
+        from .distance import bfs_distances
+        origin = HexPos(0, 0, 0)
+        radius = max(origin.dist(pos) for pos in itertools.chain([self, target], avoidset)) + 1
+        return bfs_distances([self], targets=[target], avoid=avoidset, max_dist=max_dist, radius=radius).get(target)
     
     def fringe(self, others: typing.Set[HexPos], dist: int = 1) -> typing.Set[HexPos]:
         '''Get positions on the fringe of the provided nodes.'''
         others = others | set([self])
         fringe = set()
         for pos in others:
-            fringe |= pos.neighbors(dist)
+            fringe |= pos.neighbors() if dist == 1 else pos.region(dist)
         return fringe - others
 
-    def pathfind_dfs_avoid(self, target: HexPos, avoidset: set = None, max_dist: int = None, verbose: bool = False) -> typing.List[HexPos]:
+    def pathfind_dfs_avoid(self, target: HexPos, avoidset: set = None, max_dist: int = None, verbose: bool = False, connectivity: Connectivity = None) -> typing.List[HexPos]:
         '''Heuristic-based pathfinder. May not be shortest path.'''
         if target in avoidset:
             raise TargetInAvoidSet(f'Target {target} was found in avoidset.')
+        if connectivity is not None and not connectivity.connected(self, target):
+            if profiler.enabled: profiler.count('unreachable_skipped')
+            return None
         
         if max_dist is None:
             max_dist = 1e9 # real big
@@ -240,8 +301,65 @@ class HexPos:
                 current_path.pop()
 
             if not len(current_path):
+                if profiler.enabled: profiler.count('dfs_expanded', len(visited))
                 return None
 
             if verbose: print('--------------------------------\n')
             
+        if profiler.enabled: profiler.count('dfs_expanded', len(visited))
         return current_path
+
+
+class InternedHexPos(HexPos):
+    '''Canonical position owned by a HexIndex, created by HexIndex.intern
+        and HexIndex.pos. There is one instance per cell of the owning map,
+        so equal interned positions are the same object, and the hash and
+        cell index are computed once. Offsets that stay on the map return
+        interned positions too.
+    '''
+    __slots__ = ['index', '_hash', '_owner']
+
+    def __init__(self, q: HexUnit, r: HexUnit, s: HexUnit, index: int, owner: HexIndex):
+        object.__setattr__(self, 'q', q)
+        object.__setattr__(self, 'r', r)
+        object.__setattr__(self, 's', s)
+        object.__setattr__(self, 'index', index)
+        object.__setattr__(self, '_hash', hash((q, r, s)))
+        object.__setattr__(self, '_owner', owner)
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __repr__(self) -> str:
+        return f'HexPos(q={self.q}, r={self.r}, s={self.s})'
+
+    def __reduce__(self):
+        return (HexPos, (self.q, self.r, self.s))
+
+    def __copy__(self) -> InternedHexPos:
+        return self
+
+    def __deepcopy__(self, memo: dict) -> InternedHexPos:
+        return self
+
+    def offset(self, offset_q: int, offset_r: int, offset_s: int) -> HexPos:
+        return self._owner.at(self.q+offset_q, self.r+offset_r, self.s+offset_s)
+
+    def neighbors(self) -> typing.Set[HexPos]:
+        return set(self._owner.neighbor_positions(self.index))
+
+    def line(self, other: HexPos) -> list[HexPos]:
+        return [self._owner.intern(pos) for pos in HexPos(self.q, self.r, self.s).line(other)]
+
+
+def cube_round(q: float, r: float, s: float, PositionType: type = HexPos) -> HexPos:
+    '''Round fractional cube coordinates to the nearest hex.'''
+    rq, rr, rs = round(q), round(r), round(s)
+    dq, dr, ds = abs(rq - q), abs(rr - r), abs(rs - s)
+    if dq > dr and dq > ds:
+        rq = -rr - rs
+    elif dr > ds:
+        rr = -rq - rs
+    else:
+        rs = -rq - rr
+    return PositionType(rq, rr, rs)
@@ -0,0 +1,264 @@
+from __future__ import annotations
+
+import collections
+import heapq
+import typing
+import numpy as np
+
+from .hexpos import HexPos, NoPathFound
+from .hexmap import HexMap
+from .hexindex import round_axial
+from .connectivity import Connectivity
+from ..profiling import profiler
+
+_START, _GOAL = -1, -2
+
+
+class HierarchicalPathfinder:
+    '''Hierarchical pathfinding (HPA*) over a map.
+        Cells are grouped into hexagonal clusters of roughly cluster_size
+        across. Entrance cells are placed on the borders between clusters,
+        and distances between the entrances of each cluster are precomputed,
+        giving an abstract graph that is searched instead of the full map.
+        Only the segments of the abstract path that are needed get refined
+        into cell paths. Passability is read from a boolean location state
+        attribute; change it through set_blocked (or call refresh) so that
+        only the clusters around changed cells are rebuilt. A connectivity
+        index is kept alongside so unreachable goals fail without a search.
+    '''
+    def __init__(self, hexmap: HexMap, blocked: str = 'blocked', cluster_size: int = 8, long_entrance: int = 6):
+        self.hexmap = hexmap
+        self.index = hexmap.index
+        self.blocked_attr = blocked
+        self.cluster_size = cluster_size
+        self.long_entrance = long_entrance
+        self.blocked = np.asarray(hexmap.get_layer(blocked), dtype=bool).copy()
+        self._neighbors = self.index.neighbors.tolist()
+        self.connectivity = Connectivity(hexmap, blocked)
+
+        # assign cells to clusters
+        cq, cr = round_axial(self.index.q / cluster_size, self.index.r / cluster_size)
+        _, cluster = np.unique(np.stack([cq, cr], axis=1), axis=0, return_inverse=True)
+        self.cluster = cluster.ravel()
+        self.num_clusters = int(self.cluster.max()) + 1
+        self.cluster_cells: typing.List[typing.Set[int]] = [set() for _ in range(self.num_clusters)]
+        for i, c in enumerate(self.cluster.tolist()):
+            self.cluster_cells[c].add(i)
+
+        # cell pairs on the border between each pair of adjacent clusters
+        self.borders: typing.Dict[typing.Tuple[int, int], typing.List[typing.Tuple[int, int]]] = collections.defaultdict(list)
+        self.adjacent: typing.List[typing.Set[int]] = [set() for _ in range(self.num_clusters)]
+        for i, nbs in enumerate(self._neighbors):
+            ci = self.cluster[i]
+            for j in nbs:
+                if j >= 0 and self.cluster[j] != ci and ci < self.cluster[j]:
+                    self.borders[(int(ci), int(self.cluster[j]))].append((i, j))
+                    self.adjacent[ci].add(int(self.cluster[j]))
+                    self.adjacent[self.cluster[j]].add(int(ci))
+
+        # abstract graph
+        self.entrances: typing.Dict[typing.Tuple[int, int], typing.List[typing.Tuple[int, int]]] = dict()
+        self.inter: typing.Dict[int, typing.Set[int]] = collections.defaultdict(set)
+        self.intra: typing.List[typing.Dict[int, typing.Dict[int, int]]] = [dict() for _ in range(self.num_clusters)]
+        for pair in self.borders:
+            self._build_entrances(pair)
+        for c in range(self.num_clusters):
+            self._build_cluster(c)
+        self._dirty: typing.Set[int] = set()
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self.hexmap}, cluster_size={self.cluster_size})'
+
+    ############################# Building #############################
+    def _build_entrances(self, pair: typing.Tuple[int, int]):
+        '''Place entrances on contiguous open segments of a cluster border.'''
+        for u, v in self.entrances.get(pair, []):
+            self.inter[u].discard(v)
+            self.inter[v].discard(u)
+
+        edges = [(u, v) for u, v in self.borders[pair] if not self.blocked[u] and not self.blocked[v]]
+        segments = _segments(edges, self._neighbors)
+        chosen = list()
+        for seg in segments:
+            chosen.append(seg[len(seg)//2])
+            if len(seg) >= self.long_entrance:
+                chosen += [seg[0], seg[-1]]
+        self.entrances[pair] = chosen
+        for u, v in chosen:
+            self.inter[u].add(v)
+            self.inter[v].add(u)
+
+    def _entrance_nodes(self, c: int) -> typing.Set[int]:
+        nodes = set()
+        for other in self.adjacent[c]:
+            pair = (min(c, other), max(c, other))
+            for u, v in self.entrances.get(pair, []):
+                nodes.add(u if self.cluster[u] == c else v)
+        return nodes
+
+    def _build_cluster(self, c: int):
+        '''Compute distances between the entrance nodes of a cluster.'''
+        nodes = self._entrance_nodes(c)
+        self.intra[c] = {node: {} for node in nodes}
+        for node in nodes:
+            dist, _ = self._cluster_bfs(node, c)
+            self.intra[c][node] = {other: dist[other] for other in nodes if other != node and other in dist}
+
+    def _cluster_bfs(self, src: int, c: int, target: typing.Optional[int] = None) -> typing.Tuple[typing.Dict[int, int], typing.Dict[int, int]]:
+        '''Breadth-first search restricted to open cells of cluster c.'''
+        cells = self.cluster_cells[c]
+        dist, parent = {src: 0}, {src: -1}
+        frontier = collections.deque([src])
+        while frontier:
+            u = frontier.popleft()
+            if u == target:
+                break
+            for v in self._neighbors[u]:
+                if v >= 0 and v not in dist and v in cells and not self.blocked[v]:
+                    dist[v] = dist[u] + 1
+                    parent[v] = u
+                    frontier.append(v)
+        return dist, parent
+
+    def _rebuild_dirty(self):
+        if not self._dirty:
+            return
+        rebuild = set()
+        for c in self._dirty:
+            for other in self.adjacent[c]:
+                self._build_entrances((min(c, other), max(c, other)))
+                rebuild.add(other)
+            rebuild.add(c)
+        for c in rebuild:
+            self._build_cluster(c)
+        if profiler.enabled: profiler.count('hpa_clusters_rebuilt', len(rebuild))
+        self._dirty.clear()
+
+    ############################# Updating Passability #############################
+    def set_blocked(self, pos: HexPos, blocked: bool):
+        '''Set passability of a cell in the map and mark its cluster for rebuilding.'''
+        ind = self.index.index(pos)
+        self.connectivity.set_blocked(pos, blocked)
+        if self.blocked[ind] != blocked:
+            self.blocked[ind] = blocked
+            self._dirty.add(int(self.cluster[ind]))
+
+    def refresh(self):
+        '''Re-read the blocked layer from the map after it was changed directly.'''
+        blocked = np.asarray(self.hexmap.get_layer(self.blocked_attr), dtype=bool)
+        changed = np.flatnonzero(blocked != self.blocked)
+        self.blocked = blocked.copy()
+        self._dirty.update(self.cluster[changed].tolist())
+        self.connectivity.refresh()
+
+    ############################# Queries #############################
+    def abstract_path(self, start: HexPos, goal: HexPos) -> typing.List[int]:
+        '''Get the sequence of cell indices through the abstract graph.'''
+        self._rebuild_dirty()
+        s, g = self.index.index(start), self.index.index(goal)
+        if not self.connectivity.connected(start, goal):
+            if profiler.enabled: profiler.count('unreachable_skipped')
+            raise NoPathFound.from_src_and_dest(start, goal)
+        if s == g:
+            return [s]
+        cs, cg = int(self.cluster[s]), int(self.cluster[g])
+
+        # connect start and goal to the entrances of their clusters
+        start_dist, _ = self._cluster_bfs(s, cs)
+        goal_dist, _ = self._cluster_bfs(g, cg)
+        start_edges = {n: start_dist[n] for n in self.intra[cs] if n in start_dist}
+        goal_edges = {n: goal_dist[n] for n in self.intra[cg] if n in goal_dist}
+        if cs == cg and g in start_dist:
+            start_edges[_GOAL] = start_dist[g]
+
+        gq, gr, gs = self.index.q[g], self.index.r[g], self.index.s[g]
+        qs, rs, ss = self.index.q, self.index.r, self.index.s
+        def heuristic(n: int) -> int:
+            return max(abs(qs[n]-gq), abs(rs[n]-gr), abs(ss[n]-gs))
+
+        g_score = {_START: 0}
+        came_from = dict()
+        heap = [(0, 0, _START)]
+        expanded = 0
+        while heap:
+            _, cost, node = heapq.heappop(heap)
+            if cost > g_score.get(node, float('inf')):
+                continue
+            expanded += 1
+            if node == _GOAL:
+                break
+            if node == _START:
+                edges = start_edges.items()
+            else:
+                c = self.cluster[node]
+                edges = list(self.intra[c].get(node, {}).items()) + [(v, 1) for v in self.inter[node]]
+                if node in goal_edges:
+                    edges.append((_GOAL, goal_edges[node]))
+            for nxt, w in edges:
+                new_cost = cost + w
+                if new_cost < g_score.get(nxt, float('inf')):
+                    g_score[nxt] = new_cost
+                    came_from[nxt] = node
+                    h = 0 if nxt == _GOAL else heuristic(nxt)
+                    heapq.heappush(heap, (new_cost + h, new_cost, nxt))
+
+        if profiler.enabled: profiler.count('hpa_expanded', expanded)
+        if _GOAL not in came_from:
+            raise NoPathFound.from_src_and_dest(start, goal)
+
+        path = [g]
+        node = came_from[_GOAL]
+        while node != _START:
+            path.append(node)
+            node = came_from[node]
+        path.append(s)
+        path.reverse()
+        return path
+
+    def iter_path(self, start: HexPos, goal: HexPos) -> typing.Iterator[HexPos]:
+        '''Yield positions from start to goal, refining one abstract segment at a time.'''
+        nodes = self.abstract_path(start, goal)
+        yield self.index.pos(nodes[0])
+        for a, b in zip(nodes[:-1], nodes[1:]):
+            for i in self._refine(a, b)[1:]:
+                yield self.index.pos(i)
+
+    def find_path(self, start: HexPos, goal: HexPos) -> typing.List[HexPos]:
+        '''Get a full path from start to goal, including both ends.'''
+        return list(self.iter_path(start, goal))
+
+    def _refine(self, a: int, b: int) -> typing.List[int]:
+        '''Cell path between two consecutive abstract nodes.'''
+        if b in self._neighbors[a]:
+            return [a, b]
+        _, parent = self._cluster_bfs(a, int(self.cluster[a]), target=b)
+        path = [b]
+        while path[-1] != a:
+            path.append(parent[path[-1]])
+        path.reverse()
+        return path
+
+
+def _segments(edges: typing.List[typing.Tuple[int, int]], neighbors: typing.List[typing.List[int]]) -> typing.List[typing.List[typing.Tuple[int, int]]]:
+    '''Group border edges into contiguous segments, ordered along the border.'''
+    def touching(e1, e2):
+        return (e1[0] == e2[0] or e1[0] in neighbors[e2[0]]) and (e1[1] == e2[1] or e1[1] in neighbors[e2[1]])
+
+    remaining = list(edges)
+    segments = list()
+    while remaining:
+        seg = [remaining.pop()]
+        grown = True
+        while grown:
+            grown = False
+            for e in list(remaining):
+                if touching(e, seg[0]):
+                    seg.insert(0, e)
+                elif touching(e, seg[-1]):
+                    seg.append(e)
+                else:
+                    continue
+                remaining.remove(e)
+                grown = True
+        segments.append(seg)
+    return segments
@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+import dataclasses
+import typing
+import numpy as np
+
+from .hexpos import HexPos
+from ..errors import *
+from ..profiling import profiler
+
+if typing.TYPE_CHECKING:
+    from .hexmap import HexMap
+    from ..agent import Agent
+
+
+class MoveContext:
+    '''Candidate moves being checked, with cached access to map layers and
+        agent columns for rules. dst is (m, k) cell indices for m agents,
+        with off-map candidates replaced by the agent's own cell. Location
+        state attributes are read from the map's cached layer arrays, so
+        change them through set_state or set_layer.
+    '''
+    def __init__(self, hexmap: HexMap, agents: typing.Sequence[Agent], src: np.ndarray, dst: np.ndarray,
+            columns: typing.Dict[str, np.ndarray] = None):
+        self.hexmap = hexmap
+        self.agents = agents
+        self.src = src
+        self.dst = dst
+        self.columns = dict(columns) if columns is not None else dict()
+        self._counts = None
+
+    def layer(self, name: str, cells: np.ndarray) -> np.ndarray:
+        '''Values of a field or location state attribute at cell indices.'''
+        if name in self.hexmap.fields:
+            return self.hexmap.fields[name].values[cells]
+        return self.hexmap.layer_values(name, cells)
+
+    def column(self, name: str) -> np.ndarray:
+        '''Per-agent values, from the columns given to the engine or else
+            read from each agent's state.
+        '''
+        if name not in self.columns:
+            self.columns[name] = np.array([getattr(agent.state, name) for agent in self.agents])
+        return np.asarray(self.columns[name])
+
+    def agent_counts(self, cells: np.ndarray) -> np.ndarray:
+        '''Number of agents on cells before anyone moves. A few cells (such
+            as a single move checked in strict mode) are looked up directly
+            and more are read from the map's agent_counts().
+        '''
+        hexmap = self.hexmap
+        if self._counts is None:
+            if 4*cells.size < len(hexmap.agent_positions):
+                index = hexmap.index
+                counts = [hexmap.peek(index.pos(i)).num_agents for i in cells.ravel().tolist()]
+                return np.array(counts, dtype=np.int64).reshape(cells.shape)
+            self._counts = hexmap.agent_counts()
+        return self._counts[cells]
+
+    @property
+    def stay(self) -> np.ndarray:
+        '''Mask of candidates where the agent stays put.'''
+        return self.dst == self.src[:, None]
+
+
+class MovementRule:
+    '''A movement legality rule evaluated for many candidate moves at once.
+        Subclasses implement legal(ctx), returning a boolean array shaped
+        like ctx.dst.
+    '''
+    def legal(self, ctx: MoveContext) -> np.ndarray:
+        raise NotImplementedError('Movement rules must implement legal().')
+
+
+@dataclasses.dataclass
+class Passable(MovementRule):
+    '''Agents cannot enter cells where a boolean layer is set. Staying put is allowed.'''
+    layer: str = 'blocked'
+
+    def legal(self, ctx: MoveContext) -> np.ndarray:
+        return ctx.stay | ~ctx.layer(self.layer, ctx.dst).astype(bool)
+
+
+@dataclasses.dataclass
+class TerrainCost(MovementRule):
+    '''Entering a cell costs the value of a layer, which must not exceed the
+        agent's budget column. Staying put is free.
+    '''
+    cost_layer: str
+    budget_column: str
+
+    def legal(self, ctx: MoveContext) -> np.ndarray:
+        return ctx.stay | (ctx.layer(self.cost_layer, ctx.dst) <= ctx.column(self.budget_column)[:, None])
+
+
+@dataclasses.dataclass
+class MaxOccupancy(MovementRule):
+    '''A cell may hold at most limit agents, given as a number or as the
+        name of a capacity layer. Counts are taken before anyone moves, and
+        MovementRules.choose limits how many agents enter each cell at once.
+    '''
+    limit: typing.Union[int, str] = 1
+
+    def legal(self, ctx: MoveContext) -> np.ndarray:
+        limit = ctx.layer(self.limit, ctx.dst) if isinstance(self.limit, str) else self.limit
+        return ctx.stay | (ctx.agent_counts(ctx.dst) < limit)
+
+    def capacity(self, hexmap: HexMap) -> np.ndarray:
+        '''Get the limit of every cell in index order.'''
+        if isinstance(self.limit, str):
+            return np.asarray(hexmap.layer_array(self.limit), dtype=np.int64)
+        return np.full(len(hexmap.index), self.limit, dtype=np.int64)
+
+
+@dataclasses.dataclass
+class MaxStep(MovementRule):
+    '''Agents can move at most max_dist cells per move.'''
+    max_dist: int = 1
+
+    def legal(self, ctx: MoveContext) -> np.ndarray:
+        index = ctx.hexmap.index
+        dq = index.q[ctx.dst] - index.q[ctx.src][:, None]
+        dr = index.r[ctx.dst] - index.r[ctx.src][:, None]
+        return (np.abs(dq) + np.abs(dr) + np.abs(dq + dr)) // 2 <= self.max_dist
+
+
+@dataclasses.dataclass
+class FactionZones(MovementRule):
+    '''Cells of a zone layer belong to a faction; agents can only enter
+        neutral cells or those of their own faction column.
+    '''
+    zone_layer: str
+    faction_column: str
+    neutral: typing.Any = 0
+
+    def legal(self, ctx: MoveContext) -> np.ndarray:
+        zones = ctx.layer(self.zone_layer, ctx.dst)
+        return ctx.stay | (zones == self.neutral) | (zones == ctx.column(self.faction_column)[:, None])
+
+
+class MovementRules:
+    '''Evaluates a set of movement rules for every agent's candidate moves
+        (staying put and the six neighbors, in HEX_DIRECTIONS order) as one
+        boolean mask per tick, and checks single moves for HexMap.move_agent
+        in strict mode. Rules read map layers and agent columns through a
+        MoveContext, so the same rule serves both.
+    '''
+    def __init__(self, hexmap: HexMap, rules: typing.Iterable[MovementRule]):
+        self.hexmap = hexmap
+        self.index = hexmap.index
+        self.rules = list(rules)
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self.rules})'
+
+    ############################# Candidate Moves #############################
+    def candidates(self, agents: typing.Sequence[Agent]) -> typing.Tuple[np.ndarray, np.ndarray]:
+        '''Get each agent's cell and its (m, 7) candidate cells, -1 where off the map.'''
+        index = self.index
+        src = np.fromiter((index.index(self.hexmap.agent_pos(agent)) for agent in agents),
+            dtype=np.int64, count=len(agents))
+        dst = np.concatenate([src[:, None], index.neighbors[src]], axis=1)
+        return src, dst
+
+    def legal_moves(self, agents: typing.Sequence[Agent], columns: typing.Dict[str, np.ndarray] = None
+            ) -> typing.Tuple[np.ndarray, np.ndarray]:
+        '''Get the (m, 7) candidate cells of the agents and the mask of the
+            ones that are legal under every rule. Off-map candidates are
+            never legal.
+            Args:
+                columns: per-agent arrays for the agent columns used by
+                    rules; missing columns are read from agent states.
+        '''
+        src, dst = self.candidates(agents)
+        with profiler.phase('movement'):
+            legal = self._evaluate(agents, src, dst, columns)
+        if profiler.enabled: profiler.count('move_candidates', dst.size)
+        return dst, legal
+
+    def _evaluate(self, agents: typing.Sequence[Agent], src: np.ndarray, dst: np.ndarray,
+            columns: typing.Dict[str, np.ndarray] = None) -> np.ndarray:
+        on_map = dst >= 0
+        ctx = MoveContext(self.hexmap, agents, src, np.where(on_map, dst, src[:, None]), columns)
+        legal = on_map
+        for rule in self.rules:
+            legal = legal & rule.legal(ctx)
+        return legal
+
+    def capacity(self) -> typing.Optional[np.ndarray]:
+        '''Get the number of agents each cell may hold under the MaxOccupancy
+            rules, or None if there are none.
+        '''
+        limits = [rule.capacity(self.hexmap) for rule in self.rules if isinstance(rule, MaxOccupancy)]
+        return np.minimum.reduce(limits) if limits else None
+
+    def choose(self, agents: typing.Sequence[Agent], rng: np.random.Generator,
+            columns: typing.Dict[str, np.ndarray] = None) -> np.ndarray:
+        '''Pick a legal candidate cell uniformly at random for every agent.
+            Agents with no legal candidate stay put. Under MaxOccupancy, the
+            agents choosing a cell are admitted in random order until it is
+            full and the rest stay put, so no cell goes over its limit.
+        '''
+        dst, legal = self.legal_moves(agents, columns)
+        keys = np.where(legal, rng.random(dst.shape), -1.0)
+        choice = dst[np.arange(len(dst)), keys.argmax(axis=1)]
+        chosen = np.where(legal.any(axis=1), choice, dst[:, 0])
+        capacity = self.capacity()
+        if capacity is not None:
+            chosen = self._admit(dst[:, 0], chosen, capacity - self.hexmap.agent_counts(), rng)
+        return chosen
+
+    @staticmethod
+    def _admit(src: np.ndarray, chosen: np.ndarray, free: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        '''Keep the moves into each cell, in random order, up to its free
+            places; the other movers stay on src. Leaving agents do not free
+            places, so the limit holds whatever order the moves are made in.
+        '''
+        movers = np.flatnonzero(chosen != src)
+        movers = movers[rng.permutation(len(movers))]
+        cells = chosen[movers]
+        order = np.argsort(cells, kind='stable')
+        sorted_cells = cells[order]
+        rank = np.empty(len(movers), dtype=np.int64)
+        rank[order] = np.arange(len(movers)) - np.searchsorted(sorted_cells, sorted_cells)
+        rejected = movers[rank >= free[cells]]
+        chosen = chosen.copy()
+        chosen[rejected] = src[rejected]
+        return chosen
+
+    def step(self, agents: typing.Sequence[Agent], rng: np.random.Generator,
+            columns: typing.Dict[str, np.ndarray] = None) -> int:
+        '''Move every agent to a cell picked by choose and get the number of
+            agents that moved. Choices are made before anyone moves, so in
+            strict mode moves that became illegal are skipped.
+        '''
+        chosen = self.choose(agents, rng, columns)
+        moved = 0
+        for agent, i in zip(agents, chosen.tolist()):
+            pos = self.index.pos(i)
+            if pos == self.hexmap.agent_pos(agent):
+                continue
+            try:
+                self.hexmap.move_agent(agent, pos)
+            except MovementRuleViolationError:
+                continue
+            moved += 1
+        return moved
+
+    ############################# Single Moves #############################
+    def violations(self, agent: Agent, pos: HexPos) -> typing.List[MovementRule]:
+        '''Get the rules that moving agent to pos would violate.'''
+        src = np.array([self.index.index(self.hexmap.agent_pos(agent))])
+        dst = np.array([[self.index.index(pos)]])
+        ctx = MoveContext(self.hexmap, [agent], src, dst)
+        return [rule for rule in self.rules if not rule.legal(ctx)[0, 0]]
+
+    def check(self, agent: Agent, pos: HexPos):
+        '''Raise MovementRuleViolationError if moving agent to pos is illegal.'''
+        violated = self.violations(agent, pos)
+        if violated:
+            raise MovementRuleViolationError(f'Moving agent {agent.id} to {pos} violates {violated}.')
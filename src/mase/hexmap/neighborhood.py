@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import typing
+import numpy as np
+
+from .hexindex import HexIndex
+from ..profiling import profiler
+
+AGGREGATIONS = ('sum', 'count', 'mean', 'max')
+
+
+def disk_aggregate(index: HexIndex, values: np.ndarray, k: int, how: str = 'sum') -> np.ndarray:
+    '''Aggregate values over the hex disk of radius k around every cell.
+        Values are laid out on the axial (q, r) grid. A hex disk covers one
+        contiguous run of r for each row q, so sums come from prefix sums
+        along r (2k+1 lookups per cell) and maxima from a sparse table of
+        power-of-two window maxima along r. Cells off the map are ignored.
+        Args:
+            values: array over the cell index.
+            how: 'sum', 'count' (number of nonzero values), 'mean' (over the
+                cells of the disk that are on the map) or 'max'.
+        Returns:
+            array over the cell index.
+    '''
+    if how not in AGGREGATIONS:
+        raise ValueError(f'Unknown aggregation "{how}". Use one of {AGGREGATIONS}.')
+    if k < 0:
+        raise ValueError(f'Disk radius must be non-negative, got {k}.')
+    values = np.asarray(values)
+    if values.shape != (len(index),):
+        raise ValueError(f'Values have shape {values.shape}, expected ({len(index)},).')
+
+    with profiler.phase('neighborhood'):
+        if how == 'count':
+            return _disk_sums(index, (values != 0).astype(np.int64), k)
+        elif how == 'sum':
+            return _disk_sums(index, values, k)
+        elif how == 'mean':
+            sizes = _disk_sums(index, np.ones(len(index), dtype=np.int64), k)
+            return _disk_sums(index, values.astype(float), k) / sizes
+        else:
+            return _disk_max(index, values, k)
+
+
+def _grid(index: HexIndex, values: np.ndarray, k: int, fill) -> np.ndarray:
+    '''Place values on a (q, r) grid padded by k on every side.'''
+    size = 2*index.radius + 1 + 2*k
+    grid = np.full((size, size), fill, dtype=values.dtype)
+    grid[index.q + index.radius + k, index.r + index.radius + k] = values
+    return grid
+
+def _row_bounds(k: int) -> typing.Iterator[typing.Tuple[int, int, int]]:
+    '''(dq, lowest dr, highest dr) for each row of a disk of radius k.'''
+    for dq in range(-k, k+1):
+        yield dq, max(-k, -dq-k), min(k, -dq+k)
+
+def _disk_sums(index: HexIndex, values: np.ndarray, k: int) -> np.ndarray:
+    dtype = np.float64 if values.dtype.kind == 'f' else np.int64
+    grid = _grid(index, values.astype(dtype), k, 0)
+    # prefix[:, j] is the sum of grid[:, :j]
+    prefix = np.zeros((grid.shape[0], grid.shape[1] + 1), dtype=dtype)
+    np.cumsum(grid, axis=1, out=prefix[:, 1:])
+
+    q = index.q + index.radius + k
+    r = index.r + index.radius + k
+    total = np.zeros(len(index), dtype=dtype)
+    for dq, lo, hi in _row_bounds(k):
+        total += prefix[q + dq, r + hi + 1] - prefix[q + dq, r + lo]
+    return total
+
+def _disk_max(index: HexIndex, values: np.ndarray, k: int) -> np.ndarray:
+    if values.dtype.kind == 'b':
+        return _disk_max(index, values.astype(np.int8), k).astype(bool)
+    fill = -np.inf if values.dtype.kind == 'f' else np.iinfo(values.dtype).min
+    grid = _grid(index, values, k, fill)
+
+    # table[p][:, j] is the max of grid[:, j:j+2**p]
+    table = [grid]
+    width = 1
+    while 2*width <= 2*k + 1:
+        prev = table[-1]
+        level = np.full_like(prev, fill)
+        level[:, :-width] = np.maximum(prev[:, :-width], prev[:, width:])
+        table.append(level)
+        width *= 2
+
+    q = index.q + index.radius + k
+    r = index.r + index.radius + k
+    result = np.full(len(index), fill, dtype=grid.dtype)
+    for dq, lo, hi in _row_bounds(k):
+        length = hi - lo + 1
+        p = length.bit_length() - 1
+        level = table[p]
+        result = np.maximum(result, level[q + dq, r + lo])
+        result = np.maximum(result, level[q + dq, r + hi - 2**p + 1])
+    return result
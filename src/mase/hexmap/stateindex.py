@@ -0,0 +1,143 @@
+from __future__ import annotations
+
+import bisect
+import typing
+import numpy as np
+
+from .hexpos import HexPos
+from ..profiling import profiler
+
+if typing.TYPE_CHECKING:
+    from .hexmap import HexMap
+
+
+class HashIndex:
+    '''Cells grouped by the value of a categorical location state attribute,
+        so the cells holding a value are found in time proportional to their
+        number. The index keeps its own copy of the attribute; write it
+        through HexMap.set_state (or call refresh) to keep the index current.
+    '''
+    def __init__(self, hexmap: HexMap, attr: str):
+        self.hexmap = hexmap
+        self.index = hexmap.index
+        self.attr = attr
+        self.refresh()
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self.hexmap}, "{self.attr}", num_keys={len(self.cells)})'
+
+    def refresh(self):
+        '''Re-read the attribute from the map after it was changed directly.'''
+        self.values = np.asarray(self.hexmap.get_layer(self.attr)).tolist()
+        self.cells: typing.Dict[typing.Any, typing.Set[int]] = dict()
+        for i, value in enumerate(self.values):
+            self.cells.setdefault(value, set()).add(i)
+
+    def update(self, i: int, value: typing.Any):
+        '''Record that cell i now holds value.'''
+        old = self.values[i]
+        if old == value:
+            return
+        cells = self.cells[old]
+        cells.discard(i)
+        if not cells:
+            del self.cells[old]
+        self.cells.setdefault(value, set()).add(i)
+        self.values[i] = value
+
+    ############################# Queries #############################
+    def keys(self) -> typing.List[typing.Any]:
+        '''Get the distinct values held by at least one cell.'''
+        return list(self.cells)
+
+    def count(self, value: typing.Any) -> int:
+        return len(self.cells.get(value, ()))
+
+    def cell_indices(self, value: typing.Any) -> typing.List[int]:
+        '''Get indices of the cells holding value, in index order.'''
+        if profiler.enabled: profiler.count('state_index_queries')
+        return sorted(self.cells.get(value, ()))
+
+    def positions(self, value: typing.Any) -> typing.List[HexPos]:
+        return [self.index.pos(i) for i in self.cell_indices(value)]
+
+
+class SortedIndex:
+    '''Cells sorted by the value of a numeric location state attribute, so
+        range queries cost a binary search plus the size of the result. The
+        index keeps its own copy of the attribute; write it through
+        HexMap.set_state (or call refresh) to keep the index current.
+    '''
+    def __init__(self, hexmap: HexMap, attr: str):
+        self.hexmap = hexmap
+        self.index = hexmap.index
+        self.attr = attr
+        self.refresh()
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self.hexmap}, "{self.attr}")'
+
+    def refresh(self):
+        '''Re-read the attribute from the map after it was changed directly.'''
+        layer = np.asarray(self.hexmap.get_layer(self.attr))
+        self.values = layer.tolist()
+        order = np.argsort(layer, kind='stable').tolist()
+        # (value, cell) pairs, so cells with equal values are in index order
+        self.entries = [(self.values[i], i) for i in order]
+
+    def update(self, i: int, value: typing.Any):
+        '''Record that cell i now holds value.'''
+        old = self.values[i]
+        if old == value:
+            return
+        del self.entries[bisect.bisect_left(self.entries, (old, i))]
+        bisect.insort(self.entries, (value, i))
+        self.values[i] = value
+
+    ############################# Queries #############################
+    def _bounds(self, lo, hi, lo_inclusive: bool, hi_inclusive: bool) -> typing.Tuple[int, int]:
+        n = len(self.values)
+        entries = self.entries
+        if lo is None:
+            start = 0
+        else:
+            start = bisect.bisect_left(entries, (lo, -1)) if lo_inclusive else bisect.bisect_right(entries, (lo, n))
+        if hi is None:
+            stop = len(entries)
+        else:
+            stop = bisect.bisect_right(entries, (hi, n)) if hi_inclusive else bisect.bisect_left(entries, (hi, -1))
+        return start, stop
+
+    def cell_indices(self, lo: typing.Any = None, hi: typing.Any = None,
+            lo_inclusive: bool = True, hi_inclusive: bool = True) -> typing.List[int]:
+        '''Get indices of the cells with lo <= value <= hi, in order of
+            value. Either bound may be None, and either may be made strict.
+        '''
+        if profiler.enabled: profiler.count('state_index_queries')
+        start, stop = self._bounds(lo, hi, lo_inclusive, hi_inclusive)
+        return [i for _, i in self.entries[start:stop]]
+
+    def count(self, lo: typing.Any = None, hi: typing.Any = None,
+            lo_inclusive: bool = True, hi_inclusive: bool = True) -> int:
+        start, stop = self._bounds(lo, hi, lo_inclusive, hi_inclusive)
+        return max(stop - start, 0)
+
+    def positions(self, lo: typing.Any = None, hi: typing.Any = None,
+            lo_inclusive: bool = True, hi_inclusive: bool = True) -> typing.List[HexPos]:
+        return [self.index.pos(i) for i in self.cell_indices(lo, hi, lo_inclusive, hi_inclusive)]
+
+    def min(self) -> typing.Tuple[typing.Any, HexPos]:
+        '''Get the smallest value and the first cell holding it.'''
+        value, i = self.entries[0]
+        return value, self.index.pos(i)
+
+    def max(self) -> typing.Tuple[typing.Any, HexPos]:
+        '''Get the largest value and the last cell holding it.'''
+        value, i = self.entries[-1]
+        return value, self.index.pos(i)
+
+
+STATE_INDEX_KINDS = {
+    'hash': HashIndex,
+    'sorted': SortedIndex,
+}
@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+import typing
+import numpy as np
+
+from .hexpos import HexPos
+from .hexmap import HexMap
+from .hexindex import round_axial
+from ..errors import *
+from ..profiling import profiler
+
+
+class Visibility:
+    '''Line-of-sight and field-of-view queries over a map.
+        Opacity is taken from a boolean location state attribute. A copy of
+        the opacity layer is kept here, so opacity should be changed through
+        set_opaque, or refresh should be called after changing it directly.
+        Field-of-view results are cached per (position, radius) and an entry
+        is only dropped when a cell within its radius changes opacity. fov
+        agrees with los: it holds exactly the cells within the radius that
+        los reaches from the center.
+    '''
+    def __init__(self, hexmap: HexMap, opacity: str = 'opaque'):
+        self.hexmap = hexmap
+        self.index = hexmap.index
+        self.opacity = opacity
+        self.opaque = np.asarray(hexmap.get_layer(opacity), dtype=bool).copy()
+        self.fov_cache: typing.Dict[typing.Tuple[HexPos, int], typing.FrozenSet[HexPos]] = dict()
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self.hexmap}, opacity="{self.opacity}")'
+
+    ############################# Updating Opacity #############################
+    def set_opaque(self, pos: HexPos, opaque: bool):
+        '''Set opacity of a cell in the map and invalidate affected cached results.'''
+        ind = self.index.index(pos)
+        self.hexmap.set_state(pos, self.opacity, opaque)
+        if self.opaque[ind] != opaque:
+            self.opaque[ind] = opaque
+            self._invalidate([ind])
+
+    def refresh(self):
+        '''Re-read the opacity layer from the map after it was changed directly.'''
+        opaque = np.asarray(self.hexmap.get_layer(self.opacity), dtype=bool)
+        changed = np.flatnonzero(opaque != self.opaque)
+        if len(changed):
+            self.opaque = opaque.copy()
+            self._invalidate(changed)
+
+    def _invalidate(self, changed: typing.Sequence[int]):
+        cq, cr, cs = self.index.q[changed], self.index.r[changed], self.index.s[changed]
+        stale = list()
+        for key in self.fov_cache:
+            center, radius = key
+            dist = np.maximum(np.maximum(np.abs(cq - center.q), np.abs(cr - center.r)), np.abs(cs - center.s))
+            if (dist <= radius).any():
+                stale.append(key)
+        for key in stale:
+            del self.fov_cache[key]
+
+    def is_opaque(self, pos: HexPos) -> bool:
+        return bool(self.opaque[self.index.index(pos)])
+
+    ############################# Line of Sight #############################
+    def los(self, viewer: HexPos, target: HexPos) -> bool:
+        '''Check whether no opaque cell lies strictly between viewer and target.'''
+        for pos in viewer.line(target)[1:-1]:
+            if self.is_opaque(pos):
+                return False
+        return True
+
+    def los_many(self, viewer: HexPos, targets: typing.Sequence[HexPos]) -> np.ndarray:
+        '''Vectorized line-of-sight from one viewer to many targets.'''
+        if not len(targets):
+            return np.zeros(0, dtype=bool)
+        tq = np.array([t.q for t in targets])
+        tr = np.array([t.r for t in targets])
+        return self.los_indices(viewer, self.index.indices(tq, tr))
+
+    def los_indices(self, viewer: HexPos, targets: np.ndarray) -> np.ndarray:
+        '''Vectorized line-of-sight from one viewer to targets given as cell indices.'''
+        self.index.index(viewer)
+        if np.any(targets < 0):
+            raise OutOfBoundsError(f'Line-of-sight targets must be on {self.hexmap}.')
+        dq = self.index.q[targets] - viewer.q
+        dr = self.index.r[targets] - viewer.r
+        dist = (np.abs(dq) + np.abs(dr) + np.abs(dq + dr)) // 2
+        max_dist = int(dist.max()) if len(dist) else 0
+        if max_dist < 2:
+            return np.ones(len(targets), dtype=bool)
+
+        # sample every target's line at the same number of steps and mask steps past its end
+        steps = np.arange(1, max_dist)[None, :]
+        n = np.maximum(dist, 1)[:, None]
+        inside = steps < n
+        t = np.minimum(steps, n) / n
+        q = viewer.q + 1e-6 + dq[:, None] * t
+        r = viewer.r + 1e-6 + dr[:, None] * t
+        rq, rr = round_axial(q, r)
+        inds = self.index.indices(rq, rr)
+        blocked = inside & (inds >= 0) & self.opaque[np.where(inds >= 0, inds, 0)]
+        return ~blocked.any(axis=1)
+
+    ############################# Field of View #############################
+    def fov(self, center: HexPos, radius: int) -> typing.FrozenSet[HexPos]:
+        '''Get positions visible from center within radius (cached).'''
+        key = (center, radius)
+        try:
+            result = self.fov_cache[key]
+            if profiler.enabled: profiler.count('fov_cache_hits')
+            return result
+        except KeyError:
+            pass
+        if profiler.enabled: profiler.count('fov_cache_misses')
+        cells = self.disk_indices(center, radius)
+        visible = cells[self.los_indices(center, cells)]
+        result = self.fov_cache[key] = frozenset(self.index.pos(i) for i in visible.tolist())
+        return result
+
+    def disk_indices(self, center: HexPos, radius: int) -> np.ndarray:
+        '''Indices of the cells within radius of center, in index order.'''
+        self.index.index(center)
+        dq, dr = np.meshgrid(np.arange(-radius, radius+1), np.arange(-radius, radius+1), indexing='ij')
+        dq, dr = dq.ravel(), dr.ravel()
+        near = np.abs(dq + dr) <= radius
+        inds = self.index.indices(center.q + dq[near], center.r + dr[near])
+        return np.sort(inds[inds >= 0])
+
+    def shadowcast(self, center: HexPos, radius: int) -> typing.Set[HexPos]:
+        '''Approximate field of view computed ring by ring. Each ring
+            position covers an angular interval; opaque visible cells cast
+            shadows over their interval for all outer rings, and a cell is
+            visible when its center angle is not in shadow. Opaque cells
+            themselves can be seen. Near shadow edges this can disagree
+            with los, which fov follows exactly.
+        '''
+        self.index.index(center)
+        visible = {center}
+        shadows: typing.List[typing.Tuple[float, float]] = list()
+        for k in range(1, radius+1):
+            ring = center.ring(k)
+            n = len(ring)
+            new_shadows = list()
+            for j, pos in enumerate(ring):
+                if pos not in self.index:
+                    continue
+                if _in_shadow(j / n, shadows):
+                    continue
+                visible.add(pos)
+                if self.opaque[self.index.index(pos)]:
+                    lo, hi = (j - 0.5) / n, (j + 0.5) / n
+                    if lo < 0:
+                        new_shadows += [(lo + 1, 1.0), (0.0, hi)]
+                    else:
+                        new_shadows.append((lo, hi))
+            shadows = _merge(shadows + new_shadows)
+            if shadows == [(0.0, 1.0)]:
+                break
+        return visible
+
+    def fov_indices(self, center: HexPos, radius: int) -> np.ndarray:
+        '''Field of view as a sorted array of cell indices.'''
+        return np.sort(np.array([self.index.index(pos) for pos in self.fov(center, radius)], dtype=int))
+
+
+def _in_shadow(angle: float, shadows: typing.List[typing.Tuple[float, float]]) -> bool:
+    for lo, hi in shadows:
+        if lo <= angle <= hi:
+            return True
+    return False
+
+def _merge(intervals: typing.List[typing.Tuple[float, float]]) -> typing.List[typing.Tuple[float, float]]:
+    merged = list()
+    for lo, hi in sorted(intervals):
+        if merged and lo <= merged[-1][1] + 1e-9:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], hi))
+        else:
+            merged.append((lo, hi))
+    return merged
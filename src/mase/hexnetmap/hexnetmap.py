@@ -1,40 +1,91 @@
 import copy
-import itertools
 import typing
 import igraph
-from .position import HexPos
-from .location import Locations, Location, LocationState
-from .errors import *
+import numpy as np
+from ..hexmap.hexpos import HexPos, NoPathFound
+from ..hexmap.hexindex import HexIndex
+from ..location import Locations, Location, LocationState, CompactLocation, SharedState
+from ..errors import *
+from ..profiling import profiler
 #from .agentid import AgentID
-from .agent import Agent
+from ..agent import Agent
+
+class HexPath(typing.Sequence[HexPos]):
+    '''Path as an array of cell indices; positions are only created when accessed.'''
+    __slots__ = ['indices', 'index', 'cost']
+
+    def __init__(self, indices: np.ndarray, index: HexIndex, cost: float):
+        self.indices = indices
+        self.index = index
+        self.cost = cost
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}(len={len(self)}, cost={self.cost})'
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.index.pos(j) for j in self.indices[i].tolist()]
+        return self.index.pos(int(self.indices[i]))
+
+    def __iter__(self) -> typing.Iterator[HexPos]:
+        return (self.index.pos(j) for j in self.indices.tolist())
+
+    def __eq__(self, other) -> bool:
+        return list(self) == list(other)
+
+    def positions(self) -> typing.List[HexPos]:
+        return list(self)
+
 
 class HexNetMap:
+    '''Map backed by an igraph graph with one vertex per cell in index order.
+        Edge costs and blocked cells are numpy arrays over the edge and
+        vertex ids that are updated in place; weighted path queries read
+        them directly, so the graph is never rebuilt. All-pairs distances
+        are cached for maps with up to max_cached_cells cells and dropped
+        whenever a cost or blocked cell changes.
+    '''
     pos_vertex: typing.Dict[HexPos, igraph.Vertex]
     agent_pos: typing.Dict[Agent, HexPos]
+    max_cached_cells: int = 2000
 
-    def __init__(self, radius: int, default_state: LocationState = None):
+    def __init__(self, radius: int, default_state: LocationState = None, compact: bool = False):
         self.radius = radius
         self.agent_pos = dict()
+        self.index = HexIndex(radius)
 
         # get set of positions
         self.center = HexPos(0, 0, 0)
-        all_pos = [self.center] + list(self.center.neighbors(radius))
+        all_pos = self.index.positions()
         
         # create new graph
         self.graph = igraph.Graph(directed=False)
         self.graph.add_vertices(len(all_pos))
         
         # use locations as graph attributes
-        locs = [Location(pos, state=copy.deepcopy(default_state)) for pos in all_pos]        
+        if compact:
+            shared = SharedState(copy.deepcopy(default_state)) if default_state is not None else None
+            locs = [CompactLocation(pos, shared) for pos in all_pos]
+        else:
+            locs = [Location(pos, state=copy.deepcopy(default_state)) for pos in all_pos]
         self.graph.vs['loc'] = locs
         
         # create map from postiions to vertices
         self.pos_vertex = {pos:v for pos,v in zip(all_pos, self.graph.vs)}
 
-        # actually add edges
-        for u,v in itertools.product(self.graph.vs, self.graph.vs):
-            if u is not v and u['loc'].pos.dist(v['loc'].pos) == 1:
-                self.graph.add_edge(u,v)
+        # actually add edges, using half of the directions so each appears once
+        src = np.repeat(np.arange(len(all_pos)), 3)
+        dst = self.index.neighbors[:, :3].ravel()
+        self.edge_src, self.edge_dst = src[dst >= 0], dst[dst >= 0]
+        self.graph.add_edges(np.stack([self.edge_src, self.edge_dst], axis=1).tolist())
+
+        self.edge_cost = np.ones(len(self.edge_src))
+        self.blocked = np.zeros(len(all_pos), dtype=bool)
+        self._weights = None
+        self._all_pairs = None
 
     ############################# Dunders #############################    
 
@@ -52,7 +103,7 @@ class HexNetMap:
         return (v['loc'] for v in self.graph.vs)
     
     def __len__(self) -> int:
-        return len(self.locs)
+        return len(self.index)
 
     def __contains__(self, pos: HexPos) -> bool:
         return pos in self.pos_vertex
@@ -63,11 +114,91 @@ class HexNetMap:
         sortkey = lambda a: pos.dist(self.get_agent_pos(a))
         return list(sorted(self.agents, key=sortkey))
 
-    def shortest_path(self, fr: HexPos, to: HexPos, **kwargs) -> typing.List[HexPos]:
-        '''Get the shortest path, a sequence of positions, between fr and to.'''
-        sps = self.graph.get_shortest_paths(self.pos_vertex[fr], to=self.pos_vertex[to])
-        #return [[self.graph.vs[ind]['loc'].pos for ind in sp] for sp in sps]
-        return [self.graph.vs[ind]['loc'].pos for ind in sps[0]]
+    def shortest_path(self, fr: HexPos, to: HexPos, **kwargs) -> HexPath:
+        '''Get the cheapest path between fr and to using edge costs and
+            avoiding blocked cells. Raises NoPathFound if there is none.
+        '''
+        src, dst = self.vertex(fr).index, self.vertex(to).index
+        if self.blocked[src] or self.blocked[dst]:
+            raise NoPathFound.from_src_and_dest(fr, to)
+        if src == dst:
+            return HexPath(np.array([src]), self.index, 0.0)
+
+        weights = self.weights()
+        epath = np.array(self.graph.get_shortest_path(src, dst, weights=weights, output='epath'), dtype=np.int64)
+        cost = float(weights[epath].sum())
+        if not len(epath) or not np.isfinite(cost):
+            raise NoPathFound.from_src_and_dest(fr, to)
+
+        # walk the edges to recover the vertex sequence
+        path = np.empty(len(epath) + 1, dtype=np.int64)
+        path[0] = cur = src
+        for k, (u, v) in enumerate(zip(self.edge_src[epath].tolist(), self.edge_dst[epath].tolist())):
+            cur = v if cur == u else u
+            path[k+1] = cur
+        return HexPath(path, self.index, cost)
+
+    def distances(self, sources: typing.Sequence[HexPos] = None, targets: typing.Sequence[HexPos] = None) -> np.ndarray:
+        '''Matrix of path costs from sources to targets (all cells when
+            None), with inf where no path exists. The all-pairs matrix is
+            cached for small maps.
+        '''
+        src = None if sources is None else [self.vertex(pos).index for pos in sources]
+        dst = None if targets is None else [self.vertex(pos).index for pos in targets]
+        if len(self.index) <= self.max_cached_cells:
+            full = self.all_pairs_distances()
+            return full[np.ix_(src if src is not None else np.arange(len(self.index)),
+                dst if dst is not None else np.arange(len(self.index)))]
+        return self._distances(src, dst)
+
+    def all_pairs_distances(self) -> np.ndarray:
+        '''Get the cached (n, n) matrix of path costs between all cells.'''
+        if self._all_pairs is None:
+            if profiler.enabled: profiler.count('netmap_all_pairs_computed')
+            self._all_pairs = self._distances(None, None)
+        return self._all_pairs
+
+    def _distances(self, src: typing.Optional[typing.List[int]], dst: typing.Optional[typing.List[int]]) -> np.ndarray:
+        dist = np.array(self.graph.distances(src, dst, weights=self.weights()), dtype=float)
+        # blocked cells are unreachable even from themselves
+        rows = self.blocked if src is None else self.blocked[src]
+        cols = self.blocked if dst is None else self.blocked[dst]
+        dist[rows, :] = np.inf
+        dist[:, cols] = np.inf
+        return dist
+
+    ############################# Costs and Blocked Cells #############################
+    def weights(self) -> np.ndarray:
+        '''Edge weights used by path queries: edge costs, with edges touching blocked cells set to inf.'''
+        if self._weights is None:
+            weights = self.edge_cost.copy()
+            weights[self.blocked[self.edge_src] | self.blocked[self.edge_dst]] = np.inf
+            self._weights = weights
+        return self._weights
+
+    def costs_changed(self):
+        '''Drop derived weights and cached distances after edge_cost or blocked were changed directly.'''
+        self._weights = None
+        self._all_pairs = None
+
+    def set_blocked(self, pos: HexPos, blocked: bool = True):
+        '''Block or unblock the cell at pos.'''
+        self.blocked[self.vertex(pos).index] = blocked
+        self.costs_changed()
+
+    def set_edge_cost(self, a: HexPos, b: HexPos, cost: float):
+        '''Set the cost of moving between two neighboring cells.'''
+        eid = self.graph.get_eid(self.vertex(a).index, self.vertex(b).index, error=False)
+        if eid < 0:
+            raise ValueError(f'{a} and {b} are not neighbors on this map.')
+        self.edge_cost[eid] = cost
+        self.costs_changed()
+
+    def set_cell_costs(self, costs: np.ndarray):
+        '''Set terrain costs per cell (in index order); an edge costs the mean of its two cells.'''
+        costs = np.asarray(costs, dtype=float)
+        self.edge_cost[:] = (costs[self.edge_src] + costs[self.edge_dst]) / 2
+        self.costs_changed()
 
     ############################# Vertices/Locations/Positions #############################
     def positions(self) -> typing.List[HexPos]:
@@ -116,12 +247,18 @@ class HexNetMap:
     def move_agent(self, agent: Agent, new_pos: HexPos):
         '''Move the agent to a new location after checking rule.
         '''        
-        old_loc = self.get_agent_loc(agent)
-        new_loc = self[new_pos]
-                        
-        old_loc.remove_agent(agent)
-        new_loc.add_agent(agent)
-        self.agent_pos[agent] = new_pos
+        with profiler.phase('movement'):
+            old_loc = self.get_agent_loc(agent)
+            try:
+                new_loc = self[new_pos]
+            except OutOfBoundsError:
+                if profiler.enabled: profiler.count('moves_rejected')
+                raise
+
+            old_loc.remove_agent(agent)
+            new_loc.add_agent(agent)
+            self.agent_pos[agent] = new_pos
+            if profiler.enabled: profiler.count('moves')
 
     def add_agent(self, agent: Agent, pos: HexPos):
         '''Add the agent to the map.'''
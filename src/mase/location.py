@@ -1,10 +1,12 @@
 import dataclasses
+import enum
 import math
+import numbers
 import typing
 import copy
 
 #from .position import Position
-from .position import HexPos
+from .hexmap.hexpos import HexPos
 #from .agentid import AgentID
 from .agent import Agent, AgentSet
 
@@ -44,6 +46,12 @@ class Location:
     def __contains__(self, agent: Agent) -> bool:
         '''Check if this location contains the agent.'''
         return agent in self.agents
+
+    def peek_state(self) -> LocationState:
+        '''Get the state for reading only. Compact locations do not copy a
+            shared default state that is only peeked at.
+        '''
+        return self.state
     
     @property
     def num_agents(self):
@@ -75,6 +83,174 @@ class Location:
 
         
 
+class _EmptyAgentSet(AgentSet):
+    '''Read-only empty agent set shared by compact locations without agents.'''
+    def _read_only(self, *args):
+        raise TypeError('Compact locations share an empty agent set; use Location.add_agent() instead.')
+    add = update = __ior__ = _read_only
+
+    def __repr__(self) -> str:
+        return 'AgentSet()'
+
+EMPTY_AGENTS = _EmptyAgentSet()
+
+
+class SharedState:
+    '''Default location state shared by the compact locations of a map
+        until each of them first changes its state.
+    '''
+    __slots__ = ['state']
+
+    def __init__(self, state: LocationState):
+        self.state = state
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self.state})'
+
+
+# attribute values that can be read from a shared state without copying it
+_IMMUTABLE = (numbers.Number, str, bytes, tuple, frozenset, enum.Enum, type(None))
+_MISSING = object()
+
+
+class SharedStateView:
+    '''The state of a compact location that still shares the map's default.
+        Reading an immutable attribute (a number, string, tuple and so on)
+        reads the shared default. Setting an attribute to a new value, or
+        reading a mutable attribute or method, first gives the location its
+        own deep copy of the state, so the default is never changed.
+        Setting an attribute to the value it already has does not copy.
+    '''
+    __slots__ = ['_loc']
+
+    def __init__(self, loc: 'CompactLocation'):
+        object.__setattr__(self, '_loc', loc)
+
+    def __getattr__(self, name: str) -> typing.Any:
+        loc = self._loc
+        value = getattr(loc.peek_state(), name)
+        if loc.owns_state or isinstance(value, _IMMUTABLE):
+            return value
+        return getattr(loc.own_state(), name)
+
+    def __setattr__(self, name: str, value: typing.Any):
+        loc = self._loc
+        if not loc.owns_state and isinstance(value, _IMMUTABLE):
+            current = getattr(loc.peek_state(), name, _MISSING)
+            if type(current) is type(value) and current == value:
+                return
+        setattr(loc.own_state(), name, value)
+
+    def __delattr__(self, name: str):
+        delattr(self._loc.own_state(), name)
+
+    @property
+    def __class__(self) -> type:
+        return type(self._loc.peek_state())
+
+    def __eq__(self, other) -> bool:
+        if type(other) is SharedStateView:
+            other = other._loc.peek_state()
+        return self._loc.peek_state() == other
+
+    def __repr__(self) -> str:
+        return repr(self._loc.peek_state())
+
+    def __copy__(self) -> LocationState:
+        return copy.copy(self._loc.peek_state())
+
+    def __deepcopy__(self, memo: dict) -> LocationState:
+        return copy.deepcopy(self._loc.peek_state(), memo)
+
+
+class CompactLocation:
+    '''Location with the same interface as Location that avoids per-cell
+        allocations until they are needed. Empty cells share EMPTY_AGENTS
+        and an agent set is allocated on the first add_agent (and released
+        when the last agent leaves), so occupancy must be changed through
+        add_agent and remove_agent. The state starts as the map's shared
+        default, and the state attribute gives a SharedStateView of it that
+        deep-copies the default when the state is first changed.
+    '''
+    __slots__ = ['pos', '_state', '_agents']
+    pos: HexPos
+
+    def __init__(self, pos: HexPos, state: typing.Union[SharedState, LocationState] = None):
+        self.pos = pos
+        self._state = state
+        self._agents = None
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}(pos={self.pos}, state={self.peek_state()}, agents={self.agents})'
+
+    @property
+    def state(self) -> typing.Union[LocationState, SharedStateView]:
+        state = self._state
+        if type(state) is SharedState:
+            return SharedStateView(self)
+        return state
+
+    @state.setter
+    def state(self, state: LocationState):
+        self._state = state
+
+    def own_state(self) -> LocationState:
+        '''Get the state, first copying the shared default if it is used.'''
+        state = self._state
+        if type(state) is SharedState:
+            state = self._state = copy.deepcopy(state.state)
+        return state
+
+    def peek_state(self) -> LocationState:
+        '''Get the state for reading only, without copying a shared default.'''
+        state = self._state
+        return state.state if type(state) is SharedState else state
+
+    @property
+    def owns_state(self) -> bool:
+        '''Check whether this location has its own copy of the state.'''
+        return type(self._state) is not SharedState
+
+    @property
+    def agents(self) -> AgentSet:
+        return self._agents if self._agents is not None else EMPTY_AGENTS
+
+    @agents.setter
+    def agents(self, agents: AgentSet):
+        self._agents = AgentSet(agents) if agents else None
+
+    ############################# Working With Resources #############################
+    def __contains__(self, agent: Agent) -> bool:
+        return self._agents is not None and agent in self._agents
+
+    @property
+    def num_agents(self):
+        return len(self._agents) if self._agents is not None else 0
+
+    ############################# Utility #############################
+    def get_info(self) -> typing.Dict:
+        '''Get a dict of info about this location.'''
+        return {
+            'coords': self.pos.coords(),
+            'xy': self.pos.coords_xy(),
+            'agents': [a.id for a in self.agents],
+            **self.peek_state().get_info()
+        }
+
+    ############################# Manipulating Agents #############################
+    def add_agent(self, agent: Agent):
+        if self._agents is None:
+            self._agents = AgentSet()
+        self._agents.add(agent)
+
+    def remove_agent(self, agent: Agent):
+        if self._agents is None:
+            raise KeyError(agent)
+        self._agents.remove(agent)
+        if not self._agents:
+            self._agents = None
+
+
 class Locations(typing.List):
     #def __call__(self, **kwargs):
     #    return self.__class__(sorted(self, **kwargs))
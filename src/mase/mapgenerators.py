@@ -1,7 +1,6 @@
 import typing
-import igraph
 
-from .position import HexPos
+from .hexmap.hexpos import HexPos
 
 def neighbors(self, dist: int = 1) -> typing.Set[HexPos]:
     '''Get neighborhood within a given distance.'''
@@ -0,0 +1,83 @@
+import typing
+
+K = typing.TypeVar('K')
+V = typing.TypeVar('V')
+
+
+class OverlayDict(typing.MutableMapping[K, V]):
+    '''Copy-on-write view of a parent mapping. Reads fall through to the
+        parent; assignments and deletions are kept in a delta dict and a
+        set of deleted keys, so the parent is never changed and the overlay
+        can be dropped or cleared in time proportional to its changes.
+        Overlays can be stacked, but the parent must not change while an
+        overlay over it is in use.
+    '''
+    def __init__(self, parent: typing.Mapping[K, V]):
+        self.parent = parent
+        self.delta: typing.Dict[K, V] = dict()
+        self.deleted: typing.Set[K] = set()
+        # read stacked overlays without triggering any copy-on-read they do
+        self._parent_get = parent.peek if isinstance(parent, OverlayDict) else parent.__getitem__
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}(changed={len(self.delta)}, deleted={len(self.deleted)})'
+
+    def peek(self, key: K) -> V:
+        '''Get the value for key without copying it into this overlay.'''
+        try:
+            return self.delta[key]
+        except KeyError:
+            pass
+        if key in self.deleted:
+            raise KeyError(key)
+        return self._parent_get(key)
+
+    def __getitem__(self, key: K) -> V:
+        return self.peek(key)
+
+    def __setitem__(self, key: K, value: V):
+        self.delta[key] = value
+        self.deleted.discard(key)
+
+    def __delitem__(self, key: K):
+        if key in self.deleted:
+            raise KeyError(key)
+        in_delta = self.delta.pop(key, _MISSING) is not _MISSING
+        if key in self.parent:
+            self.deleted.add(key)
+        elif not in_delta:
+            raise KeyError(key)
+
+    def __contains__(self, key) -> bool:
+        return key in self.delta or (key not in self.deleted and key in self.parent)
+
+    def __iter__(self) -> typing.Iterator[K]:
+        deleted = self.deleted
+        for key in self.parent:
+            if key not in deleted:
+                yield key
+        parent = self.parent
+        for key in self.delta:
+            if key not in parent:
+                yield key
+
+    def __len__(self) -> int:
+        parent = self.parent
+        return len(parent) - len(self.deleted) + sum(1 for key in self.delta if key not in parent)
+
+    def peek_items(self) -> typing.Iterator[typing.Tuple[K, V]]:
+        '''Iterate over (key, value) pairs without copying values into this overlay.'''
+        return ((key, self.peek(key)) for key in self)
+
+    @property
+    def num_changed(self) -> int:
+        '''Number of keys assigned or deleted in this overlay.'''
+        return len(self.delta) + len(self.deleted)
+
+    def discard(self):
+        '''Drop all changes made in this overlay.'''
+        self.delta.clear()
+        self.deleted.clear()
+
+
+_MISSING = object()
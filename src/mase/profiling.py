@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import collections
+import contextlib
+import json
+import time
+import typing
+
+if typing.TYPE_CHECKING:
+    from .agent import Agent
+
+_NULL_CONTEXT = contextlib.nullcontext()
+
+
+class _Phase:
+    '''Context manager adding elapsed time to a phase of the current tick.'''
+    __slots__ = ['profiler', 'name', 'start']
+
+    def __init__(self, profiler: Profiler, name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *args):
+        self.profiler.phase_time[self.name] += time.perf_counter() - self.start
+        self.profiler.phase_calls[self.name] += 1
+
+
+class Profiler:
+    '''Collects per-phase timings and counters, exported as one record per tick.
+        Instrumented code checks the enabled attribute before doing any work,
+        so a disabled profiler costs one attribute lookup per call site.
+        With sample_every=k, every k-th agent step in run_agents is timed on
+        its own and attributed to the class of the agent's state, which is
+        where agent behaviour lives.
+    '''
+    def __init__(self):
+        self.enabled = False
+        self.sample_every = 0
+        self.records: typing.List[dict] = list()
+        self.tick = 0
+        self._agent_counter = 0
+        self._reset_tick()
+
+    def _reset_tick(self):
+        self.phase_time: typing.Dict[str, float] = collections.defaultdict(float)
+        self.phase_calls: typing.Dict[str, int] = collections.defaultdict(int)
+        self.counters: typing.Dict[str, int] = collections.defaultdict(int)
+        self.agent_time: typing.Dict[str, float] = collections.defaultdict(float)
+        self.agent_samples: typing.Dict[str, int] = collections.defaultdict(int)
+        self._tick_start = time.perf_counter()
+
+    ############################# Control #############################
+    def enable(self, sample_every: int = 0):
+        '''Start collecting. Discards anything collected for the current tick.'''
+        self.enabled = True
+        self.sample_every = sample_every
+        self._reset_tick()
+
+    def disable(self):
+        '''Stop collecting.'''
+        self.enabled = False
+
+    def reset(self):
+        '''Discard all records and restart tick numbering.'''
+        self.records.clear()
+        self.tick = 0
+        self._reset_tick()
+
+    ############################# Instrumentation #############################
+    def phase(self, name: str) -> typing.ContextManager:
+        '''Time the enclosed block as part of the named phase.'''
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return _Phase(self, name)
+
+    def count(self, name: str, n: int = 1):
+        '''Increment a counter for the current tick.'''
+        self.counters[name] += n
+
+    def run_agents(self, agents: typing.Iterable[Agent], step: typing.Callable[[Agent], typing.Any],
+            key: typing.Callable[[Agent], str] = None):
+        '''Call step on each agent inside the agent_step phase, sampling per-class times.
+            Args:
+                key: name to attribute a sampled step to. Defaults to the
+                    class name of agent.state, or of the agent itself when
+                    it has no state (such as states from a pool).
+        '''
+        if not self.enabled:
+            for agent in agents:
+                step(agent)
+            return
+
+        if key is None:
+            key = _state_class_name
+        with self.phase('agent_step'):
+            k = self.sample_every
+            for agent in agents:
+                self._agent_counter += 1
+                if k and self._agent_counter % k == 0:
+                    start = time.perf_counter()
+                    step(agent)
+                    name = key(agent)
+                    self.agent_time[name] += time.perf_counter() - start
+                    self.agent_samples[name] += 1
+                else:
+                    step(agent)
+
+    ############################# Records #############################
+    def end_tick(self) -> typing.Optional[dict]:
+        '''Store and return the record for the current tick and start the next one.'''
+        if not self.enabled:
+            return None
+        record = {
+            'tick': self.tick,
+            'wall_time': time.perf_counter() - self._tick_start,
+            'phase_time': dict(self.phase_time),
+            'phase_calls': dict(self.phase_calls),
+            'counters': dict(self.counters),
+            'agent_time': {
+                name: {
+                    'samples': self.agent_samples[name],
+                    'sampled_time': t,
+                    'estimated_time': t * self.sample_every,
+                } for name, t in self.agent_time.items()
+            },
+        }
+        self.records.append(record)
+        self.tick += 1
+        self._reset_tick()
+        return record
+
+    def write_jsonl(self, fname: str):
+        '''Write all tick records to a JSON-lines file.'''
+        with open(fname, 'w') as f:
+            for record in self.records:
+                f.write(json.dumps(record) + '\n')
+
+
+def _state_class_name(agent: Agent) -> str:
+    return type(getattr(agent, 'state', agent)).__name__
+
+
+# the profiler used by all instrumented code
+profiler = Profiler()
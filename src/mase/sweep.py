@@ -0,0 +1,289 @@
+from __future__ import annotations
+
+import dataclasses
+import hashlib
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import random
+import typing
+from multiprocessing import shared_memory
+import numpy as np
+
+from .profiling import profiler
+
+ModelFactory = typing.Callable[[typing.Dict[str, typing.Any], int, typing.Dict[str, np.ndarray]], typing.Any]
+
+
+def param_grid(grid: typing.Dict[str, typing.Sequence]) -> typing.List[typing.Dict[str, typing.Any]]:
+    '''Get every combination of the parameter values in grid.'''
+    names = list(grid.keys())
+    return [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+
+
+@dataclasses.dataclass(frozen=True)
+class RunSpec:
+    '''A single replicate of a single parameter combination.'''
+    combo: int
+    replicate: int
+    params: typing.Dict[str, typing.Any]
+    seed: int
+    num_steps: int = 0
+
+    @property
+    def params_hash(self) -> str:
+        '''Hash of the parameters and number of steps, so that stored
+            results are only reused for the same settings.
+        '''
+        key = json.dumps([self.params, self.num_steps], sort_keys=True, default=repr)
+        return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+    @property
+    def run_id(self) -> str:
+        return f'{self.combo}-{self.replicate}-{self.params_hash}-{self.seed}'
+
+    def matches(self, record: typing.Dict[str, typing.Any]) -> bool:
+        '''Check whether a stored result record is of this run.'''
+        return (record.get('run_id') == self.run_id and record.get('params_hash') == self.params_hash
+            and record.get('seed') == self.seed)
+
+
+############################# Shared Memory #############################
+
+@dataclasses.dataclass(frozen=True)
+class SharedLayerSpec:
+    '''Picklable description of an array stored in shared memory.'''
+    shm_name: str
+    shape: typing.Tuple[int, ...]
+    dtype: str
+
+
+class SharedLayers:
+    '''Copies arrays into shared memory blocks so worker processes can map
+        them instead of receiving pickled copies. Workers get read-only views.
+    '''
+    def __init__(self, layers: typing.Dict[str, np.ndarray]):
+        self.blocks: typing.Dict[str, shared_memory.SharedMemory] = dict()
+        self.specs: typing.Dict[str, SharedLayerSpec] = dict()
+        for name, arr in layers.items():
+            arr = np.ascontiguousarray(arr)
+            block = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+            np.ndarray(arr.shape, dtype=arr.dtype, buffer=block.buf)[...] = arr
+            self.blocks[name] = block
+            self.specs[name] = SharedLayerSpec(block.name, arr.shape, arr.dtype.str)
+
+    def __enter__(self) -> SharedLayers:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        '''Release the shared memory blocks.'''
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+        self.blocks.clear()
+
+    @staticmethod
+    def attach(specs: typing.Dict[str, SharedLayerSpec]) -> typing.Tuple[typing.Dict[str, np.ndarray], typing.List[shared_memory.SharedMemory]]:
+        '''Map shared layers in a worker. Keep the returned blocks alive while using the arrays.'''
+        layers, blocks = dict(), list()
+        for name, spec in specs.items():
+            block = shared_memory.SharedMemory(name=spec.shm_name)
+            arr = np.ndarray(spec.shape, dtype=np.dtype(spec.dtype), buffer=block.buf)
+            arr.flags.writeable = False
+            layers[name] = arr
+            blocks.append(block)
+        return layers, blocks
+
+
+############################# Aggregation #############################
+
+class RunningStats:
+    '''Incremental mean and variance (Welford's algorithm).'''
+    __slots__ = ['n', 'mean', '_m2']
+
+    def __init__(self):
+        self.n, self.mean, self._m2 = 0, 0.0, 0.0
+
+    def add(self, value: float):
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self._m2 += delta * (value - self.mean)
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self._m2 / (self.n - 1)) if self.n > 1 else 0.0
+
+
+class SweepResults:
+    '''Aggregates run metrics per parameter combination as they arrive.'''
+    def __init__(self, combos: typing.List[typing.Dict[str, typing.Any]]):
+        self.combos = combos
+        self.stats: typing.Dict[int, typing.Dict[str, RunningStats]] = {i: dict() for i in range(len(combos))}
+        self.completed: typing.Set[str] = set()
+        self.profiles: typing.Dict[str, typing.List[dict]] = dict()
+
+    def __len__(self) -> int:
+        return len(self.completed)
+
+    def add(self, spec: RunSpec, metrics: typing.Dict[str, float]):
+        '''Add the summary metrics of one completed run.'''
+        self.completed.add(spec.run_id)
+        for name, value in metrics.items():
+            self.stats[spec.combo].setdefault(name, RunningStats()).add(value)
+
+    def summary(self) -> typing.List[dict]:
+        '''Get mean, std and count of each metric for every parameter combination.'''
+        rows = list()
+        for combo, params in enumerate(self.combos):
+            row = {**params}
+            for name, stats in self.stats[combo].items():
+                row[f'{name}_mean'] = stats.mean
+                row[f'{name}_std'] = stats.std
+                row[f'{name}_n'] = stats.n
+            rows.append(row)
+        return rows
+
+
+############################# Runner #############################
+
+class SweepRunner:
+    '''Runs replicates of a model over a parameter grid on a process pool.
+        The factory is called in the worker as factory(params, seed, layers)
+        and must return a model with step() and get_info() methods; get_info()
+        after the last step gives the summary metrics of the run. The factory
+        must be picklable (a module-level function). Layers are shared with
+        workers through shared memory. Completed runs are appended to
+        results_path as JSON lines with a hash of their parameters and their
+        seed, and a rerun with the same path skips the runs whose hash and
+        seed both match a stored record.
+        With profile, workers enable the profiler for every run and end a
+        profiler tick after each step; the tick records are kept in
+        SweepResults.profiles and written with the metrics.
+    '''
+    def __init__(self,
+            factory: ModelFactory,
+            grid: typing.Dict[str, typing.Sequence],
+            num_steps: int,
+            replicates: int = 1,
+            layers: typing.Optional[typing.Dict[str, np.ndarray]] = None,
+            results_path: typing.Optional[str] = None,
+            seed: int = 0,
+            profile: bool = False,
+            sample_every: int = 0,
+        ):
+        self.factory = factory
+        self.combos = param_grid(grid)
+        self.num_steps = num_steps
+        self.replicates = replicates
+        self.layers = layers if layers is not None else dict()
+        self.results_path = results_path
+        self.seed = seed
+        self.profile = profile
+        self.sample_every = sample_every
+
+    def specs(self) -> typing.List[RunSpec]:
+        '''Get every run. Seeds depend only on the sweep seed, combination and replicate.'''
+        specs = list()
+        for combo, params in enumerate(self.combos):
+            for rep in range(self.replicates):
+                seed = int(np.random.SeedSequence([self.seed, combo, rep]).generate_state(1)[0])
+                specs.append(RunSpec(combo, rep, params, seed, self.num_steps))
+        return specs
+
+    def run(self, processes: typing.Optional[int] = None,
+            callback: typing.Optional[typing.Callable[[RunSpec, dict], None]] = None) -> SweepResults:
+        '''Run all runs that are not already in results_path.'''
+        results = SweepResults(self.combos)
+        specs = self.specs()
+        spec_lookup = {spec.run_id: spec for spec in specs}
+        for record in self.read_completed():
+            spec = spec_lookup.get(record.get('run_id'))
+            if spec is not None and spec.matches(record) and spec.run_id not in results.completed:
+                results.add(spec, record['metrics'])
+                if record.get('profile') is not None:
+                    results.profiles[spec.run_id] = record['profile']
+        remaining = [spec for spec in specs if spec.run_id not in results.completed]
+        if not remaining:
+            return results
+
+        results_file = None
+        if self.results_path is not None:
+            results_file = open(self.results_path, 'a')
+            if results_file.tell() > 0 and not _ends_with_newline(self.results_path):
+                results_file.write('\n')
+        try:
+            with SharedLayers(self.layers) as shared:
+                ctx = multiprocessing.get_context()
+                sample_every = self.sample_every if self.profile else None
+                initargs = (self.factory, self.num_steps, shared.specs, sample_every)
+                with ctx.Pool(processes, initializer=_init_worker, initargs=initargs) as pool:
+                    for spec, metrics, profile in pool.imap_unordered(_run_worker, remaining):
+                        results.add(spec, metrics)
+                        record = {'run_id': spec.run_id, 'params_hash': spec.params_hash, 'seed': spec.seed, 'metrics': metrics}
+                        if profile is not None:
+                            results.profiles[spec.run_id] = record['profile'] = profile
+                        if results_file is not None:
+                            results_file.write(json.dumps(record) + '\n')
+                            results_file.flush()
+                        if callback is not None:
+                            callback(spec, metrics)
+        finally:
+            if results_file is not None:
+                results_file.close()
+        return results
+
+    def read_completed(self) -> typing.Iterator[typing.Dict[str, typing.Any]]:
+        '''Read the records of completed runs (with run_id, params_hash,
+            seed, metrics and, if profiled, profile) from results_path,
+            ignoring a truncated last line.
+        '''
+        if self.results_path is None or not os.path.exists(self.results_path):
+            return
+        with open(self.results_path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                yield record
+
+
+def _ends_with_newline(fpath: str) -> bool:
+    with open(fpath, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
+
+
+############################# Worker #############################
+
+_worker_state: typing.Dict[str, typing.Any] = dict()
+
+def _init_worker(factory: ModelFactory, num_steps: int, layer_specs: typing.Dict[str, SharedLayerSpec],
+        sample_every: typing.Optional[int] = None):
+    layers, blocks = SharedLayers.attach(layer_specs)
+    _worker_state.update(factory=factory, num_steps=num_steps, layers=layers, blocks=blocks, sample_every=sample_every)
+
+def _run_worker(spec: RunSpec) -> typing.Tuple[RunSpec, dict, typing.Optional[typing.List[dict]]]:
+    random.seed(spec.seed)
+    np.random.seed(spec.seed)
+    sample_every = _worker_state['sample_every']
+    if sample_every is not None:
+        profiler.reset()
+        profiler.enable(sample_every)
+    try:
+        model = _worker_state['factory'](spec.params, spec.seed, _worker_state['layers'])
+        for _ in range(_worker_state['num_steps']):
+            model.step()
+            profiler.end_tick()
+        metrics = model.get_info()
+    finally:
+        if sample_every is not None:
+            profiler.disable()
+    profile = list(profiler.records) if sample_every is not None else None
+    return spec, metrics, profile
@@ -0,0 +1,2 @@
+
+from .visualizer import Visualizer, FrameStream
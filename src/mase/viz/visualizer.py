@@ -1,11 +1,156 @@
+from __future__ import annotations
+
+import os
+import queue
+import threading
 import typing
-import dataclasses
+import numpy as np
+
+import matplotlib.image
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import PolyCollection
+
+from ..hexmap.hexindex import round_axial
+
+if typing.TYPE_CHECKING:
+    from ..hexmap import HexMap
+
+# corners of a unit pointy-top hexagon
+HEX_CORNERS = np.stack([
+    np.cos(np.radians(60*np.arange(6) - 30)),
+    np.sin(np.radians(60*np.arange(6) - 30)),
+], axis=1)
+
+LayerType = typing.Union[str, np.ndarray, None]
 
 
 class Visualizer:
-    '''Visualizer for hexagonal maps.'''
-    def __init__(self, hexmap: HexMap):
+    '''Visualizer for hexagonal maps.
+        Hexagon vertices are computed once and all cells are drawn as a single
+        PolyCollection, so drawing a frame only updates the face colors. A
+        stride larger than one merges cells into hexagons of that size, which
+        keeps very large maps cheap to draw.
+    '''
+    def __init__(self, hexmap: HexMap, stride: int = 1, cmap: str = 'viridis',
+            clim: typing.Optional[typing.Tuple[float, float]] = None,
+            figsize: typing.Tuple[float, float] = (8, 8), dpi: int = 100):
         self.hexmap = hexmap
-        self._hexmap
+        self.stride = stride
+        self.clim = clim
+        index = hexmap.index
+
+        # assign each cell to the coarse hexagon containing it
+        coarse_q, coarse_r = round_axial(index.q / stride, index.r / stride)
+        coarse, self.groups = np.unique(np.stack([coarse_q, coarse_r], axis=1), axis=0, return_inverse=True)
+        self.groups = self.groups.ravel()
+        self.group_sizes = np.bincount(self.groups, minlength=len(coarse))
+
+        centers = stride * np.stack([np.sqrt(3) * (coarse[:, 0] + coarse[:, 1]/2), 1.5 * coarse[:, 1]], axis=1)
+        self.verts = centers[:, None, :] + stride * HEX_CORNERS[None, :, :]
+
+        self.fig = Figure(figsize=figsize, dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_axes([0, 0, 1, 1])
+        self.ax.set_axis_off()
+        self.ax.set_aspect('equal')
+
+        self.collection = PolyCollection(self.verts, cmap=cmap, edgecolors='face')
+        self.collection.set_array(np.zeros(len(self.verts)))
+        if clim is not None:
+            self.collection.set_clim(*clim)
+        self.ax.add_collection(self.collection)
+        self.ax.autoscale_view()
+
+    def __repr__(self) -> str:
+        return f'{self.__class__.__name__}({self.hexmap}, stride={self.stride})'
+
+    ############################# Layers #############################
+    def values(self, layer: LayerType = None) -> np.ndarray:
+        '''Get per-cell values for a layer: a location state attribute name,
+            an array aligned with the cell index, or None for agent counts.
+        '''
+        if layer is None:
+            return self.agent_counts()
+        elif isinstance(layer, str):
+            return self.hexmap.get_layer(layer)
+        return np.asarray(layer)
+
+    def agent_counts(self) -> np.ndarray:
+        '''Number of agents on each cell.'''
+        return self.hexmap.agent_counts()
+
+    ############################# Drawing #############################
+    def draw(self, layer: LayerType = None) -> Figure:
+        '''Update face colors from a layer and return the figure.'''
+        values = np.asarray(self.values(layer), dtype=float)
+        if self.stride > 1:
+            values = np.bincount(self.groups, weights=values, minlength=len(self.verts)) / self.group_sizes
+        self.collection.set_array(values)
+        if self.clim is None:
+            self.collection.autoscale()
+        return self.fig
+
+    def frame(self, layer: LayerType = None) -> np.ndarray:
+        '''Render a layer to an RGBA image array.'''
+        self.draw(layer)
+        self.canvas.draw()
+        return np.asarray(self.canvas.buffer_rgba()).copy()
+
+    def save(self, fname: str, layer: LayerType = None):
+        '''Render a layer and save it to an image file.'''
+        self.draw(layer)
+        self.fig.savefig(fname)
+
+    def stream(self, folder: str, prefix: str = 'frame', maxsize: int = 8) -> FrameStream:
+        '''Create a stream that writes frames from this visualizer to a PNG sequence.'''
+        return FrameStream(self, folder, prefix=prefix, maxsize=maxsize)
+
+
+class FrameStream:
+    '''Encodes and writes rendered frames to numbered PNG files from a background thread.
+        Rendering happens on the calling thread because matplotlib is not
+        thread-safe; only the PNG encoding and file writes are offloaded.
+    '''
+    def __init__(self, visualizer: Visualizer, folder: str, prefix: str = 'frame', maxsize: int = 8):
+        self.visualizer = visualizer
+        self.folder = folder
+        self.prefix = prefix
+        self.num_frames = 0
+        self.error = None
+        os.makedirs(folder, exist_ok=True)
+
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = threading.Thread(target=self._write_frames, daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> FrameStream:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, layer: LayerType = None) -> str:
+        '''Render a layer and queue it for writing. Returns the file name.'''
+        if self.error is not None:
+            raise self.error
+        fname = os.path.join(self.folder, f'{self.prefix}{self.num_frames:06d}.png')
+        self._queue.put((fname, self.visualizer.frame(layer)))
+        self.num_frames += 1
+        return fname
 
+    def close(self):
+        '''Wait for queued frames to be written.'''
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        if self.error is not None:
+            raise self.error
 
+    def _write_frames(self):
+        while (item := self._queue.get()) is not None:
+            if self.error is None:
+                try:
+                    matplotlib.image.imsave(item[0], item[1])
+                except Exception as e:
+                    self.error = e
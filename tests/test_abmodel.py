@@ -0,0 +1,27 @@
+import dataclasses
+
+from mase.abmodel import ABModel
+from mase.agent import Agent
+from mase.agentstatepool import AgentStatePool
+from mase.hexmap import HexMap, HexPos
+from mase.location import LocationState
+
+
+@dataclasses.dataclass
+class FoodState(LocationState):
+    food: int = 0
+
+
+def test_nearest_locs_of_agent():
+    hmap = HexMap(5, FoodState())
+    agent = Agent(7, None)
+    hmap.add_agent(agent, HexPos(1, -1, 0))
+    hmap.set_state(HexPos(3, -3, 0), 'food', 1)
+    hmap.set_state(HexPos(-4, 4, 0), 'food', 1)
+    model = ABModel(hmap, AgentStatePool({7: None}))
+
+    assert model.agent_pos(7) == model.agent_pos(agent) == HexPos(1, -1, 0)
+    found = model.nearest_locs(7, lambda loc: loc.state.food > 0, limit=1)
+    assert [loc.pos for loc in found] == [HexPos(3, -3, 0)]
+    assert len(model.nearest_locs(agent, lambda loc: loc.state.food > 0)) == 2
+    assert [loc.pos for loc in model.nearest_locs(agent, limit=1)] == [HexPos(1, -1, 0)]
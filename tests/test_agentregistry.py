@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+
+from mase.agentregistry import AgentRegistry, slot_of, generation_of
+from mase.errors import AgentDoesNotExistError, StaleAgentIDError
+
+
+def check_dense(reg: AgentRegistry):
+    ids = reg.ids()
+    assert len(ids) == len(set(ids)) == len(reg)
+    for aid in ids:
+        assert aid in reg
+        assert reg.ids()[reg.live_pos[slot_of(aid)]] == aid
+
+
+def test_stale_ids_are_detected():
+    reg = AgentRegistry()
+    a = reg.add_agent('a')
+    reg.remove_agent(a)
+    b = reg.add_agent('b')
+    assert slot_of(a) == slot_of(b) and generation_of(b) == generation_of(a) + 1
+    assert a not in reg and reg[b] == 'b'
+    with pytest.raises(StaleAgentIDError):
+        reg.get_agent(a)
+    with pytest.raises(StaleAgentIDError):
+        reg.schedule_death(a)
+    with pytest.raises(AgentDoesNotExistError):
+        reg.get_agent(b + 1)
+
+
+def test_scheduled_death_of_removed_agent_does_not_kill_slot_reuser():
+    reg = AgentRegistry()
+    a, x = reg.add_agents(['a', 'x'])
+    reg.schedule_death(a)
+    reg.remove_agent(a)
+    c = reg.add_agent('c')
+    assert slot_of(c) == slot_of(a)
+
+    added, removed = reg.end_tick()
+    assert added == [] and removed == []
+    assert reg[c] == 'c' and reg[x] == 'x'
+    check_dense(reg)
+
+
+def test_scheduled_death_of_removed_agent_keeps_others_live():
+    reg = AgentRegistry()
+    a, x, y = reg.add_agents(['a', 'x', 'y'])
+    reg.schedule_death(a)
+    reg.schedule_death(a)
+    reg.remove_agent(a)
+
+    added, removed = reg.end_tick()
+    assert removed == []
+    assert sorted(reg.ids()) == sorted([x, y])
+    assert reg[x] == 'x' and reg[y] == 'y'
+    check_dense(reg)
+
+    # the freed slot is on the free-list once
+    assert [slot_of(aid) for aid in reg.add_agents(['d', 'e'])] == [slot_of(a), 3]
+
+
+def test_end_tick_reuses_lowest_slots():
+    reg = AgentRegistry()
+    ids = reg.add_agents(range(10))
+    for aid in ids[2:8:2]:
+        reg.schedule_death(aid)
+    reg.schedule_birth('new')
+    reg.schedule_birth('new')
+    added, removed = reg.end_tick()
+    assert removed == [2, 4, 6]
+    assert [slot_of(aid) for aid in added] == [2, 4]
+    assert len(reg) == 9
+    check_dense(reg)
+
+
+def test_fork_skips_deaths_of_removed_agents():
+    reg = AgentRegistry()
+    a, x = reg.add_agents(['a', 'x'])
+    fork = reg.fork()
+    fork.schedule_death(a)
+    fork.remove_agent(a)
+    fork.schedule_birth('b')
+    added, removed = fork.end_tick()
+    assert removed == [] and len(added) == 1
+    assert sorted(fork.ids()) == sorted([x] + added)
+    assert sorted(reg.ids()) == sorted([a, x])
+
+
+def test_batched_removal_is_all_or_nothing():
+    reg = AgentRegistry()
+    a, b, c = reg.add_agents('abc')
+    reg.remove_agent(c)
+    with pytest.raises(StaleAgentIDError):
+        reg.remove_agents([a, c])
+    with pytest.raises(StaleAgentIDError):
+        reg.remove_agents([a, a])
+    assert sorted(reg.ids()) == [a, b]
+    assert reg.remove_agents([b, a]) == ['b', 'a']
+    assert len(reg) == 0 and reg.free.tolist() == [0, 1, 2]
+
+
+def test_batched_churn_matches_single_operations():
+    import random
+    rng = random.Random(0)
+    np_rng = np.random.default_rng(0)
+    reg, expected, peak = AgentRegistry(), dict(), 0
+    for tick in range(200):
+        dying = reg.sample(min(len(reg), rng.randint(0, 5)), np_rng)
+        assert len(set(dying)) == len(dying)
+        reg.schedule_deaths(dying)
+        births = [(tick, i) for i in range(rng.randint(0, 6))]
+        reg.schedule_births(births)
+        added, removed = reg.end_tick()
+        assert removed == [expected.pop(aid) for aid in dying]
+        expected.update(zip(added, births))
+        assert sorted(reg.ids()) == sorted(expected)
+        check_dense(reg)
+        peak = max(peak, len(reg))
+        assert len(reg.states) == peak
@@ -0,0 +1,69 @@
+import dataclasses
+import random
+
+import numpy as np
+import pytest
+
+from mase.hexmap import HexMap, HexPos, Connectivity, NoPathFound
+from mase.hexmap.connectivity import _label_components
+from mase.location import LocationState
+from mase.profiling import profiler
+
+
+@dataclasses.dataclass
+class WallState(LocationState):
+    blocked: bool = False
+
+
+def assert_matches_labels(conn: Connectivity):
+    labels = _label_components(conn.index.neighbors, conn.blocked)
+    open_cells = np.flatnonzero(~conn.blocked).tolist()
+    roots = {}
+    for i in open_cells:
+        assert roots.setdefault(labels[i], conn.find(i)) == conn.find(i)
+    assert len(set(roots.values())) == len(roots) == conn.num_components()
+
+
+def test_incremental_updates_match_relabeling():
+    rng = random.Random(0)
+    hmap = HexMap(8, WallState())
+    positions = hmap.index.positions()
+    for pos in positions:
+        hmap.set_state(pos, 'blocked', rng.random() < 0.4)
+    conn = Connectivity(hmap)
+    assert_matches_labels(conn)
+    for _ in range(600):
+        conn.set_blocked(rng.choice(positions), rng.random() < 0.5)
+        assert_matches_labels(conn)
+
+
+def test_refresh_after_direct_changes():
+    hmap = HexMap(6, WallState())
+    conn = Connectivity(hmap)
+    for pos in HexPos(0, 0, 0).ring(2):
+        hmap.loc(pos).state.blocked = True
+    conn.refresh()
+    assert not conn.connected(HexPos(0, 0, 0), HexPos(4, -4, 0))
+    assert conn.connected(HexPos(1, -1, 0), HexPos(0, 1, -1))
+    assert conn.component(HexPos(2, -2, 0)) is None
+
+
+def test_pathfinders_skip_unreachable_targets():
+    hmap = HexMap(6, WallState())
+    conn = Connectivity(hmap)
+    for pos in HexPos(0, 0, 0).ring(2):
+        conn.set_blocked(pos, True)
+    start, end = HexPos(0, 0, 0), HexPos(5, -5, 0)
+    allowed = {pos for pos in hmap.index if not hmap.loc(pos).state.blocked}
+
+    profiler.enable()
+    try:
+        with pytest.raises(NoPathFound):
+            start.a_star(end, allowed_pos=allowed, connectivity=conn)
+        assert hmap.pathfind_dfs(start, end, lambda loc: not loc.state.blocked, connectivity=conn) is None
+        record = profiler.end_tick()
+    finally:
+        profiler.disable()
+        profiler.reset()
+    assert record['counters']['unreachable_skipped'] == 2
+    assert 'a_star_expanded' not in record['counters']
@@ -0,0 +1,90 @@
+import collections
+import dataclasses
+
+import pytest
+
+from mase.hexmap import HexMap, HexPos, CooperativePathfinder, ReservationTable
+from mase.location import LocationState
+
+
+@dataclasses.dataclass
+class RoomState(LocationState):
+    room: int = 1
+
+
+def crossing_requests():
+    '''Two rows of agents that swap sides of the map.'''
+    left = [HexPos(-3, r, 3 - r) for r in range(-1, 3)]
+    right = [HexPos(3, r, -3 - r) for r in range(-3, 1)]
+    requests = [(f'a{i}', start, goal) for i, (start, goal) in enumerate(zip(left, right))]
+    requests += [(f'b{i}', start, goal) for i, (start, goal) in enumerate(zip(right, left))]
+    return requests
+
+
+def assert_no_conflicts(tracks, capacity):
+    '''Check cell capacity and swaps in {agent: [pos at tick 0, 1, ...]}.'''
+    num_ticks = min(len(track) for track in tracks.values())
+    for t in range(num_ticks):
+        counts = collections.Counter(track[t] for track in tracks.values())
+        assert all(n <= capacity(pos) for pos, n in counts.items())
+        if t == 0:
+            continue
+        moves = {(track[t-1], track[t]) for track in tracks.values() if track[t-1] != track[t]}
+        assert all((b, a) not in moves for a, b in moves)
+        assert all(track[t-1].dist(track[t]) <= 1 for track in tracks.values())
+
+
+def test_plans_do_not_collide_or_swap():
+    hmap = HexMap(5)
+    pathfinder = CooperativePathfinder(hmap, window=10)
+    plans = pathfinder.plan_all(crossing_requests(), tick=0)
+    assert all(len(path) == 11 for path in plans.values())
+    assert all(plans[agent][0] == start for agent, start, _ in crossing_requests())
+    assert_no_conflicts(plans, lambda pos: 1)
+
+
+@pytest.mark.parametrize('capacity', [1, 2])
+def test_next_pos_reaches_goals_without_conflicts(capacity):
+    hmap = HexMap(5)
+    pathfinder = CooperativePathfinder(hmap, window=6, capacity=capacity)
+    requests = crossing_requests()
+    tracks = {agent: [start] for agent, start, _ in requests}
+    for tick in range(30):
+        for agent, _, goal in requests:
+            tracks[agent].append(pathfinder.next_pos(agent, tracks[agent][-1], goal, tick))
+        pathfinder.prune(tick)
+    assert_no_conflicts(tracks, lambda pos: capacity)
+    assert all(tracks[agent][-1] == goal for agent, _, goal in requests)
+
+
+def test_capacity_layer_zero_is_impassable():
+    hmap = HexMap(3, RoomState())
+    for pos in hmap.index:
+        if pos.q == 0 and pos != HexPos(0, 3, -3):
+            hmap.set_state(pos, 'room', 0)
+    pathfinder = CooperativePathfinder(hmap, window=12, capacity='room')
+    path = pathfinder.plan('a', HexPos(-2, 0, 2), HexPos(2, 0, -2), tick=0)
+    assert HexPos(0, 3, -3) in path
+    assert all(pos.q != 0 or pos == HexPos(0, 3, -3) for pos in path)
+
+    hmap.set_state(HexPos(0, 3, -3), 'room', 0)
+    pathfinder.refresh()
+    path = pathfinder.plan('a', HexPos(-2, 0, 2), HexPos(2, 0, -2), tick=0)
+    assert all(pos.q < 0 for pos in path)
+
+
+def test_reservation_table_counts_and_releases():
+    table = ReservationTable()
+    a, b, c = HexPos(0, 0, 0), HexPos(1, -1, 0), HexPos(2, -2, 0)
+    table.reserve_path('x', [a, b, c], start_tick=0)
+    table.reserve_path('y', [b, b], start_tick=1)
+    assert table.count(b, 1) == 2 and table.count(c, 2) == 1
+    assert table.is_move_reserved(b, a, 1)
+    assert not table.is_move_reserved(a, b, 1)
+
+    table.reserve_path('x', [a, a], start_tick=0)
+    assert table.count(b, 1) == 1 and not table.is_move_reserved(b, a, 1)
+    table.prune(2)
+    assert table.count(b, 1) == 0 and table.count(b, 2) == 1
+    table.release('y')
+    assert len(table) == 0
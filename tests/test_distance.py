@@ -0,0 +1,71 @@
+import dataclasses
+import random
+
+import numpy as np
+import pytest
+
+from mase.hexmap import HexMap, HexPos
+from mase.hexmap.arrayhexmap import ArrayHexMap
+from mase.hexmap.distance import bfs_index, bfs_index_sparse
+from mase.location import LocationState
+
+
+@dataclasses.dataclass
+class WallState(LocationState):
+    blocked: bool = False
+
+
+def make_walled_map(map_type: type, radius: int = 15, seed: int = 0) -> HexMap:
+    rng = random.Random(seed)
+    hmap = map_type(radius, WallState())
+    for pos in hmap.index.positions():
+        hmap.set_state(pos, 'blocked', rng.random() < 0.3)
+    return hmap
+
+
+def test_sparse_bfs_matches_dense():
+    hmap = make_walled_map(HexMap)
+    blocked = hmap.layer_mask('blocked')
+    rng = random.Random(1)
+    n = len(hmap.index)
+    for _ in range(200):
+        sources = [rng.randrange(n) for _ in range(rng.randint(1, 2))]
+        targets = [rng.randrange(n) for _ in range(3)] if rng.random() < 0.7 else None
+        kwargs = dict(blocked=blocked, targets=targets, max_dist=rng.choice([None, 2, 6]), stop_at=rng.choice(['any', 'all', None]))
+        dense = bfs_index(hmap.index, sources, **kwargs)
+        sparse = bfs_index_sparse(hmap.index, sources, **kwargs)
+        assert sparse == {i: int(dense[i]) for i in np.flatnonzero(dense >= 0).tolist()}
+
+
+@pytest.mark.parametrize('map_type', [HexMap, ArrayHexMap])
+def test_distances_follow_blocked_updates(map_type):
+    hmap = map_type(10, WallState())
+    src, target = HexPos(0, 0, 0), HexPos(2, -2, 0)
+    assert hmap.shortest_path_length(src, target, blocked='blocked') == 2
+
+    hmap.set_state(HexPos(1, -1, 0), 'blocked', True)
+    assert hmap.shortest_path_length(src, target, blocked='blocked') == 3
+    for pos in src.neighbors():
+        hmap.set_state(pos, 'blocked', True)
+    assert hmap.shortest_path_length(src, target, blocked='blocked') is None
+
+    hmap.set_layer('blocked', np.zeros(len(hmap.index), dtype=bool))
+    assert hmap.shortest_path_length(src, target, blocked='blocked') == 2
+
+
+def test_fork_distances_do_not_touch_parent_mask():
+    hmap = HexMap(10, WallState())
+    src, target = HexPos(0, 0, 0), HexPos(2, -2, 0)
+    hmap.shortest_path_length(src, target, blocked='blocked')
+    fork = hmap.fork()
+    fork.set_state(HexPos(1, -1, 0), 'blocked', True)
+    assert fork.shortest_path_length(src, target, blocked='blocked') == 3
+    assert hmap.shortest_path_length(src, target, blocked='blocked') == 2
+
+
+def test_hexpos_path_length_to_enclosed_target():
+    src, target = HexPos(-4, 0, 4), HexPos(2, -1, -1)
+    wall = target.neighbors()
+    assert src.shortest_path_length(target, wall) is None
+    assert src.shortest_path_length(target, wall - {HexPos(1, -1, 0)}) == 6
+    assert src.shortest_path_length(target, wall - {HexPos(3, -1, -2)}) == 10
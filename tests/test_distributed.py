@@ -0,0 +1,191 @@
+import pickle
+import socket
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from mase.distributed import (RegionModel, AuthenticationError, Coordinator, DistributedError, Partition,
+    CHALLENGE, ERROR, HELLO, keyed_random, pack_arrays, recv_message, run_local, run_worker, send_message, unpack_arrays)
+from mase.hexmap.hexindex import HexIndex
+
+RADIUS = 6
+WORKERS = [1, 2, 3]
+
+
+def initial_heat(cells: np.ndarray) -> np.ndarray:
+    return (np.asarray(cells) * 7919 % 13) / 13
+
+
+class HeatRegion(RegionModel):
+    '''Heat diffuses between neighboring cells.'''
+    halo_layers = ('heat',)
+
+    def __init__(self, region, params, seed):
+        super().__init__(region, params, seed)
+        heat = self.add_layer('heat')
+        heat[:] = initial_heat(np.arange(region.win_lo, region.win_hi))
+        self.degree = (region.neighbors >= 0).sum(axis=1)
+
+    def step(self, tick):
+        heat, neighbors, owned = self.layers['heat'], self.region.neighbors, self.region.owned
+        sent = np.append(heat, 0.0) * (self.params['rate'] / 6)
+        sent[-1] = 0.0
+        heat[owned] += sent[neighbors[owned]].sum(axis=1) - self.degree[owned] * sent[:-1][owned]
+
+
+class WalkerRegion(HeatRegion):
+    '''Agents on the heat map absorb half of the heat on their cell and step
+        to a neighbor chosen with keyed random numbers.
+    '''
+    agent_dtype = np.dtype([('id', np.int64), ('cell', np.int64), ('energy', np.float64)])
+
+    def __init__(self, region, params, seed):
+        super().__init__(region, params, seed)
+        cells = region.cells[self.random(-1, region.cells) < 0.3]
+        self.agents = np.zeros(len(cells), dtype=self.agent_dtype)
+        self.agents['id'] = self.agents['cell'] = cells
+
+    def step(self, tick):
+        super().step(tick)
+        heat, region, agents = self.layers['heat'], self.region, self.agents
+        local = region.local(agents['cell'])
+        counts = np.bincount(local, minlength=region.window_size)
+        agents['energy'] += heat[local] / 2 / counts[local]
+        heat[np.unique(local)] /= 2
+        options = np.concatenate([local[:, None], region.neighbors[local]], axis=1)
+        dest = options[np.arange(len(agents)), (self.random(tick, agents['id']) * 7).astype(np.int64)]
+        agents['cell'] = np.where(dest >= 0, dest, local) + region.win_lo
+
+
+class DriftRegion(RegionModel):
+    '''One agent that moves one column toward +q every tick.'''
+    def __init__(self, region, params, seed):
+        super().__init__(region, params, seed)
+        start = int(region.index.indices(np.array([-RADIUS]), np.array([0]))[0])
+        if region.is_owned(start):
+            self.agents = np.array([(0, start)], dtype=self.agent_dtype)
+
+    def step(self, tick):
+        local = self.region.local(self.agents['cell'])
+        # HEX_DIRECTIONS[1] is (1, 0, -1)
+        self.agents['cell'] = self.region.neighbors[local, 1] + self.region.win_lo
+
+    def get_info(self):
+        return {'ids': self.agents['id'].tolist()}
+
+
+class FailingRegion(HeatRegion):
+    def step(self, tick):
+        if tick == 2 and self.region.id == self.region.partition.num_regions - 1:
+            raise ValueError('heat exploded')
+        super().step(tick)
+
+
+class HangingRegion(HeatRegion):
+    def step(self, tick):
+        if tick == 1 and self.region.id == 0:
+            time.sleep(60)
+        super().step(tick)
+
+
+def same_result(a, b) -> bool:
+    return (np.array_equal(a.agents, b.agents)
+        and all(np.array_equal(a.layers[name], b.layers[name]) for name in a.layers))
+
+
+def test_keyed_random_depends_only_on_its_keys():
+    keys = np.arange(50)
+    values = keyed_random(3, 7, keys)
+    assert ((values >= 0) & (values < 1)).all()
+    assert np.array_equal(keyed_random(3, 7, keys[::-1]), values[::-1])
+    assert not np.array_equal(keyed_random(3, 8, keys), values)
+    assert not np.array_equal(keyed_random(3, 7, keys, stream=1), values)
+
+
+@pytest.mark.parametrize('workers', WORKERS)
+def test_halo_exchange_matches_single_process_diffusion(workers):
+    index = HexIndex(RADIUS)
+    heat = initial_heat(np.arange(len(index)))
+    degree = (index.neighbors >= 0).sum(axis=1)
+    for _ in range(5):
+        sent = np.append(heat, 0.0) * (0.3 / 6)
+        sent[-1] = 0.0
+        heat = heat + sent[index.neighbors].sum(axis=1) - degree * sent[:-1]
+
+    result = run_local(HeatRegion, RADIUS, workers, num_ticks=5, params={'rate': 0.3})
+    assert np.allclose(result.layers['heat'], heat, rtol=0, atol=1e-12)
+
+
+def test_results_do_not_depend_on_the_number_of_workers():
+    results = [run_local(WalkerRegion, RADIUS, workers, num_ticks=8, params={'rate': 0.3}, seed=5) for workers in WORKERS]
+    assert len(results[0].agents) > 0
+    for result in results[1:]:
+        assert same_result(result, results[0])
+    assert same_result(run_local(WalkerRegion, RADIUS, 3, num_ticks=8, params={'rate': 0.3}, seed=5), results[-1])
+    assert not same_result(run_local(WalkerRegion, RADIUS, 3, num_ticks=8, params={'rate': 0.3}, seed=6), results[-1])
+
+
+@pytest.mark.parametrize('workers', WORKERS)
+def test_agent_migrates_across_strip_boundaries(workers):
+    num_ticks = 2 * RADIUS
+    result = run_local(DriftRegion, RADIUS, workers, num_ticks=num_ticks)
+    index = HexIndex(RADIUS)
+    assert result.agents['cell'].tolist() == index.indices(np.array([RADIUS]), np.array([0])).tolist()
+    holders = [region for region, info in enumerate(result.info) if info['ids'] == [0]]
+    assert holders == [workers - 1]
+    assert Partition.balanced(RADIUS, workers).owner(index, result.agents['cell']).tolist() == [workers - 1]
+
+
+@pytest.mark.parametrize('workers', WORKERS)
+def test_worker_error_surfaces_with_its_root_cause(workers):
+    with pytest.raises(DistributedError, match='heat exploded') as info:
+        run_local(FailingRegion, RADIUS, workers, num_ticks=5, params={'rate': 0.3})
+    assert 'ValueError' in str(info.value)
+
+
+def test_array_payloads_keep_structured_dtypes():
+    agents = np.zeros(3, dtype=[('id', np.int64), ('pos', np.int32, (2,)), ('alive', bool)])
+    agents['id'], agents['pos'] = [4, 5, 6], [[1, 2], [3, 4], [5, 6]]
+    arrays = unpack_arrays(pack_arrays({'agents': agents, 'heat': np.arange(6.0).reshape(2, 3)}))
+    assert arrays['agents'].dtype == agents.dtype and np.array_equal(arrays['agents'], agents)
+    assert np.array_equal(arrays['heat'], np.arange(6.0).reshape(2, 3))
+
+    payload = pack_arrays({'heat': np.arange(3.0)})
+    with pytest.raises(DistributedError):
+        unpack_arrays(payload.replace(b'[3]', b'[4]'))
+
+
+def test_connections_without_the_authkey_are_dropped():
+    errors = list()
+
+    def worker(host, port, authkey):
+        try:
+            run_worker(host, port, authkey)
+        except DistributedError as e:
+            errors.append(e)
+
+    with Coordinator(1, authkey=b'secret') as coordinator:
+        # a client that skips the handshake gets no further than the challenge
+        rogue = socket.create_connection(coordinator.address)
+        send_message(rogue, HELLO, payload=pickle.dumps(coordinator.address))
+        threads = [threading.Thread(target=worker, args=coordinator.address + (key,)) for key in [b'wrong', b'secret']]
+        for thread in threads:
+            thread.start()
+        result = coordinator.run(HeatRegion, RADIUS, num_ticks=2, params={'rate': 0.3}, timeout=10)
+        for thread in threads:
+            thread.join()
+        assert [recv_message(rogue)[0] for _ in range(2)] == [CHALLENGE, ERROR]
+        assert rogue.recv(1) == b''
+        rogue.close()
+
+    assert len(result.layers['heat']) == len(HexIndex(RADIUS))
+    assert len(errors) == 1 and isinstance(errors[0], AuthenticationError)
+
+
+def test_hung_worker_times_out():
+    start = time.perf_counter()
+    with pytest.raises(DistributedError, match='No message from a worker within 1'):
+        run_local(HangingRegion, RADIUS, 2, num_ticks=5, params={'rate': 0.3}, timeout=1)
+    assert time.perf_counter() - start < 20
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from mase.hexmap import Field, HexIndex, HexPos
+
+
+def random_field(radius=6, seed=0):
+    index = HexIndex(radius)
+    return Field(index, values=np.random.default_rng(seed).random(len(index)))
+
+
+def reference_diffuse(index, values, rate, blocked):
+    '''One diffusion step computed cell by cell.'''
+    result = values.copy()
+    for i in range(len(index)):
+        for j in index.neighbors[i].tolist():
+            if j >= 0 and not blocked[i] and not blocked[j]:
+                result[i] += rate / 6 * (values[j] - values[i])
+    return result
+
+
+def test_diffusion_conserves_mass_and_spreads():
+    field = random_field()
+    total = field.total()
+    field.diffuse(0.6, steps=50)
+    assert field.total() == pytest.approx(total, rel=1e-12)
+    assert field.values.std() < 0.05
+
+    peak = Field(field.index)
+    peak.deposit([field.index.index(HexPos(0, 0, 0))], 1.0)
+    peak.diffuse(1.0)
+    assert peak.at(HexPos(0, 0, 0)) == pytest.approx(0.0)
+    assert all(peak.at(pos) == pytest.approx(1 / 6) for pos in HexPos(0, 0, 0).neighbors())
+
+
+def test_diffusion_matches_reference_and_respects_blocked_cells():
+    field = random_field(seed=1)
+    index = field.index
+    blocked = np.random.default_rng(2).random(len(index)) < 0.3
+    before = field.values.copy()
+
+    field.diffuse(0.5, blocked=blocked)
+    assert np.allclose(field.values, reference_diffuse(index, before, 0.5, blocked), rtol=0, atol=1e-12)
+    assert np.array_equal(field.values[blocked], before[blocked])
+    assert field.values[~blocked].sum() == pytest.approx(before[~blocked].sum(), rel=1e-12)
+
+
+def test_walled_off_region_keeps_its_mass():
+    index = HexIndex(6)
+    field = Field(index)
+    center = HexPos(0, 0, 0)
+    inside = [index.index(pos) for pos in center.region(2) | {center}]
+    wall = np.zeros(len(index), dtype=bool)
+    wall[[index.index(pos) for pos in center.ring(3)]] = True
+    field.deposit(inside[:1], 5.0)
+    field.diffuse(0.8, steps=300, blocked=wall)
+    assert field.values[inside].sum() == pytest.approx(5.0, rel=1e-12)
+    assert np.allclose(field.values[inside], 5.0 / len(inside))
+
+
+def test_decay_grow_and_rate_checks():
+    field = random_field()
+    before = field.values.copy()
+    field.decay(0.25)
+    assert np.allclose(field.values, 0.75 * before)
+    field.decay(0.0)
+    assert np.allclose(field.values, 0.75 * before)
+    field.decay(1.0)
+    assert field.total() == 0.0
+
+    field.grow(0.5, 2.0)
+    assert np.allclose(field.values, 1.0)
+    with pytest.raises(ValueError):
+        field.diffuse(1.5)
+
+
+def test_deposit_consume_and_gradient():
+    field = Field(HexIndex(3))
+    i = field.index.index(HexPos(1, -1, 0))
+    field.deposit([i, i], 1.5)
+    assert field.at(HexPos(1, -1, 0)) == 3.0
+    assert field.consume([i, i], 2.0).tolist() == [2.0, 1.0]
+    assert field.total() == 0.0
+
+    field.deposit([i], 1.0)
+    assert field.uphill(HexPos(0, 0, 0)) == HexPos(1, -1, 0)
+    assert field.gradient(HexPos(0, 0, 0)) == pytest.approx((1 / 3, -1 / 3, 0.0))
@@ -0,0 +1,130 @@
+import dataclasses
+
+import numpy as np
+import pytest
+
+from mase.agent import Agent, AgentState
+from mase.agentpool import AgentPool
+from mase.agentregistry import AgentRegistry
+from mase.agentstatepool import AgentStatePool
+from mase.errors import AgentDoesNotExistError, StaleAgentIDError
+from mase.hexmap import HexMap, HexPos
+from mase.location import LocationState
+
+
+@dataclasses.dataclass
+class FoodState(LocationState):
+    food: int = 1
+
+
+@dataclasses.dataclass
+class EnergyState(AgentState):
+    energy: int = 0
+
+
+def make_map():
+    hmap = HexMap(4, FoodState())
+    agents = [Agent(i, None) for i in range(3)]
+    for agent, pos in zip(agents, [HexPos(0, 0, 0), HexPos(1, -1, 0), HexPos(2, -2, 0)]):
+        hmap.add_agent(agent, pos)
+    hmap.add_field('scent', fill=0.5)
+    return hmap, agents
+
+
+def test_map_fork_isolates_changes():
+    hmap, agents = make_map()
+    before = hmap.get_info()
+    fork = hmap.fork()
+
+    fork.move_agent(agents[0], HexPos(0, 1, -1))
+    fork.loc(HexPos(0, 1, -1)).state.food = 0
+    fork.set_layer('food', np.arange(len(hmap.index)))
+    fork.field('scent').values[:] = 2.0
+    fork.remove_agent(agents[2])
+
+    assert fork.agent_pos(agents[0]) == HexPos(0, 1, -1)
+    assert agents[2] not in fork
+    assert fork.get_layer('food').tolist() == list(range(len(hmap.index)))
+    assert fork.num_changed > 0
+
+    assert hmap.get_info() == before
+    assert hmap.agent_pos(agents[0]) == HexPos(0, 0, 0)
+    assert hmap.field('scent').values.max() == 0.5
+    assert agents[0] in hmap.loc(HexPos(0, 0, 0)).agents
+
+    fork.discard()
+    assert fork.num_changed == 0
+    assert fork.get_info() == before
+
+
+def test_nested_forks_read_through():
+    hmap, agents = make_map()
+    fork = hmap.fork()
+    fork.move_agent(agents[1], HexPos(-1, 1, 0))
+    child = fork.fork()
+    assert child.agent_pos(agents[1]) == HexPos(-1, 1, 0)
+
+    child.move_agent(agents[1], HexPos(-2, 2, 0))
+    child.loc(HexPos(-2, 2, 0)).state.food = 7
+    assert fork.agent_pos(agents[1]) == HexPos(-1, 1, 0)
+    assert fork.peek(HexPos(-2, 2, 0)).state.food == 1
+    assert hmap.agent_pos(agents[1]) == HexPos(1, -1, 0)
+
+
+def test_pool_fork_copies_on_access():
+    pool = AgentStatePool({0: FoodState(3), 1: FoodState(4)})
+    fork = pool.fork()
+    fork.get_agent(0).food = 0
+    fork.remove_agent(1)
+    fork.add_agent(2, FoodState(5))
+    assert pool[0].food == 3 and 1 in pool and 2 not in pool
+    assert sorted(fork) == [0, 2] and fork[0].food == 0
+    with pytest.raises(AgentDoesNotExistError):
+        fork.get_agent(1)
+
+
+def test_registry_fork_ids_and_stale_detection():
+    reg = AgentRegistry()
+    a, b = reg.add_agents([FoodState(1), FoodState(2)])
+    fork = reg.fork()
+    fork.get_agent(a).food = 10
+    fork.remove_agent(b)
+    c = fork.add_agent(FoodState(3))
+
+    assert c not in reg and c != a and c != b
+    with pytest.raises(StaleAgentIDError):
+        fork.get_agent(b)
+    assert reg[a].food == 1 and reg[b].food == 2
+    assert sorted(fork.ids()) == sorted([a, c])
+    fork.discard()
+    assert sorted(fork.ids()) == sorted([a, b])
+
+
+def test_agent_pool_fork_copies_on_access():
+    hmap = HexMap(4, FoodState())
+    pool = AgentPool()
+    pool.add_map(hmap)
+    pool.add_agent(0, EnergyState(3), HexPos(0, 0, 0))
+    pool.add_agent(1, EnergyState(4), HexPos(1, -1, 0))
+
+    fork = pool.fork()
+    agent = fork[0]
+    agent.state.energy = 0
+    fork.map.move_agent(agent, HexPos(0, 1, -1))
+    fork.remove_agent(1)
+    fork.add_agent(2, EnergyState(5), HexPos(2, -2, 0))
+
+    assert agent.pos == HexPos(0, 1, -1) and fork[0] is agent
+    assert sorted(fork.ids) == [0, 2] and fork[2].pos == HexPos(2, -2, 0)
+    assert pool[0].state.energy == 3 and pool[0].pos == HexPos(0, 0, 0)
+    assert sorted(pool.ids) == [0, 1] and len(hmap.agent_positions) == 2
+    with pytest.raises(AgentDoesNotExistError):
+        fork[1]
+
+    child = fork.fork()
+    child[2].state.energy = 9
+    assert fork[2].state.energy == 5
+
+    fork.discard()
+    assert fork.num_changed == 0 and sorted(fork.ids) == [0, 1]
+    assert fork[0].state.energy == 3 and fork[0].pos == HexPos(0, 0, 0)
@@ -0,0 +1,111 @@
+import heapq
+
+import numpy as np
+import pytest
+
+from mase.hexmap import HexPos, NoPathFound
+from mase.hexnetmap.hexnetmap import HexNetMap
+from mase.profiling import profiler
+
+
+def reference_costs(hmap, src):
+    '''Dijkstra over the cell neighbors using the map's edge weights.'''
+    weights = hmap.weights()
+    edge_weight = dict()
+    for eid, (u, v) in enumerate(zip(hmap.edge_src.tolist(), hmap.edge_dst.tolist())):
+        edge_weight[u, v] = edge_weight[v, u] = weights[eid]
+    dist = np.full(len(hmap), np.inf)
+    dist[src] = 0.0
+    queue = [(0.0, src)]
+    while queue:
+        d, i = heapq.heappop(queue)
+        if d > dist[i]:
+            continue
+        for j in hmap.index.neighbors[i].tolist():
+            if j >= 0 and d + edge_weight[i, j] < dist[j]:
+                dist[j] = d + edge_weight[i, j]
+                heapq.heappush(queue, (dist[j], j))
+    return dist
+
+
+def path_cost(hmap, path):
+    total = 0.0
+    for a, b in zip(path[:-1], path[1:]):
+        assert a.dist(b) == 1
+        total += hmap.weights()[hmap.graph.get_eid(hmap.vertex(a).index, hmap.vertex(b).index)]
+    return total
+
+
+def test_shortest_path_follows_cell_costs():
+    hmap = HexNetMap(4)
+    hmap.set_cell_costs(np.random.default_rng(0).uniform(1, 10, len(hmap)))
+    src = HexPos(-4, 0, 4)
+    expected = reference_costs(hmap, hmap.index.index(src))
+    for goal in [HexPos(4, 0, -4), HexPos(0, 4, -4), HexPos(2, -3, 1)]:
+        path = hmap.shortest_path(src, goal)
+        assert path[0] == src and path[-1] == goal
+        assert path.cost == pytest.approx(expected[hmap.index.index(goal)])
+        assert path_cost(hmap, path) == pytest.approx(path.cost)
+
+
+def test_set_edge_cost_diverts_path():
+    hmap = HexNetMap(3)
+    a, b = HexPos(-1, 0, 1), HexPos(1, 0, -1)
+    assert hmap.shortest_path(a, b).cost == 2.0
+
+    # make every edge into the center expensive so the path goes around it
+    center = HexPos(0, 0, 0)
+    for pos in center.neighbors():
+        hmap.set_edge_cost(center, pos, 10.0)
+    path = hmap.shortest_path(a, b)
+    assert center not in path
+    assert path.cost == 3.0
+
+    with pytest.raises(ValueError):
+        hmap.set_edge_cost(a, b, 1.0)
+
+
+def test_set_blocked_avoids_cells_and_raises_when_cut_off():
+    hmap = HexNetMap(3)
+    a, b = HexPos(-3, 0, 3), HexPos(3, 0, -3)
+    wall = [pos for pos in hmap.positions() if pos.q == 0 and pos.r > -3]
+    for pos in wall:
+        hmap.set_blocked(pos)
+    path = hmap.shortest_path(a, b)
+    assert not any(pos in wall for pos in path)
+    assert HexPos(0, -3, 3) in path
+
+    hmap.set_blocked(HexPos(0, -3, 3))
+    with pytest.raises(NoPathFound):
+        hmap.shortest_path(a, b)
+    with pytest.raises(NoPathFound):
+        hmap.shortest_path(a, HexPos(0, 0, 0))
+
+    hmap.set_blocked(HexPos(0, -3, 3), False)
+    assert hmap.shortest_path(a, b) == path
+
+
+def test_distances_cache_is_dropped_on_cost_changes():
+    hmap = HexNetMap(3)
+    a, b = HexPos(0, 0, 0), HexPos(1, -1, 0)
+    profiler.enable()
+    try:
+        assert hmap.distances([a], [b]).tolist() == [[1.0]]
+        assert hmap.distances([b], [a]).tolist() == [[1.0]]
+        assert profiler.end_tick()['counters']['netmap_all_pairs_computed'] == 1
+
+        # the direct edge is now more expensive than going around it
+        hmap.set_edge_cost(a, b, 5.0)
+        assert hmap.distances([a], [b]).tolist() == [[2.0]]
+        hmap.set_cell_costs(np.full(len(hmap), 3.0))
+        assert hmap.distances([a], [b]).tolist() == [[3.0]]
+        hmap.set_blocked(b)
+        assert hmap.distances([a], [b]).tolist() == [[np.inf]]
+        assert profiler.end_tick()['counters']['netmap_all_pairs_computed'] == 3
+    finally:
+        profiler.disable()
+        profiler.reset()
+
+    full = hmap.distances()
+    assert full.shape == (len(hmap), len(hmap))
+    assert np.array_equal(full, full.T)
@@ -0,0 +1,97 @@
+import dataclasses
+import random
+
+import pytest
+
+from mase.hexmap import HexMap, HexPos, HierarchicalPathfinder, NoPathFound
+from mase.hexmap.hexmapgenerator import MapGenerator, PercolationLayer
+from mase.location import LocationState
+from mase.profiling import profiler
+
+# HPA* paths may be longer than optimal; this bound holds with room to spare on these maps
+MAX_SUBOPTIMALITY = 1.5
+
+
+@dataclasses.dataclass
+class BlockedState(LocationState):
+    blocked: bool = False
+
+
+def make_map(radius=20, seed=0):
+    hmap = HexMap(radius, BlockedState())
+    MapGenerator(radius, (PercolationLayer(p=0.3, smoothing=2),), seed=seed).apply(hmap)
+    return hmap
+
+
+def open_positions(hmap):
+    return {pos for pos in hmap.index if not hmap.loc(pos).state.blocked}
+
+
+def assert_valid_path(hmap, path, start, goal):
+    assert path[0] == start and path[-1] == goal
+    for a, b in zip(path[:-1], path[1:]):
+        assert a.dist(b) == 1
+    assert all(not hmap.loc(pos).state.blocked for pos in path)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_paths_are_valid_and_near_optimal(seed):
+    hmap = make_map(seed=seed)
+    pathfinder = HierarchicalPathfinder(hmap, cluster_size=6)
+    allowed = open_positions(hmap)
+    rng = random.Random(seed)
+    positions = sorted(allowed, key=hmap.index.index)
+    found = 0
+    for _ in range(20):
+        start, goal = rng.sample(positions, 2)
+        try:
+            optimal = start.a_star(goal, allowed_pos=allowed)
+        except NoPathFound:
+            with pytest.raises(NoPathFound):
+                pathfinder.find_path(start, goal)
+            continue
+        path = pathfinder.find_path(start, goal)
+        assert_valid_path(hmap, path, start, goal)
+        assert len(path) - 1 <= MAX_SUBOPTIMALITY * (len(optimal) - 1)
+        found += 1
+    assert found > 0
+
+
+def test_set_blocked_rebuilds_only_nearby_clusters():
+    hmap = HexMap(20, BlockedState())
+    pathfinder = HierarchicalPathfinder(hmap, cluster_size=6)
+    start, goal = HexPos(-15, 0, 15), HexPos(15, 0, -15)
+    path = pathfinder.find_path(start, goal)
+    assert len(path) == 31
+
+    # wall off every straight route through column q = 0 except its ends
+    wall = [pos for pos in hmap.index if pos.q == 0 and abs(pos.r) < 18]
+    profiler.enable()
+    try:
+        for pos in wall:
+            pathfinder.set_blocked(pos, True)
+        detour = pathfinder.find_path(start, goal)
+        record = profiler.end_tick()
+    finally:
+        profiler.disable()
+        profiler.reset()
+
+    assert all(hmap.loc(pos).state.blocked for pos in wall)
+    assert_valid_path(hmap, detour, start, goal)
+    assert len(detour) > len(path)
+    assert 0 < record['counters']['hpa_clusters_rebuilt'] < pathfinder.num_clusters
+
+    for pos in wall:
+        pathfinder.set_blocked(pos, False)
+    assert len(pathfinder.find_path(start, goal)) == 31
+
+
+def test_refresh_picks_up_direct_changes():
+    hmap = HexMap(10, BlockedState())
+    pathfinder = HierarchicalPathfinder(hmap, cluster_size=4)
+    goal = HexPos(3, -3, 0)
+    for pos in goal.neighbors():
+        hmap.set_state(pos, 'blocked', True)
+    pathfinder.refresh()
+    with pytest.raises(NoPathFound):
+        pathfinder.find_path(HexPos(0, 0, 0), goal)
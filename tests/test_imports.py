@@ -0,0 +1,18 @@
+import importlib
+import pkgutil
+
+import pytest
+
+import mase
+
+MODULES = sorted(info.name for info in pkgutil.walk_packages(mase.__path__, 'mase.'))
+
+
+@pytest.mark.parametrize('name', MODULES)
+def test_module_imports(name):
+    try:
+        importlib.import_module(name)
+    except ModuleNotFoundError as e:
+        if e.name is None or e.name.split('.')[0] == 'mase':
+            raise
+        pytest.skip(f'optional dependency {e.name} is not installed')
@@ -0,0 +1,54 @@
+import copy
+import dataclasses
+import typing
+
+import numpy as np
+
+from mase.hexmap import HexMap, HexPos
+from mase.location import LocationState
+
+
+@dataclasses.dataclass
+class FoodState(LocationState):
+    food: int = 1
+    seen: typing.List[int] = dataclasses.field(default_factory=list)
+
+
+def num_owned(hmap: HexMap) -> int:
+    return sum(loc.owns_state for loc in hmap.locations())
+
+
+def test_reads_do_not_copy_shared_state():
+    hmap = HexMap(5, FoodState(), compact=True)
+    assert sum(loc.state.food for loc in hmap.locations()) == len(hmap.index)
+    assert hmap.nearest(HexPos(0, 0, 0), lambda loc: loc.state.food > 1, limit=3) == []
+    assert isinstance(hmap.loc(HexPos(0, 0, 0)).state, FoodState)
+    assert hmap.loc(HexPos(0, 0, 0)).state == FoodState()
+    assert num_owned(hmap) == 0
+
+
+def test_writes_copy_shared_state():
+    default = FoodState()
+    hmap = HexMap(3, default, compact=True)
+    state = hmap.loc(HexPos(0, 0, 0)).state
+    state.food = 5
+    assert state.food == 5
+    hmap.loc(HexPos(1, -1, 0)).state.seen.append(7)
+
+    assert num_owned(hmap) == 2
+    assert hmap.loc(HexPos(0, 0, 0)).state.food == 5
+    assert hmap.loc(HexPos(1, -1, 0)).state.seen == [7]
+    assert hmap.loc(HexPos(0, 1, -1)).state == FoodState()
+    assert default == FoodState()
+    assert copy.deepcopy(hmap.loc(HexPos(0, 1, -1)).state) == FoodState()
+
+
+def test_set_layer_keeps_default_cells_shared():
+    hmap = HexMap(4, FoodState(), compact=True)
+    values = np.ones(len(hmap.index), dtype=np.int64)
+    values[:3] = [0, 2, 3]
+    hmap.set_layer('food', values)
+    hmap.set_state(HexPos(0, 0, 0), 'food', 1)
+
+    assert num_owned(hmap) == 3
+    assert np.array_equal(hmap.get_layer('food'), values)
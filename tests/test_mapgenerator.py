@@ -0,0 +1,19 @@
+import numpy as np
+
+from mase.hexmap.hexindex import HexIndex
+from mase.hexmap.hexmapgenerator import random_walk
+
+
+def test_random_walk_path():
+    for seed in range(5):
+        info = random_walk(8, seed=seed)
+        assert len(info) == len(HexIndex(8))
+        assert sum(i['start'] for i in info) == sum(i['end'] for i in info) == 1
+        assert not any(i['passed'] and i['blocked'] for i in info)
+        passed = [i for i in info if i['passed']]
+        if passed:
+            assert all(i['passed'] for i in info if i['start'] or i['end'])
+
+def test_random_walk_is_seeded():
+    assert random_walk(6, seed=1) == random_walk(6, seed=1)
+    assert not any(i['passed'] for i in random_walk(6, seed=1, include_path=False))
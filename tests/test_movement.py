@@ -0,0 +1,91 @@
+import dataclasses
+import random
+
+import numpy as np
+import pytest
+
+from mase.agent import Agent
+from mase.hexmap import HexMap, HexPos, CooperativePathfinder
+from mase.hexmap.arrayhexmap import ArrayHexMap
+from mase.hexmap.movement import Passable, TerrainCost, MaxOccupancy
+from mase.location import LocationState
+
+
+@dataclasses.dataclass
+class TerrainState(LocationState):
+    blocked: bool = False
+    cost: float = 1.0
+    room: int = 1
+
+
+def make_map(map_type, num_agents, seed=0):
+    rng = random.Random(seed)
+    hmap = map_type(4, TerrainState())
+    positions = hmap.index.positions()
+    for pos in positions:
+        hmap.set_state(pos, 'blocked', rng.random() < 0.2)
+        hmap.set_state(pos, 'cost', rng.choice([0.5, 1.0, 2.0]))
+        hmap.set_state(pos, 'room', rng.choice([1, 2]))
+    agents = [Agent(i, None) for i in range(num_agents)]
+    for agent, pos in zip(agents, rng.sample(positions, num_agents)):
+        hmap.add_agent(agent, pos)
+    return hmap, agents
+
+
+@pytest.mark.parametrize('map_type', [HexMap, ArrayHexMap])
+@pytest.mark.parametrize('num_agents', [3, 40])
+def test_legal_moves_match_single_checks(map_type, num_agents):
+    hmap, agents = make_map(map_type, num_agents)
+    rules = hmap.set_movement_rules([Passable(), TerrainCost('cost', 'energy'), MaxOccupancy('room')])
+    energy = np.linspace(0.5, 2.0, num_agents)
+    dst, legal = rules.legal_moves(agents, {'energy': energy})
+
+    for agent, e, cells, ok in zip(agents, energy, dst.tolist(), legal.tolist()):
+        agent.state = dataclasses.make_dataclass('S', [('energy', float)])(e)
+        for cell, is_legal in zip(cells, ok):
+            if cell >= 0:
+                assert is_legal == (not rules.violations(agent, hmap.index.pos(cell)))
+
+
+@pytest.mark.parametrize('map_type', [HexMap, ArrayHexMap])
+@pytest.mark.parametrize('strict', [False, True])
+@pytest.mark.parametrize('limit', [1, 2, 'room'])
+def test_step_keeps_cells_within_their_limit(map_type, strict, limit):
+    hmap, agents = make_map(map_type, 45)
+    rules = hmap.set_movement_rules([Passable(), MaxOccupancy(limit)], strict=strict)
+    capacity = rules.capacity()
+    rng = np.random.default_rng(0)
+    moved = 0
+    for _ in range(30):
+        moved += rules.step(agents, rng)
+        assert (hmap.agent_counts() <= capacity).all()
+    assert moved > 0
+
+
+def test_layer_arrays_follow_set_state_and_set_layer():
+    hmap, agents = make_map(HexMap, 5)
+    rules = hmap.set_movement_rules([Passable()])
+    pos = hmap.agent_pos(agents[0])
+    target = next(p for p in pos.neighbors() if p in hmap.index)
+
+    hmap.set_state(target, 'blocked', True)
+    assert rules.violations(agents[0], target)
+    hmap.set_layer('blocked', np.zeros(len(hmap.index), dtype=bool))
+    assert not rules.violations(agents[0], target)
+    assert np.array_equal(hmap.layer_array('blocked'), hmap.get_layer('blocked'))
+
+
+def test_cooperative_pathfinder_uses_map_occupancy():
+    hmap, _ = make_map(HexMap, 0)
+    assert (CooperativePathfinder(hmap).capacity == 1).all()
+
+    hmap.set_movement_rules([MaxOccupancy('room')])
+    pathfinder = CooperativePathfinder(hmap)
+    assert np.array_equal(pathfinder.capacity, hmap.get_layer('room'))
+    assert (CooperativePathfinder(hmap, capacity=3).capacity == 3).all()
+
+    hmap.set_movement_rules([MaxOccupancy(2), MaxOccupancy('room')])
+    hmap.set_state(HexPos(0, 0, 0), 'room', 5)
+    pathfinder.refresh()
+    assert pathfinder.capacity.max() == 2
+    assert pathfinder.cell_capacity(HexPos(0, 0, 0)) == 2
@@ -0,0 +1,79 @@
+import dataclasses
+
+from mase.agent import Agent, AgentSet, AgentState
+from mase.agentpool import AgentPool
+from mase.agentstatepool import AgentStatePool
+from mase.agentregistry import AgentRegistry
+from mase.profiling import profiler
+from mase.sweep import SweepRunner
+
+
+@dataclasses.dataclass
+class CounterState(AgentState):
+    count: int = 0
+
+    def get_info(self):
+        return {'count': self.count}
+
+
+@dataclasses.dataclass
+class SlowState(CounterState):
+    pass
+
+
+def test_schedulers_and_agent_steps_are_profiled():
+    agents = AgentSet(Agent(i, CounterState() if i % 2 else SlowState()) for i in range(20))
+    pool = AgentStatePool({i: CounterState() for i in range(20)})
+    agent_pool = AgentPool()
+    for i in range(20):
+        agent_pool.add_agent(i, CounterState(), None)
+    registry = AgentRegistry()
+    registry.add_agents(CounterState() for _ in range(20))
+
+    profiler.enable(sample_every=5)
+    try:
+        for _ in range(3):
+            for scheduler in (agents, pool, pool.fork(), registry, registry.fork(), agent_pool, agent_pool.fork()):
+                scheduler.random_activation()
+            # sample every agent once per tick, in id order
+            profiler.run_agents(sorted(agents, key=lambda agent: agent.id), lambda agent: None)
+            profiler.run_agents(pool.values(), lambda state: None, key=lambda state: 'pool')
+            profiler.end_tick()
+    finally:
+        profiler.disable()
+    records = list(profiler.records)
+    profiler.reset()
+
+    assert [r['tick'] for r in records] == [0, 1, 2]
+    for record in records:
+        assert record['phase_calls']['schedule'] == 7
+        assert record['phase_calls']['agent_step'] == 2
+        samples = {name: t['samples'] for name, t in record['agent_time'].items()}
+        assert samples == {'SlowState': 2, 'CounterState': 2, 'pool': 4}
+
+
+class CounterModel:
+    def __init__(self, params, seed, layers):
+        self.agents = AgentSet(Agent(i, CounterState()) for i in range(params['num_agents']))
+
+    def step(self):
+        def step(agent):
+            agent.state.count += 1
+        profiler.run_agents(self.agents.random_activation(), step)
+
+    def get_info(self):
+        return {'total': sum(agent.state.count for agent in self.agents)}
+
+
+def test_sweep_records_profile_per_tick(tmp_path):
+    results_path = str(tmp_path / 'results.jsonl')
+    runner = SweepRunner(CounterModel, {'num_agents': [5]}, num_steps=4, results_path=results_path,
+        profile=True, sample_every=2)
+    results = runner.run(processes=1)
+    profile = results.profiles[runner.specs()[0].run_id]
+    assert len(profile) == 4
+    assert all(r['phase_calls'] == {'schedule': 1, 'agent_step': 1} for r in profile)
+    assert results.summary()[0]['total_mean'] == 20
+
+    # resumed runs read the stored profile back
+    assert SweepRunner(CounterModel, {'num_agents': [5]}, num_steps=4, results_path=results_path).run().profiles == results.profiles
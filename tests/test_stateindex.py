@@ -0,0 +1,67 @@
+import dataclasses
+import random
+
+import numpy as np
+import pytest
+
+from mase.hexmap import HexMap
+from mase.hexmap.arrayhexmap import ArrayHexMap
+from mase.location import LocationState
+
+
+@dataclasses.dataclass
+class TerrainState(LocationState):
+    kind: int = 0
+    height: float = 0.0
+
+
+def scan(hmap, name, value):
+    return [loc.pos for loc in hmap.locations() if getattr(loc.state, name) == value]
+
+
+@pytest.mark.parametrize('map_type', [HexMap, ArrayHexMap])
+def test_indexes_match_scans_under_updates(map_type):
+    rng = random.Random(0)
+    hmap = map_type(6, TerrainState())
+    hmap.add_state_index('kind', 'hash')
+    hmap.add_state_index('height', 'sorted')
+    positions = hmap.index.positions()
+    for step in range(400):
+        pos = rng.choice(positions)
+        hmap.set_state(pos, 'kind', rng.randrange(4))
+        hmap.set_state(pos, 'height', rng.choice([0.0, 0.5, 1.0, 1.5, 2.0]))
+        if step % 50 == 0:
+            hmap.set_layer('height', np.round(np.array([rng.random() for _ in positions]) * 4) / 2)
+
+        for kind in range(5):
+            assert [loc.pos for loc in hmap.where('kind', kind)] == sorted(scan(hmap, 'kind', kind), key=hmap.index.index)
+        lo, hi = sorted(rng.choice([0.0, 0.5, 1.0, 1.5, 2.0]) for _ in range(2))
+        found = hmap.where_range('height', lo, hi, hi_inclusive=False)
+        heights = [loc.state.height for loc in found]
+        assert heights == sorted(heights)
+        assert {loc.pos for loc in found} == {loc.pos for loc in hmap.locations() if lo <= loc.state.height < hi}
+
+
+def test_indexed_and_scanned_queries_agree():
+    hmap = HexMap(5, TerrainState())
+    rng = random.Random(1)
+    for pos in hmap.index.positions():
+        hmap.set_state(pos, 'height', rng.random())
+    scanned = [loc.pos for loc in hmap.where_range('height', 0.2, 0.6)]
+    index = hmap.add_state_index('height', 'sorted')
+    assert [loc.pos for loc in hmap.where_range('height', 0.2, 0.6)] == scanned
+    assert index.min()[0] == hmap.get_layer('height').min()
+    assert index.max()[0] == hmap.get_layer('height').max()
+
+
+def test_refresh_after_direct_changes():
+    hmap = HexMap(3, TerrainState())
+    index = hmap.add_state_index('kind')
+    loc = next(iter(hmap.locations()))
+    loc.state.kind = 9
+    assert index.count(9) == 0
+    index.refresh()
+    assert [l.pos for l in hmap.where('kind', 9)] == [loc.pos]
+
+    with pytest.raises(ValueError):
+        hmap.add_state_index('kind', 'btree')
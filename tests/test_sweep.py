@@ -0,0 +1,90 @@
+import json
+import random
+
+import numpy as np
+import pytest
+
+from mase.sweep import RunningStats, RunSpec, SweepResults, SweepRunner
+
+
+class GrowthModel:
+    def __init__(self, params, seed, layers):
+        self.value = 0.0
+        self.rate = params['rate']
+        self.noise = random.Random(seed).random()
+
+    def step(self):
+        self.value += self.rate
+
+    def get_info(self):
+        return {'value': self.value, 'noise': self.noise}
+
+
+def run(grid, results_path, num_steps=3, seed=0, replicates=2):
+    ran = list()
+    runner = SweepRunner(GrowthModel, grid, num_steps=num_steps, replicates=replicates,
+        results_path=results_path, seed=seed)
+    results = runner.run(processes=1, callback=lambda spec, metrics: ran.append(spec))
+    return results, ran
+
+
+def test_running_stats_match_numpy():
+    values = np.random.default_rng(0).normal(3.0, 2.0, 101)
+    stats = RunningStats()
+    for value in values:
+        stats.add(float(value))
+    assert stats.n == 101
+    assert stats.mean == pytest.approx(values.mean())
+    assert stats.std == pytest.approx(values.std(ddof=1))
+
+    single = RunningStats()
+    single.add(5.0)
+    assert (single.mean, single.std) == (5.0, 0.0)
+
+
+def test_summary_aggregates_replicates_per_combination():
+    results = SweepResults([{'rate': 1}, {'rate': 2}])
+    for rep, value in enumerate([1.0, 2.0, 6.0]):
+        results.add(RunSpec(1, rep, {'rate': 2}, rep), {'value': value})
+    first, second = results.summary()
+    assert first == {'rate': 1}
+    assert second['value_n'] == 3 and second['value_mean'] == 3.0
+    assert second['value_std'] == pytest.approx(np.std([1.0, 2.0, 6.0], ddof=1))
+
+
+def test_resume_skips_matching_runs(tmp_path):
+    path = str(tmp_path / 'results.jsonl')
+    first, ran = run({'rate': [1, 2]}, path)
+    assert len(ran) == 4 and first.summary()[1]['value_mean'] == 6
+
+    again, ran = run({'rate': [1, 2]}, path)
+    assert ran == []
+    assert again.summary() == first.summary()
+
+    records = [json.loads(line) for line in open(path)]
+    assert len(records) == 4
+    assert all({'params_hash', 'seed'} <= set(record) for record in records)
+
+
+def test_resume_reruns_changed_settings(tmp_path):
+    path = str(tmp_path / 'results.jsonl')
+    run({'rate': [1, 2]}, path)
+
+    # rate 2 is now the first combination, and rate 3 is new
+    results, ran = run({'rate': [2, 3]}, path)
+    assert len(ran) == 4
+    assert [row['value_mean'] for row in results.summary()] == [6, 9]
+
+    _, ran = run({'rate': [2, 3]}, path, num_steps=4)
+    assert len(ran) == 4
+    _, ran = run({'rate': [2, 3]}, path, seed=1)
+    assert len(ran) == 4
+    _, ran = run({'rate': [2, 3]}, path, seed=1)
+    assert ran == []
+
+
+def test_resume_ignores_records_without_a_hash(tmp_path):
+    path = tmp_path / 'results.jsonl'
+    path.write_text(json.dumps({'run_id': '0-0', 'metrics': {'value': -1.0, 'noise': 0.0}}) + '\n')
+    results, ran = run({'rate': [1]}, str(path), replicates=1)
+    assert len(ran) == 1 and results.summary()[0]['value_mean'] == 3
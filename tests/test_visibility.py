@@ -0,0 +1,53 @@
+import dataclasses
+import random
+
+import numpy as np
+import pytest
+
+from mase.hexmap import HexMap, HexPos, Visibility
+from mase.location import LocationState
+
+
+@dataclasses.dataclass
+class WallState(LocationState):
+    opaque: bool = False
+
+
+def make_visibility(radius=12, seed=0, p=0.2):
+    rng = random.Random(seed)
+    hmap = HexMap(radius, WallState())
+    for pos in hmap.index.positions():
+        hmap.set_state(pos, 'opaque', rng.random() < p)
+    return hmap, Visibility(hmap)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_fov_agrees_with_los(seed):
+    hmap, vis = make_visibility(seed=seed)
+    positions = hmap.index.positions()
+    for center in [HexPos(0, 0, 0), HexPos(5, -9, 4), HexPos(-12, 6, 6)]:
+        for radius in [4, 12]:
+            expected = {pos for pos in positions if center.dist(pos) <= radius and vis.los(center, pos)}
+            assert vis.fov(center, radius) == expected
+        assert vis.los_many(center, positions).tolist() == [vis.los(center, pos) for pos in positions]
+
+
+def test_fov_cache_follows_opacity_changes():
+    hmap, vis = make_visibility(p=0.0)
+    center = HexPos(0, 0, 0)
+    near = vis.fov(center, 3)
+    assert len(near) == 37 and vis.fov(center, 3) is near
+
+    # a wall outside the radius keeps the entry, one inside drops it
+    vis.set_opaque(HexPos(5, -5, 0), True)
+    assert vis.fov(center, 3) is near
+    vis.set_opaque(HexPos(1, -1, 0), True)
+    assert HexPos(2, -2, 0) not in vis.fov(center, 3)
+    assert HexPos(1, -1, 0) in vis.fov(center, 3)
+    assert hmap.loc(HexPos(1, -1, 0)).state.opaque
+
+    # direct layer changes are picked up by refresh
+    hmap.set_layer('opaque', np.zeros(len(hmap.index), dtype=bool))
+    assert HexPos(2, -2, 0) not in vis.fov(center, 3)
+    vis.refresh()
+    assert vis.fov(center, 3) == near